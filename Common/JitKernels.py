@@ -0,0 +1,51 @@
+# 路径相关递推的 Numba 编译版本
+# SMA/EMA/Wilder (EXPMA, MACD, DMI 的 ADX) 和 KDJ 的 K/D 每根K线都依赖上一根的结果, 无法用 numpy 向量化
+# 没有安装 numba 时 HAS_NUMBA 为 False, MathFunctions 使用 numpy 版本, 两者结果完全一致
+# USE_NUMBA 可以在运行时关闭编译版本, 用于对比两种实现
+#
+# 输入都是 (行数, K线数) 的 C 连续矩阵, 每行独立递推
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+USE_NUMBA = HAS_NUMBA
+
+
+# Y = (X*M + Y'*(N-M)) / N, 没有 seed 时以每行第一个值为初值
+@njit(cache=True)
+def sma_rows(vals, n, m, seed, has_seed):
+    rows, count = vals.shape
+    ret = np.empty((rows, count))
+    for r in range(rows):
+        y = seed
+        for i in range(count):
+            if i == 0 and not has_seed:
+                y = vals[r, i]
+            else:
+                y = (vals[r, i] * m + y * (n - m)) / n
+            ret[r, i] = y
+    return ret
+
+
+# reset 为 True 的K线把结果重置为 seed, 之后从 seed 开始继续递推 (KDJ)
+@njit(cache=True)
+def sma_reset_rows(vals, reset, n, m, seed):
+    rows, count = vals.shape
+    ret = np.empty((rows, count))
+    for r in range(rows):
+        y = seed
+        for i in range(count):
+            if reset[r, i]:
+                y = seed
+            else:
+                y = (vals[r, i] * m + y * (n - m)) / n
+            ret[r, i] = y
+    return ret
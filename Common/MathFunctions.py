@@ -1,4 +1,7 @@
 from functools import reduce
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from Common import JitKernels
 
 # 简单算术移动平均
 def MA(vals):
@@ -40,3 +43,97 @@ def EMA(vals, n):
         ret = (x * 2 + ret * (n - 1)) / (n + 1)
     return ret
     '''
+
+
+# 每根K线之前N根K线组成的窗口 (不包含当前K线), 与 iloc[i - n:i] 一致
+# 返回 (len, n) 的矩阵, 前 n 行数据不足的部分用 nan 填充
+# 输入为 (股票数, K线数) 时沿最后一维计算, 返回 (股票数, K线数, n)
+def lag_windows(vals, n):
+    vals = np.asarray(vals, dtype=np.float64)
+    padded = np.concatenate([np.full(vals.shape[:-1] + (n,), np.nan), vals], axis=-1)
+    return sliding_window_view(padded, n, axis=-1)[..., :vals.shape[-1], :]
+
+
+# N根K线之前的值, 与 iloc[i - n] 一致, 开头不足N根的部分会从末尾绕回
+def shift(vals, n):
+    return np.roll(np.asarray(vals, dtype=np.float64), n, axis=-1)
+
+
+
+# 递归的同花顺/通达信 SMA, 一次处理整个序列, 每根K线 O(1)
+# Y = (X*M + Y'*(N-M)) / N
+# seed 为上一根K线的 Y, 用于接着之前的结果继续计算
+# 没有 seed 时以第一个值为初值, 与 SMA(vals, n, m) 的 reduce 结果一致
+# 输入为 (股票数, K线数) 时沿最后一维递推, 每根K线对所有股票做一次向量运算
+# 安装了 numba 时使用 JitKernels 中的编译版本
+def sma(vals, n, m, seed=None):
+    vals = np.asarray(vals, dtype=np.float64)
+    if JitKernels.USE_NUMBA and vals.size > 0:
+        rows = np.ascontiguousarray(vals.reshape(-1, vals.shape[-1]))
+        ret = JitKernels.sma_rows(rows, n, m, 0.0 if seed is None else float(seed), seed is not None)
+        return ret.reshape(vals.shape)
+
+    if vals.ndim > 1:
+        ret = np.empty(vals.shape)
+        y = seed
+        for i in range(vals.shape[-1]):
+            y = sma_step(vals[..., i], y, n, m)
+            ret[..., i] = y
+        return ret
+
+    vals = vals.tolist()
+    ret = []
+    y = seed
+    for x in vals:
+        y = sma_step(x, y, n, m)
+        ret.append(y)
+    return np.array(ret, dtype=np.float64)
+
+
+# sma 的单步版本, 流式计算时逐根K线调用, 结果与 sma 完全一致
+def sma_step(x, y, n, m):
+    if y is None:
+        return x
+    return (x * m + y * (n - m)) / n
+
+
+# reset 为 True 的K线结果重置为 seed, 之后从 seed 开始继续递推 (KDJ 的 K/D)
+def sma_reset(vals, reset, n, m, seed):
+    vals = np.asarray(vals, dtype=np.float64)
+    reset = np.asarray(reset, dtype=bool)
+    if JitKernels.USE_NUMBA and vals.size > 0:
+        rows = np.ascontiguousarray(vals.reshape(-1, vals.shape[-1]))
+        ret = JitKernels.sma_reset_rows(rows, np.ascontiguousarray(reset.reshape(rows.shape)), n, m, float(seed))
+        return ret.reshape(vals.shape)
+
+    ret = np.full(vals.shape, float(seed))
+    if vals.ndim > 1:
+        # 多只股票时按K线逐根递推, 每根K线对所有股票做一次向量运算
+        y = np.full(vals.shape[:-1], float(seed))
+        for i in range(vals.shape[-1]):
+            y = np.where(reset[..., i], float(seed), sma_step(vals[..., i], y, n, m))
+            ret[..., i] = y
+        return ret
+
+    # 单只股票时对两次重置之间的每一段调用 sma
+    valid = ~reset
+    starts = np.flatnonzero(valid & ~np.concatenate([[False], valid[:-1]]))
+    ends = np.flatnonzero(valid & ~np.concatenate([valid[1:], [False]])) + 1
+    for start, end in zip(starts, ends):
+        ret[start:end] = sma(vals[start:end], n, m, seed=seed)
+    return ret
+
+
+# 递归的 EMA(X, N) = SMA(X, N+1, 2)
+def ema(vals, n, seed=None):
+    return sma(vals, n + 1, 2, seed)
+
+
+# Wilder 平滑 (ADX/ATR 使用), 等价于 SMA(X, N, 1)
+def wilder(vals, n, seed=None):
+    return sma(vals, n, 1, seed)
+
+
+# 递归平滑的初值影响衰减到 tol 以内需要的K线数, 用于估计指标的 LOOKBACK
+def settle_bars(n, m, tol=1e-3):
+    return int(np.ceil(np.log(tol) / np.log((n - m) / n)))
@@ -0,0 +1,219 @@
+# 滑动窗口统计
+# 窗口为截止到当前K线 (包含当前K线) 的 N 根K线, 前 N-1 根数据不足, 返回 nan / -1
+# 指标只使用之前的 N 根K线时, 对结果再做 lag(x, 1)
+#
+# 最大/最小值使用 van Herk/Gil-Werman 算法:
+# 把序列按 N 分块, 块内分别求前缀极值和后缀极值,
+# 任意长度为 N 的窗口都可以由一个后缀极值和一个前缀极值拼出来,
+# 与单调队列一样每根K线 O(1), 但整个过程可以用 numpy 向量化完成
+#
+# 求和/均值/计数使用同样的分块方法: 块内分别做前缀和与后缀和 (cumsum),
+# 窗口和 = 左侧块的后缀和 + 右侧块的前缀和, 每根K线 O(1) 且与窗口长度无关;
+# 累加只在块内进行, 误差不会像整列 cumsum 相减那样随序列长度累积,
+# 相同的输入在相同位置上得到完全相同的结果 (例如判断两个均线是否相等)
+#
+# 预热: 窗口内K线数少于 min_periods (默认为 N) 时返回 nan,
+# min_periods=1 时不足 N 根K线的窗口按实际K线数计算
+#
+# 参数搜索时同一序列需要很多个窗口长度, rolling_sums / rolling_maxes 等一次计算一组窗口:
+# 求和以最长的窗口分块, 一次块内前缀和/后缀和就能拼出所有较短的窗口 (块内的窗口用前缀和相减, 误差仍以最长窗口为界);
+# 最大/最小值逐级倍增出长度为 2^k 的窗口极值, 任意窗口由两个重叠的 2^k 窗口拼出, 结果与 rolling_max 完全相同
+#
+# 所有函数都沿最后一维计算, 输入可以是单只股票的序列, 也可以是 (股票数, K线数) 的矩阵
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# 把序列后移 n 根K线, 开头用 fill 填充 (不会像 np.roll 一样从末尾绕回)
+def lag(vals, n=1, fill=np.nan):
+    vals = np.asarray(vals)
+    ret = np.empty(vals.shape, dtype=np.result_type(vals.dtype, np.asarray(fill).dtype))
+    ret[..., :n] = fill
+    ret[..., n:] = vals[..., :max(vals.shape[-1] - n, 0)]
+    return ret
+
+
+def _blocks(vals, n, pad_value):
+    # 前面补 n-1 个 pad_value 使每个窗口都落在两个相邻块内, 后面补齐整块
+    count = vals.shape[-1]
+    size = count + n - 1
+    size += (-size) % n
+    padded = np.full(vals.shape[:-1] + (size,), pad_value, dtype=np.float64)
+    padded[..., n - 1:n - 1 + count] = vals
+    return padded.reshape(vals.shape[:-1] + (-1, n))
+
+
+def _rolling_arg(vals, n):
+    # 返回窗口最大值和它第一次出现的位置
+    vals = np.asarray(vals, dtype=np.float64)
+    count = vals.shape[-1]
+    blocks = _blocks(vals, n, -np.inf)
+    index = np.arange(blocks.shape[-2] * n).reshape(-1, n) - (n - 1)
+    edge = np.full(blocks.shape[:-1] + (1,), -np.inf)
+
+    # 块内前缀最大值, 相等时保留靠前的位置
+    prefix = np.maximum.accumulate(blocks, axis=-1)
+    prefix_prev = np.concatenate([edge, prefix[..., :-1]], axis=-1)
+    prefix_arg = np.maximum.accumulate(np.where(blocks > prefix_prev, index, index[:, :1]), axis=-1)
+
+    # 块内后缀最大值, 从右往左扫描, 相等时同样保留靠前的位置
+    reverse = blocks[..., ::-1]
+    suffix = np.maximum.accumulate(reverse, axis=-1)
+    suffix_prev = np.concatenate([edge, suffix[..., :-1]], axis=-1)
+    suffix_arg = np.minimum.accumulate(np.where(reverse >= suffix_prev, index[:, ::-1], index[:, -1:]), axis=-1)
+    suffix, suffix_arg = suffix[..., ::-1], suffix_arg[..., ::-1]
+
+    flat = vals.shape[:-1] + (-1,)
+    prefix, prefix_arg = prefix.reshape(flat), prefix_arg.reshape(flat)
+    suffix, suffix_arg = suffix.reshape(flat), suffix_arg.reshape(flat)
+    left = np.arange(count)
+    right = left + n - 1
+    use_left = suffix[..., left] >= prefix[..., right]
+    value = np.where(use_left, suffix[..., left], prefix[..., right])
+    arg = np.where(use_left, suffix_arg[..., left], prefix_arg[..., right])
+
+    value[..., :n - 1] = np.nan
+    arg[..., :n - 1] = -1
+    # 窗口内有 nan 时结果为 nan
+    has_nan = np.isnan(vals)
+    if has_nan.any():
+        nan_count = np.cumsum(has_nan, axis=-1)
+        nan_count = nan_count - lag(nan_count, n, 0)
+        value[nan_count > 0] = np.nan
+        arg[nan_count > 0] = -1
+    return value, arg
+
+
+def rolling_max(vals, n):
+    return _rolling_arg(vals, n)[0]
+
+
+def rolling_min(vals, n):
+    return -_rolling_arg(-np.asarray(vals, dtype=np.float64), n)[0]
+
+
+# 窗口最大值第一次出现的位置 (序列中的绝对位置), 数据不足时为 -1
+def rolling_argmax(vals, n):
+    return _rolling_arg(vals, n)[1]
+
+
+def rolling_argmin(vals, n):
+    return _rolling_arg(-np.asarray(vals, dtype=np.float64), n)[1]
+
+
+def _block_sum(vals, n):
+    # vals 中不能有 nan, 前面补的 n-1 个 0 使不足 N 根K线的窗口只累加实际的K线
+    count = vals.shape[-1]
+    blocks = _blocks(vals, n, 0)
+    flat = vals.shape[:-1] + (-1,)
+    prefix = np.cumsum(blocks, axis=-1).reshape(flat)
+    suffix = np.cumsum(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(flat)
+    left = np.arange(count)
+    right = left + n - 1
+    # 窗口正好是一整块时只取后缀和
+    return suffix[..., left] + np.where(left % n == 0, 0, prefix[..., right])
+
+
+def _warm_up(ret, n, min_periods):
+    if min_periods is None:
+        min_periods = n
+    ret[..., :max(min_periods, 1) - 1] = np.nan
+    return ret
+
+
+def rolling_sum(vals, n, min_periods=None):
+    # 窗口内有 nan 时结果为 nan
+    vals = np.asarray(vals, dtype=np.float64)
+    has_nan = np.isnan(vals)
+    ret = _block_sum(np.where(has_nan, 0, vals), n)
+    if has_nan.any():
+        ret[_block_sum(has_nan.astype(np.float64), n) > 0] = np.nan
+    return _warm_up(ret, n, min_periods)
+
+
+def rolling_mean(vals, n, min_periods=None):
+    # 不足 N 根K线的窗口按实际K线数求平均
+    size = np.minimum(np.arange(1, np.shape(vals)[-1] + 1), n)
+    return rolling_sum(vals, n, min_periods) / size
+
+
+def _block_sums(vals, steps):
+    # 以最长窗口 size 分块, 每个窗口最多跨越两个相邻块
+    count = vals.shape[-1]
+    size = max(steps)
+    blocks = _blocks(vals, size, 0)
+    flat = vals.shape[:-1] + (-1,)
+    prefix = np.cumsum(blocks, axis=-1).reshape(flat)
+    suffix = np.cumsum(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(flat)
+    right = np.arange(count) + size - 1
+    ret = {}
+    for n in steps:
+        left = right - n + 1
+        # 窗口在一个块内时用块内前缀和相减, 跨越两块时用左块后缀和加右块前缀和
+        inner = prefix[..., right] - np.where(left % size == 0, 0, prefix[..., left - 1])
+        ret[n] = np.where(left // size == right // size, inner, suffix[..., left] + prefix[..., right])
+    return ret
+
+
+def rolling_sums(vals, steps, min_periods=None):
+    # 返回 {N: rolling_sum(vals, N)}, 所有窗口共用一次分块累加
+    vals = np.asarray(vals, dtype=np.float64)
+    has_nan = np.isnan(vals)
+    ret = _block_sums(np.where(has_nan, 0, vals), steps)
+    if has_nan.any():
+        nan_count = _block_sums(has_nan.astype(np.float64), steps)
+        for n in steps:
+            ret[n][nan_count[n] > 0] = np.nan
+    return {n: _warm_up(ret[n], n, min_periods) for n in steps}
+
+
+def rolling_means(vals, steps, min_periods=None):
+    bars = np.arange(1, np.shape(vals)[-1] + 1)
+    return {n: total / np.minimum(bars, n) for n, total in rolling_sums(vals, steps, min_periods).items()}
+
+
+def rolling_maxes(vals, steps):
+    # 返回 {N: rolling_max(vals, N)}
+    # levels[k] 为截止到每根K线的 2^k 根K线的最大值, 窗口 N 取 2^k <= N 的两个重叠窗口
+    vals = np.asarray(vals, dtype=np.float64)
+    levels = [vals]
+    while 2 ** len(levels) <= max(steps):
+        width = 2 ** (len(levels) - 1)
+        levels.append(np.maximum(levels[-1], lag(levels[-1], width, -np.inf)))
+    ret = {}
+    for n in steps:
+        k = n.bit_length() - 1
+        value = np.maximum(levels[k], lag(levels[k], n - 2 ** k, -np.inf))
+        value[..., :n - 1] = np.nan
+        ret[n] = value
+    return ret
+
+
+def rolling_mins(vals, steps):
+    return {n: -value for n, value in rolling_maxes(-np.asarray(vals, dtype=np.float64), steps).items()}
+
+
+# 窗口内满足条件的K线数, 例如 PSY 的上涨K线数
+def rolling_count_if(mask, n, min_periods=None):
+    mask = np.asarray(mask, dtype=bool)
+    return rolling_sum(mask.astype(np.float64), n, min_periods)
+
+
+# 窗口内满足条件的K线的 vals 之和, 例如 VR 中上涨K线的成交量之和
+# 不满足条件的K线不参与计算, 即使 vals 为 nan
+def rolling_sum_if(vals, mask, n, min_periods=None):
+    mask = np.asarray(mask, dtype=bool)
+    return rolling_sum(np.where(mask, np.asarray(vals, dtype=np.float64), 0), n, min_periods)
+
+
+# 窗口内的平均绝对偏差 AVEDEV = mean(|x - mean(x)|)
+def rolling_mad(vals, n):
+    vals = np.asarray(vals, dtype=np.float64)
+    ret = np.full(vals.shape, np.nan)
+    if vals.shape[-1] < n:
+        return ret
+    windows = sliding_window_view(vals, n, axis=-1)
+    mean = windows.mean(axis=-1)
+    ret[..., n - 1:] = np.abs(windows - mean[..., None]).mean(axis=-1)
+    return ret
@@ -43,14 +43,71 @@ class CacheManager:
             df = pd.read_sql_table(table_name=self._cache_table_name, con=config.DB_CONN, index_col='time')
         else:
             df = pd.read_csv(os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv'), index_col='time')
-            # convert back the datetime type of fields
-            df['date'] = pd.to_datetime(df['date'])
-            df.index = pd.to_datetime(df.index)
+            df = self._parse_dates(df)
         return df
 
-    def cache_data(self, data):
+    def iter_cached_data(self, chunksize):
+        # 按大约 chunksize 行分块读取缓存, 每块在日期边界处截断, 同一天的K线不会分在两块里
+        # 缓存很大时代替 load_cached_data, 内存只与块的大小有关
         if self._backend == 'mysql':
-            data.to_sql(name=self._cache_table_name, con=config.DB_CONN, if_exists="replace", index=True)
+            chunks = pd.read_sql_table(table_name=self._cache_table_name, con=config.DB_CONN, index_col='time',
+                                       chunksize=chunksize)
         else:
-            data.to_csv(path_or_buf=os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv'), index=True)
+            chunks = (self._parse_dates(chunk) for chunk in
+                      pd.read_csv(os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv'), index_col='time',
+                                  chunksize=chunksize))
+        rest = None
+        for chunk in chunks:
+            if rest is not None:
+                chunk = pd.concat([rest, chunk])
+            # 最后一天可能还没有读完, 留到下一块
+            dates = chunk['date'].values
+            last = dates == dates[-1]
+            rest = chunk[last]
+            if not last.all():
+                yield chunk[~last]
+        if rest is not None and len(rest) > 0:
+            yield rest
+
+    @staticmethod
+    def _parse_dates(df):
+        # convert back the datetime type of fields
+        df['date'] = pd.to_datetime(df['date'])
+        df.index = pd.to_datetime(df.index)
+        return df
+
+    def cache_data(self, data, append=False):
+        # append 时接在已有的缓存后面, 按块生成数据时逐块写入
+        if self._backend == 'mysql':
+            data.to_sql(name=self._cache_table_name, con=config.DB_CONN, if_exists="append" if append else "replace",
+                        index=True)
+        else:
+            path = os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv')
+            if append and os.path.isfile(path):
+                data.to_csv(path_or_buf=path, index=True, mode='a', header=False)
+            else:
+                data.to_csv(path_or_buf=path, index=True)
         return data
+
+    def rename(self, cache_table_name):
+        # 把缓存改名为 cache_table_name, 替换同名的缓存; 先写临时缓存, 全部写完后再改名, 中途退出时不会留下不完整的缓存
+        if self._backend == 'mysql':
+            self._s.execute("DROP TABLE IF EXISTS `{0}`;".format(cache_table_name))
+            self._s.execute("RENAME TABLE `{0}` TO `{1}`;".format(self._cache_table_name, cache_table_name))
+            self._s.commit()
+        else:
+            os.replace(os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv'),
+                       os.path.join(config.CACHE_DIR, cache_table_name + '.csv'))
+        self._cache_table_name = cache_table_name
+        return
+
+    def clear_cache(self):
+        # 删除缓存, 下次重新查询
+        if self._backend == 'mysql':
+            self._s.execute("DROP TABLE IF EXISTS `{0}`;".format(self._cache_table_name))
+            self._s.commit()
+        else:
+            path = os.path.join(config.CACHE_DIR, self._cache_table_name + '.csv')
+            if os.path.isfile(path):
+                os.remove(path)
+        return
@@ -0,0 +1,150 @@
+# 指标级别的列缓存
+# 按股票和月份分区保存每个指标模块输出的列, 文件名包含指标名和 Registry.key (参数哈希 + 实现版本 + 依赖指标的 key)
+#   CacheRoot/indicators/<code>/<YYYY-MM>/<指标>-<key>.npz
+# 修改某个指标的参数或实现后, 只有它 (以及依赖它的指标) 的 key 改变, 其他指标的列直接从缓存读取
+#
+# 文件内容为 time (datetime64[ns] 的整数值) 和每个输出列, 按 time 升序
+#
+# 多个进程可能同时合并同一个分区 (同一只股票的相邻日期区间), 读取-合并-替换期间持有分区的文件锁 (<文件名>.lock),
+# 并且在锁内重新读取文件, 不使用本进程缓存的旧内容, 否则后写入的进程会覆盖掉先写入的行
+# 没有 fcntl 的平台 (Windows) 上不加锁, 丢失的行只会在下次计算时缓存不命中
+
+import os
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def _locked(path):
+    # 分区文件的排他锁, 进程退出时由系统释放
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write(path, partition):
+    # 先写临时文件再替换, 避免并行任务读到写了一半的文件
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **partition)
+    os.replace(temp_path, path)
+
+
+class IndicatorCache:
+
+    def __init__(self, code, root=None):
+        self.code = code
+        if root is None:
+            import Common.config as config
+            root = os.path.join(config.CACHE_DIR, 'indicators')
+        self.root = root
+        self._partitions = {}
+
+    @staticmethod
+    def _name(indicator):
+        return indicator.__name__.split('.')[-1]
+
+    def _path(self, indicator, key, month):
+        return os.path.join(self.root, self.code, month, '{}-{}.npz'.format(self._name(indicator), key))
+
+    @staticmethod
+    def _stamps(times):
+        # 统一为纳秒, DatetimeIndex.asi8 的单位随索引的精度变化 (pandas 2 起可能是微秒)
+        return pd.DatetimeIndex(times).values.astype('datetime64[ns]').astype(np.int64)
+
+    @staticmethod
+    def _months(times):
+        # 每根K线所在的月份分区 YYYY-MM
+        return np.asarray(pd.DatetimeIndex(times).strftime('%Y-%m'))
+
+    def _read(self, path):
+        if path not in self._partitions:
+            if os.path.isfile(path):
+                with np.load(path) as data:
+                    self._partitions[path] = {name: data[name] for name in data.files}
+            else:
+                self._partitions[path] = None
+        return self._partitions[path]
+
+    def load(self, indicator, key, times):
+        # 返回 {列名: 与 times 对齐的数组}, 任何一根K线没有缓存时返回 None
+        times = pd.DatetimeIndex(times)
+        stamps = self._stamps(times)
+        months = self._months(times)
+        result = {name: np.empty(len(times)) for name in indicator.OUTPUTS}
+        for month in np.unique(months):
+            partition = self._read(self._path(indicator, key, month))
+            if partition is None:
+                return None
+            rows = np.flatnonzero(months == month)
+            pos = np.searchsorted(partition['time'], stamps[rows])
+            pos = np.minimum(pos, len(partition['time']) - 1)
+            if not np.array_equal(partition['time'][pos], stamps[rows]):
+                return None
+            for name in indicator.OUTPUTS:
+                result[name][rows] = partition[name][pos]
+        return result
+
+    def save(self, indicator, key, times, columns):
+        # 把 times 上的列合并进月份分区, 相同时间的旧值被覆盖
+        times = pd.DatetimeIndex(times)
+        stamps = self._stamps(times)
+        months = self._months(times)
+        for month in np.unique(months):
+            path = self._path(indicator, key, month)
+            rows = np.flatnonzero(months == month)
+            partition = {'time': stamps[rows]}
+            partition.update({name: np.asarray(columns[name], dtype=np.float64)[rows] for name in indicator.OUTPUTS})
+
+            with _locked(path):
+                # 其他进程可能在本进程读取之后写过这个分区
+                self._partitions.pop(path, None)
+                existing = self._read(path)
+                if existing is not None:
+                    keep = ~np.isin(existing['time'], partition['time'])
+                    partition = {name: np.concatenate([existing[name][keep], values])
+                                 for name, values in partition.items()}
+                order = np.argsort(partition['time'], kind='stable')
+                partition = {name: values[order] for name, values in partition.items()}
+                _write(path, partition)
+            self._partitions[path] = partition
+
+    def evict(self, dates):
+        # 删除 dates 这些天所有指标的缓存行, 原始K线修改后下次计算时重新生成
+        days = pd.DatetimeIndex(sorted(set(dates))).values.astype('datetime64[D]')
+        for month in np.unique(np.asarray(pd.DatetimeIndex(days).strftime('%Y-%m'))):
+            directory = os.path.join(self.root, self.code, month)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith('.npz'):
+                    continue
+                path = os.path.join(directory, name)
+                with _locked(path):
+                    self._partitions.pop(path, None)
+                    partition = self._read(path)
+                    if partition is None:
+                        continue
+                    keep = ~np.isin(partition['time'].astype('datetime64[ns]').astype('datetime64[D]'), days)
+                    if keep.all():
+                        continue
+                    if not keep.any():
+                        os.remove(path)
+                        self._partitions[path] = None
+                        continue
+                    partition = {column: values[keep] for column, values in partition.items()}
+                    _write(path, partition)
+                self._partitions[path] = partition
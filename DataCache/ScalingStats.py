@@ -0,0 +1,142 @@
+# 特征缩放的样本统计值
+# 每个 (股票, 日期) 的缩放样本为 [date - offset - bias, date - bias) 之间的5分钟K线 (Transform5M 为 30 + 7 天),
+# 相邻两天的样本几乎完全相同, 每个任务单独做 MIN/AVG/MAX 聚合会反复扫描同样的 30 天K线
+#
+# 这里先把K线按天聚合 (条数, 最小/合计/最大), 再对每个日期的样本窗口做区间聚合, 一次求出一只股票所有日期的统计值:
+#   合计用前缀和相减, 最小/最大值用 reduceat 在 [窗口起点, 窗口终点) 上计算
+# 结果保存在 scaling_stats_stock_5min 表 (code, date, STATS), 转换时直接查表 (lookup),
+# 每晚为新的交易日调用一次 update 即可, 不需要重新计算已有的日期
+#
+# monthly=True 时同一个月的日期都使用当月第一天的样本, 缩放参数按月变化 (todo.md 里按月提取缩放参数的想法)
+
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from DataTransform.FeatureScaling import STATS
+
+TABLE_NAME_5MIN = "raw_stock_trading_5min"
+TABLE_NAME_SCALING_STATS = "scaling_stats_stock_5min"
+TABLE_KEYS = ['code', 'date']
+AGGREGATES = ['bars', 'vol_min', 'vol_sum', 'vol_max', 'price_min', 'price_sum', 'price_max',
+              'count_min', 'count_max']
+
+
+def daily_aggregates(df):
+    # df 为一只股票的5分钟K线 (date, vol, close, count 列), 返回按日期升序的每日聚合
+    grouped = df.groupby('date')
+    return pd.DataFrame({
+        'bars': grouped.size(),
+        'vol_min': grouped['vol'].min(), 'vol_sum': grouped['vol'].sum(), 'vol_max': grouped['vol'].max(),
+        'price_min': grouped['close'].min(), 'price_sum': grouped['close'].sum(),
+        'price_max': grouped['close'].max(),
+        'count_min': grouped['count'].min(), 'count_max': grouped['count'].max(),
+    }).sort_index()
+
+
+def query_daily_aggregates(db, start_date, end_date, codes=None):
+    # 在数据库里按 (股票, 日期) 聚合 [start_date, end_date] 的5分钟K线, 返回 code, date, AGGREGATES 列
+    code_query = "" if codes is None else "AND `code` IN ({}) ".format(
+        ", ".join("'{}'".format(code) for code in codes))
+    rs = db.execute(
+        "SELECT `code`, DATE(`time`) as `date`, COUNT(*), "
+        "MIN(vol), SUM(vol), MAX(vol), MIN(close), SUM(close), MAX(close), MIN(count), MAX(count) "
+        "FROM {0} "
+        "WHERE `time`>='{1}' AND `time`<'{2}' {3}"
+        "GROUP BY `code`, DATE(`time`) "
+        "ORDER BY `code`, `date`".format(
+            TABLE_NAME_5MIN, start_date, end_date + timedelta(days=1), code_query))
+    df = pd.DataFrame(rs.fetchall(), columns=['code', 'date'] + AGGREGATES)
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    return df
+
+
+def _window_reduce(ufunc, values, lo, hi):
+    # 每个 [lo, hi) 区间的归约, 空区间为 nan
+    values = np.r_[np.asarray(values, dtype=np.float64), np.nan]
+    index = np.empty(2 * len(lo), dtype=np.int64)
+    index[0::2], index[1::2] = lo, hi
+    result = ufunc.reduceat(values, index)[0::2] if len(lo) > 0 else np.empty(0)
+    result[lo >= hi] = np.nan
+    return result
+
+
+def rolling_stats(daily, dates, offset=30, bias=7, monthly=False):
+    # daily 为 daily_aggregates 的结果, 返回 index 为 dates, 列为 STATS 的统计值, 没有样本的日期为 nan
+    days = pd.DatetimeIndex(daily.index).values.astype('datetime64[D]')
+    anchors = pd.DatetimeIndex(list(dates)).values.astype('datetime64[D]')
+    if monthly:
+        anchors = anchors.astype('datetime64[M]').astype('datetime64[D]')
+    start = anchors - np.timedelta64(offset + bias, 'D')
+    lo = np.searchsorted(days, start, side='left')
+    hi = np.searchsorted(days, start + np.timedelta64(offset, 'D'), side='left')
+
+    def window_sum(name):
+        prefix = np.r_[0, np.cumsum(daily[name].values.astype(np.float64))]
+        return prefix[hi] - prefix[lo]
+
+    bars = window_sum('bars')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = pd.DataFrame({
+            'vol_min': _window_reduce(np.minimum, daily['vol_min'].values, lo, hi),
+            'vol_avg': window_sum('vol_sum') / bars,
+            'vol_max': _window_reduce(np.maximum, daily['vol_max'].values, lo, hi),
+            'price_min': _window_reduce(np.minimum, daily['price_min'].values, lo, hi),
+            'price_avg': window_sum('price_sum') / bars,
+            'price_max': _window_reduce(np.maximum, daily['price_max'].values, lo, hi),
+            'count_min': _window_reduce(np.minimum, daily['count_min'].values, lo, hi),
+            'count_max': _window_reduce(np.maximum, daily['count_max'].values, lo, hi),
+        }, index=pd.Index(list(dates), name='date'))
+    return stats[STATS]
+
+
+def build(db, calendar, writer, start_date, end_date, codes=None, offset=30, bias=7, monthly=False):
+    # 计算 [start_date, end_date] 内每只股票每个交易日的统计值, 交给 writer (BulkWriter) 写入表, 已有的记录被覆盖
+    # calendar 为 TradingCalendar, codes 为空时处理日历里的所有股票, 调用方负责 writer.flush()
+    first_date = start_date.replace(day=1) if monthly else start_date
+    aggregates = query_daily_aggregates(db, first_date - timedelta(days=offset + bias),
+                                        end_date - timedelta(days=bias), codes)
+    grouped = dict(list(aggregates.groupby('code')))
+    for code in (calendar.codes if codes is None else codes):
+        dates = calendar.dates(code, start_date, end_date)
+        if len(dates) == 0 or code not in grouped:
+            continue
+        stats = rolling_stats(grouped[code].set_index('date'), dates, offset, bias, monthly).dropna().reset_index()
+        stats.insert(0, 'code', code)
+        writer.write(TABLE_NAME_SCALING_STATS, stats, TABLE_KEYS)
+    return
+
+
+def update(db, calendar, writer, date):
+    # 每晚收盘后为新的交易日计算统计值
+    return build(db, calendar, writer, date, date)
+
+
+_has_table = False
+
+
+def has_table(con=None):
+    # 统计表还没有建立时转换任务退回到逐个聚合查询
+    global _has_table
+    if not _has_table:
+        import Common.config as config
+        con = con if con is not None else config.DB_CONN
+        with con.connect() as conn:
+            _has_table = con.dialect.has_table(conn, TABLE_NAME_SCALING_STATS)
+    return _has_table
+
+
+def lookup(db, code, date):
+    # 查表取得 (code, date) 的统计值 {STATS: 值}, 没有记录时返回 None
+    rs = db.execute(
+        "SELECT {0} FROM {1} WHERE `code`='{2}' AND `date`='{3}'".format(
+            ", ".join("`{}`".format(name) for name in STATS), TABLE_NAME_SCALING_STATS, code, date))
+    row = rs.fetchone()
+    return None if row is None else dict(zip(STATS, row))
+
+
+def lookup_date(db, date):
+    # 查表取得 date 这一天所有股票的统计值, 返回以 code 为索引, STATS 为列的 DataFrame
+    rs = db.execute(
+        "SELECT `code`, {0} FROM {1} WHERE `date`='{2}'".format(
+            ", ".join("`{}`".format(name) for name in STATS), TABLE_NAME_SCALING_STATS, date))
+    return pd.DataFrame(rs.fetchall(), columns=['code'] + STATS).set_index('code')
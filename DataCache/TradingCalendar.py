@@ -0,0 +1,142 @@
+# 交易日历
+# 从 raw_stock_trading_daily 一次读出 (code, date), 在内存里保存每只股票的交易日数组和全市场的交易日,
+# 前一个/后一个交易日, 前后 N 个交易日和 "相隔超过 7 天" 的判断都用二分查找完成, 不再每只股票每天查询数据库
+#
+# 所有股票的交易日按 code 排序后连续存放在一个 datetime64[D] 数组里, codes / starts 记录每只股票的起止位置,
+# 对象可以直接 pickle, 通过进程池的 initializer 调用 install() 传给每个 worker, 之后用 installed() 取得
+#
+# code 为 None 时使用全市场的交易日 (任何一只股票有数据的日期)
+# 只加载一段时间的日历时, 只有答案落在这段时间内的查询是准确的, 超出范围时返回 None
+
+import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+TABLE_NAME_DAILY = "raw_stock_trading_daily"
+MAX_GAP_DAYS = 7  # 两个交易日相隔超过一周就认为数据不连续 (最长的假期也就是黄金周)
+MARGIN_DAYS = 30  # 按区间加载时前后多读的自然日数, 够查询指标需要的历史交易日和下一个交易日
+
+
+def _day(date):
+    return np.datetime64(date, 'D')
+
+
+def _date(day):
+    return day.astype(object)
+
+
+class TradingCalendar:
+
+    def __init__(self, df):
+        # df 为 code, date 两列, 每只股票每个交易日一行
+        df = pd.DataFrame({'code': np.asarray(df['code'], dtype=str),
+                           'date': pd.to_datetime(pd.Series(df['date'])).values.astype('datetime64[D]')})
+        df = df.drop_duplicates().sort_values(['code', 'date'])
+        codes = df['code'].values
+        self.codes, starts = np.unique(codes, return_index=True)
+        self._starts = np.r_[starts, len(codes)]
+        self._dates = df['date'].values.astype('datetime64[D]')
+        self.exchange_days = np.unique(self._dates)
+
+    @classmethod
+    def load(cls, db=None, start_date=None, end_date=None, codes=None):
+        # 加载 [start_date - MARGIN_DAYS, end_date + MARGIN_DAYS] 的交易日, 不给日期时加载整张表
+        conditions = []
+        if start_date is not None:
+            conditions.append("`date`>='{}'".format(start_date - datetime.timedelta(days=MARGIN_DAYS)))
+        if end_date is not None:
+            conditions.append("`date`<='{}'".format(end_date + datetime.timedelta(days=MARGIN_DAYS)))
+        if codes is not None:
+            conditions.append("`code` IN ({})".format(", ".join("'{}'".format(code) for code in codes)))
+        sql = "SELECT `code`, `date` FROM {0} {1} ORDER BY `code`, `date`".format(
+            TABLE_NAME_DAILY, "WHERE " + " AND ".join(conditions) if len(conditions) > 0 else "")
+
+        own_session = db is None
+        if own_session:
+            # 用 DataFrame 构造日历时不需要数据库配置
+            import Common.config as config
+            session = sessionmaker()
+            session.configure(bind=config.DB_CONN)
+            db = session()
+        rs = db.execute(sql)
+        df = pd.DataFrame(rs.fetchall(), columns=['code', 'date'])
+        if own_session:
+            db.close()
+        return cls(df)
+
+    def days(self, code=None):
+        # 股票的交易日数组 (datetime64[D], 升序), 没有记录的股票返回空数组
+        if code is None:
+            return self.exchange_days
+        i = np.searchsorted(self.codes, code)
+        if i == len(self.codes) or self.codes[i] != code:
+            return self._dates[:0]
+        return self._dates[self._starts[i]:self._starts[i + 1]]
+
+    def dates(self, code=None, start_date=None, end_date=None):
+        # [start_date, end_date] 内的交易日列表
+        days = self.days(code)
+        lo = 0 if start_date is None else np.searchsorted(days, _day(start_date), side='left')
+        hi = len(days) if end_date is None else np.searchsorted(days, _day(end_date), side='right')
+        return [_date(day) for day in days[lo:hi]]
+
+    def window(self, code, start_date, end_date, before=0, after=0):
+        # [start_date, end_date] 内的交易日, 再加上之前的 before 个和之后的 after 个交易日
+        days = self.days(code)
+        lo = np.searchsorted(days, _day(start_date), side='left')
+        hi = np.searchsorted(days, _day(end_date), side='right')
+        return [_date(day) for day in days[max(lo - before, 0):hi + after]]
+
+    def is_trading_date(self, code, date):
+        days = self.days(code)
+        i = np.searchsorted(days, _day(date))
+        return i < len(days) and days[i] == _day(date)
+
+    def on_or_after(self, code, date):
+        # date 当天或之后的第一个交易日
+        days = self.days(code)
+        i = np.searchsorted(days, _day(date), side='left')
+        return _date(days[i]) if i < len(days) else None
+
+    def shift(self, code, date, n):
+        # n > 0 为 date 之后的第 n 个交易日, n < 0 为 date 之前的第 -n 个交易日, n == 0 时 date 必须是交易日
+        days = self.days(code)
+        if n > 0:
+            i = np.searchsorted(days, _day(date), side='right') + n - 1
+        elif n < 0:
+            i = np.searchsorted(days, _day(date), side='left') + n
+        else:
+            return date if self.is_trading_date(code, date) else None
+        return _date(days[i]) if 0 <= i < len(days) else None
+
+    def next(self, code, date, n=1):
+        return self.shift(code, date, n)
+
+    def previous(self, code, date, n=1):
+        return self.shift(code, date, -n)
+
+    @staticmethod
+    def continuous(earlier, later, max_days=MAX_GAP_DAYS):
+        # 两个交易日相隔不超过 max_days 天
+        return earlier is not None and later is not None and (later - earlier).days <= max_days
+
+    def suspensions(self, code):
+        # 停牌区间 [(停牌前最后一个交易日, 复牌后第一个交易日)], 期间全市场有交易而这只股票没有
+        days = self.days(code)
+        positions = np.searchsorted(self.exchange_days, days)
+        gaps = np.flatnonzero(np.diff(positions) > 1)
+        return [(_date(days[i]), _date(days[i + 1])) for i in gaps]
+
+
+_installed = None
+
+
+def install(calendar):
+    # 进程池 initializer: mp.Pool(initializer=install, initargs=(calendar,))
+    global _installed
+    _installed = calendar
+
+
+def installed():
+    return _installed
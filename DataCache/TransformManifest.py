@@ -0,0 +1,158 @@
+# 转换任务的完成清单
+# 记录每个 (股票, 日期, 阶段) 是否已经完成, 或者失败及失败原因, 重启转换时只安排还没有完成的工作,
+# 不再每只股票每天对三张输出表各做一次 SELECT COUNT(*)
+#
+# 每只股票一个文件 CacheRoot/manifest/<name>/<code>.npz:
+#   done     每个阶段一行的位图 (np.packbits), 第 i 位为 EPOCH 之后第 i 个自然日
+#            按自然日而不是按日历里的位置编号, 加载不同区间的交易日历时位置不会变
+#   failed_* 失败的 (日期, 阶段, 原因), 数据缺失等 "损坏" 的日期不会每晚重试
+# 清单只在主进程里读写, worker 通过 TaskStatus 返回每天的结果
+
+import os
+import numpy as np
+
+STAGES = ['features', 'scaled', 'results']  # 对应 extracted / scaled / result 三张输出表
+EPOCH = np.datetime64('1990-01-01', 'D')
+
+
+def _day_index(dates):
+    return (np.asarray(dates, dtype='datetime64[D]') - EPOCH).astype(np.int64)
+
+
+class _Entry:
+    # 一只股票的清单: done 为 (阶段数, 天数) 的 bool 数组, failures 为 {(天, 阶段): 原因}
+
+    def __init__(self, done=None, failures=None):
+        self.done = done if done is not None else np.zeros((len(STAGES), 0), dtype=bool)
+        self.failures = failures if failures is not None else {}
+
+    def grow(self, days):
+        # 位图扩展到能放下 days 里最大的一天
+        size = int(np.max(days)) + 1 if len(days) > 0 else 0
+        if size > self.done.shape[1]:
+            done = np.zeros((len(STAGES), size + 365), dtype=bool)
+            done[:, :self.done.shape[1]] = self.done
+            self.done = done
+
+    def is_done(self, days, stage):
+        days = np.asarray(days)
+        result = np.zeros(len(days), dtype=bool)
+        inside = days < self.done.shape[1]
+        result[inside] = self.done[stage, days[inside]]
+        return result
+
+    def is_failed(self, days, stages=None):
+        failed = set(day for day, stage in self.failures if stages is None or stage in stages)
+        return np.array([day in failed for day in days], dtype=bool)
+
+
+class TransformManifest:
+
+    def __init__(self, name='transform_5min', root=None):
+        if root is None:
+            import Common.config as config
+            root = os.path.join(config.CACHE_DIR, 'manifest')
+        self.root = os.path.join(root, name)
+        self._entries = {}
+
+    def _path(self, code):
+        return os.path.join(self.root, '{}.npz'.format(code))
+
+    def _entry(self, code):
+        if code not in self._entries:
+            self._entries[code] = self._read(code)
+        return self._entries[code]
+
+    def _read(self, code):
+        path = self._path(code)
+        if not os.path.isfile(path):
+            return _Entry()
+        with np.load(path) as data:
+            done = np.unpackbits(data['done'], axis=1, count=int(data['days'])).astype(bool)
+            failures = {(int(day), int(stage)): str(reason) for day, stage, reason in
+                        zip(data['failed_days'], data['failed_stages'], data['failed_reasons'])}
+        return _Entry(done, failures)
+
+    def load(self, codes):
+        # 启动时一次读入这些股票的清单
+        for code in codes:
+            self._entry(code)
+        return self
+
+    def save(self, code=None):
+        # 先写临时文件再替换, 中途退出时不会留下写了一半的清单
+        os.makedirs(self.root, exist_ok=True)
+        for code in ([code] if code is not None else list(self._entries)):
+            entry = self._entries[code]
+            keys = sorted(entry.failures)
+            path = self._path(code)
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'wb') as f:
+                np.savez_compressed(f, days=entry.done.shape[1], done=np.packbits(entry.done, axis=1),
+                                    failed_days=np.array([day for day, _ in keys], dtype=np.int64),
+                                    failed_stages=np.array([stage for _, stage in keys], dtype=np.int8),
+                                    failed_reasons=np.array([entry.failures[key] for key in keys], dtype=str))
+            os.replace(temp_path, path)
+
+    def mark_done(self, code, dates, stage):
+        # 完成的同时清除以前的失败记录
+        entry = self._entry(code)
+        days = _day_index(dates)
+        entry.grow(days)
+        stage = STAGES.index(stage)
+        entry.done[stage, days] = True
+        for day in days:
+            entry.failures.pop((int(day), stage), None)
+
+    def mark_failed(self, code, date, stage, reason):
+        entry = self._entry(code)
+        day = int(_day_index([date])[0])
+        stage = STAGES.index(stage)
+        if day < entry.done.shape[1]:
+            entry.done[stage, day] = False
+        entry.failures[(day, stage)] = reason
+
+    def clear(self, code, dates, stages=STAGES):
+        # 去掉这些日期的完成和失败记录, 下次转换时重新处理
+        entry = self._entry(code)
+        days = _day_index(dates)
+        for stage in [STAGES.index(stage) for stage in stages]:
+            entry.done[stage, days[days < entry.done.shape[1]]] = False
+            for day in days:
+                entry.failures.pop((int(day), stage), None)
+
+    def is_done(self, code, date, stage=None):
+        # stage 为空时要求所有阶段都已完成
+        entry = self._entry(code)
+        days = _day_index([date])
+        stages = range(len(STAGES)) if stage is None else [STAGES.index(stage)]
+        return all(entry.is_done(days, stage)[0] for stage in stages)
+
+    def failure(self, code, date, stage):
+        # 失败原因, 没有失败记录时返回 None
+        return self._entry(code).failures.get((int(_day_index([date])[0]), STAGES.index(stage)))
+
+    def failures(self, code):
+        # [(日期, 阶段, 原因)]
+        return [((EPOCH + np.timedelta64(day, 'D')).astype(object), STAGES[stage], reason)
+                for (day, stage), reason in sorted(self._entry(code).failures.items())]
+
+    def pending(self, code, dates, retry_failed=False):
+        # dates 里还有阶段没有完成的日期, 失败过的日期除非 retry_failed 否则不再安排
+        dates = list(dates)
+        entry = self._entry(code)
+        days = _day_index(dates)
+        done = np.ones(len(days), dtype=bool)
+        for stage in range(len(STAGES)):
+            done &= entry.is_done(days, stage)
+        if not retry_failed:
+            done |= entry.is_failed(days)
+        return [date for date, skip in zip(dates, done) if not skip]
+
+    def record(self, code, outcomes):
+        # outcomes 为 worker 返回的 [(日期, 完成的阶段数, 失败原因)], 失败原因记在第一个没有完成的阶段上
+        for date, completed, reason in outcomes:
+            for stage in STAGES[:completed]:
+                self.mark_done(code, [date], stage)
+            if completed < len(STAGES) and reason is not None:
+                self.mark_failed(code, date, STAGES[completed], reason)
@@ -3,7 +3,8 @@ import pandas as pd
 import Common.config as config
 
 
-def load_data_to_db():
+def load_data_to_db(one_minute_only=False):
+    # one_minute_only 时只导入1分钟数据, 其他周期由 DataTransform.Resampler 按需合成
     path = os.path.join(config.MINUTE_DATA_PATH)
     print("Unzip files")
     for cur, _dirs, files in os.walk(path):
@@ -22,7 +23,7 @@ def load_data_to_db():
             print(file_path)
             if file_path.endswith('csv'):
                 print(("Loading data file {0}".format(file_path)))
-                _load_data_files(file_path)
+                _load_data_files(file_path, one_minute_only)
 
 
 def _unzip_file(cur, file):
@@ -32,10 +33,12 @@ def _unzip_file(cur, file):
     os.remove(file)
 
 
-def _load_data_files(file_path):
+def _load_data_files(file_path, one_minute_only=False):
     table_name = None
     if file_path.endswith('1min.csv'):
         table_name = "raw_stock_trading_1min"
+    elif one_minute_only:
+        pass
     elif file_path.endswith(' 5min.csv'):
         table_name = "raw_stock_trading_5min"
     elif file_path.endswith('15min.csv'):
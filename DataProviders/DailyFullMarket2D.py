@@ -1,7 +1,8 @@
 from datetime import datetime, timedelta, time
 from sqlalchemy.orm import sessionmaker
-import os, sys, random
+import os, sys, random, re
 import Common.config as config
+from DataCache.TradingCalendar import TradingCalendar, installed
 import numpy as np
 import pandas as pd
 import h5py
@@ -11,6 +12,21 @@ TABLE_NAME_DAILY = "raw_stock_trading_daily"
 TABLE_NAME_5MIN_SCALED = "feature_scaled_stock_trading_5min"
 TABLE_NAME_5MIN_RESULT = "result_stock_trading_5min"
 TABLE_NAME_5MIN_EXTRACTED = "feature_extracted_stock_trading_5min"
+# 缓存文件名以 start_date-end_date.h5 或 start_date-end_date-result.csv 结尾
+CACHE_FILE_PATTERN = re.compile(r'^' + NAME + r'-.*?(\d{4}-\d{2}-\d{2})-(\d{4}-\d{2}-\d{2})(\.h5|-result\.csv)$')
+
+
+def cached_ranges(cache_dir=None):
+    # 已有的缓存文件 [(路径, start_date, end_date)], 文件里包含 start_date 之前一个交易日到 end_date 的数据
+    cache_dir = cache_dir if cache_dir is not None else config.CACHE_DIR
+    ranges = []
+    for name in (os.listdir(cache_dir) if os.path.isdir(cache_dir) else []):
+        match = CACHE_FILE_PATTERN.match(name)
+        if match is not None:
+            ranges.append((os.path.join(cache_dir, name),
+                           datetime.strptime(match.group(1), "%Y-%m-%d").date(),
+                           datetime.strptime(match.group(2), "%Y-%m-%d").date()))
+    return ranges
 
 
 class DailyFullMarket2D:
@@ -34,30 +50,16 @@ class DailyFullMarket2D:
         if self._shifted_date is not None:
             return self._shifted_date
 
-        sql = "SELECT `date` " \
-              "FROM {0} " \
-              "WHERE `date`>='{1}' " \
-              "ORDER BY `date` ASC " \
-              "LIMIT 0,1".format(
-            TABLE_NAME_DAILY, self.start_date
-        )
-        rs = self.db.execute(sql)
-        data = rs.fetchone()
-        if data is None:
-            raise RuntimeError('No more trading date at or after {1}'.format(self.start_date))
-            return None
-
-        rs = self.db.execute(
-            "SELECT `date` "
-            "FROM {0} "
-            "WHERE `date`<'{1}' "
-            "ORDER BY `date` DESC "
-            "LIMIT 0,1".format(
-                TABLE_NAME_DAILY, self.start_date
-            )
-        )
-        data = rs.fetchone()
-        shifted_date = data[0]
+        # 全市场交易日, 进程池里使用 install 的日历
+        calendar = installed()
+        if calendar is None:
+            calendar = TradingCalendar.load(self.db, self.start_date, self.end_date)
+        if calendar.on_or_after(None, self.start_date) is None:
+            raise RuntimeError('No more trading date at or after {0}'.format(self.start_date))
+
+        shifted_date = calendar.previous(None, self.start_date)
+        if shifted_date is None:
+            raise RuntimeError('No trading date before {0}'.format(self.start_date))
         self._shifted_date = shifted_date
 
         return shifted_date
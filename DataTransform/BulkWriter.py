@@ -0,0 +1,99 @@
+# 批量写入 feature_extracted / feature_scaled / result 表
+# 每个 (股票, 日期) 单独 to_sql 一次就是一次数据库往返和一次事务, BulkWriter 把多只股票, 多天的记录先缓存起来,
+# 每个表攒够 batch_size 行后在一个事务里写入:
+#   先按主键 (code, time) 或 (code, date) 删除已有的记录, 再用多行 INSERT 每次写入 chunksize 行
+#   删除时主键的值作为绑定参数传给驱动, 时间的格式与 to_sql 写入的相同, 不再自己拼接字符串
+# 同一个主键在缓存里出现多次时只保留最后一次写入的记录, 所以重复写入的效果是覆盖 (upsert), 不需要表上有唯一索引
+#
+# 用完之后要调用 flush() (或者使用 with 语句), 否则缓存里剩下的记录不会写入;
+# process_writer() 返回的进程级 writer 在进程退出时自动 flush
+
+import pandas as pd
+from multiprocessing.util import Finalize
+from sqlalchemy import column, delete, table as table_clause, tuple_
+
+BATCH_SIZE = 20000  # 每个表缓存多少行后写入
+INSERT_ROWS = 1000  # 每条 INSERT 语句最多写入的行数
+MAX_PARAMS = 30000  # 每条语句绑定的参数个数上限 (sqlite, 服务端预处理语句都有限制)
+
+
+def _key_values(df, keys):
+    # 主键的值转成 Python 对象 (datetime64 -> datetime), 驱动按列的类型绑定
+    columns = []
+    for key in keys:
+        values = df[key]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            columns.append(list(values.dt.to_pydatetime()))
+        else:
+            columns.append(values.tolist())
+    return list(zip(*columns))
+
+
+class BulkWriter:
+
+    def __init__(self, con=None, batch_size=BATCH_SIZE, chunksize=INSERT_ROWS):
+        self.con = con
+        self.batch_size = batch_size
+        self.chunksize = chunksize
+        self._buffers = {}
+        self._keys = {}
+        self._rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        return False
+
+    def write(self, table, df, keys):
+        # keys 为表的主键列, 例如 ['code', 'time']
+        if df is None or df.empty:
+            return
+        self._buffers.setdefault(table, []).append(df)
+        self._keys[table] = list(keys)
+        self._rows[table] = self._rows.get(table, 0) + df.shape[0]
+        if self._rows[table] >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+        # 写入 table 的缓存, table 为空时写入所有表
+        tables = list(self._buffers.keys()) if table is None else [table]
+        for table in tables:
+            frames = self._buffers.pop(table, [])
+            self._rows.pop(table, None)
+            if len(frames) == 0:
+                continue
+            keys = self._keys[table]
+            df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=keys, keep='last')
+
+            chunksize = max(1, min(self.chunksize, MAX_PARAMS // df.shape[1]))
+            con = self.con
+            if con is None:
+                import Common.config as config
+                con = config.DB_CONN
+            with con.begin() as conn:
+                # 第一次写入时表还不存在, 由 to_sql 建表
+                if con.dialect.has_table(conn, table):
+                    target = table_clause(table, *[column(key) for key in keys])
+                    key_columns = tuple_(*[target.c[key] for key in keys])
+                    # 每行 len(keys) 个参数
+                    step = max(1, MAX_PARAMS // len(keys))
+                    rows = _key_values(df, keys)
+                    for start in range(0, len(rows), step):
+                        conn.execute(delete(target).where(key_columns.in_(rows[start:start + step])))
+                df.to_sql(name=table, con=conn, if_exists="append", index=False,
+                          method='multi', chunksize=chunksize)
+        return
+
+
+_process_writer = None
+
+
+def process_writer():
+    # 每个进程一个 writer, 在进程池的 worker 里跨多个任务累积记录, 进程退出时写入剩下的记录
+    global _process_writer
+    if _process_writer is None:
+        _process_writer = BulkWriter()
+        Finalize(_process_writer, _process_writer.flush, exitpriority=10)
+    return _process_writer
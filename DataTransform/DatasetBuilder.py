@@ -0,0 +1,94 @@
+# 按块生成模型的训练数据
+# 原来 prepare_data 把一只股票整个区间读进一个 DataFrame, 每一步都在整段数据上计算,
+# 最后 groupby('date') + np.dstack + 两次 swapaxes 复制成 (天数, K线数, 特征数), 峰值内存是结果的好几倍
+#
+# 这里把区间按交易日分块 (blocks), 每块单独读取, 计算, 缩放, 生成 (X, y) 后交给调用方, 内存只与块的大小有关
+# 变形不再复制: 先求出每天第一根K线的位置 (day_index), 再在连续的K线数组上取步长视图 (day_view)
+# 所有股票的块排成一个任务序列交给同一个进程池, 不同股票的块同时计算, 同时在计算或等待取走的块最多 depth 个 (stream)
+
+import datetime
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BARS_PER_DAY = 36  # 每天取下午2点之前的36根K线
+CHUNK_DAYS = 60  # 每块的交易日数
+
+
+def blocks(calendar, code, start_date, end_date, chunk_days=CHUNK_DAYS):
+    # [start_date, end_date] 内的交易日按 chunk_days 分块, 返回 [(块的第一天, 块的结束日期)]
+    # 与整段处理时一样, 读取K线时 `time`<=结束日期 不包含结束日期当天, 所以结束日期取下一块的第一天
+    dates = calendar.dates(code, start_date, end_date)
+    return [(dates[i], dates[i + chunk_days] if i + chunk_days < len(dates) else end_date)
+            for i in range(0, len(dates), chunk_days)]
+
+
+def as_date(value):
+    # 从缓存读回的日期可能是 datetime (Timestamp), 也可能已经是 date
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def day_index(dates):
+    # dates 为按时间排序的每根K线的日期, 返回每天第一根K线的位置和这一天的K线数
+    dates = np.asarray(dates)
+    if len(dates) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]])
+    counts = np.diff(np.r_[starts, len(dates)])
+    return starts, counts
+
+
+def day_view(values, starts, bars=BARS_PER_DAY):
+    # values 为 (K线数, 特征数) 的数组, 返回 (天数, bars, 特征数), 第 i 天为 values[starts[i]:starts[i] + bars]
+    # 每天的K线数相同时 (starts 等间隔) 返回 values 的视图, 不复制; 否则只复制选中的这些天
+    if len(starts) == 0:
+        return np.zeros((0, bars, values.shape[1]), dtype=values.dtype)
+    windows = sliding_window_view(values, bars, axis=0).swapaxes(1, 2)
+    steps = np.diff(starts)
+    if len(steps) == 0 or (steps[0] > 0 and (steps == steps[0]).all()):
+        step = steps[0] if len(steps) > 0 else 1
+        return windows[starts[0]:starts[-1] + 1:step]
+    return windows[starts]
+
+
+def reshape_days(df, bars=BARS_PER_DAY):
+    # 代替 groupby('date') + np.dstack: 返回 [日期, (天数, bars, 特征数)], K线不足 bars 根的日期跳过
+    # df 按时间排序, 除 date 以外都是数值列
+    starts, counts = day_index(df['date'].values)
+    starts = starts[counts >= bars]
+    values = df.drop(labels='date', axis=1).to_numpy(dtype=np.float64)
+    return [df['date'].iloc[starts].tolist(), day_view(values, starts, bars)]
+
+
+def stream(pool, func, args, depth=None):
+    # 在 WorkerPool 里执行 func(*arg), 按 args 的顺序逐个返回结果
+    # 同时提交的任务最多 depth 个 (默认为进程数的两倍), 调用方处理得慢时不会在内存里堆积结果
+    for _, result in stream_tagged(pool, func, ((None, arg) for arg in args), depth):
+        yield result
+
+
+def stream_tagged(pool, func, items, depth=None):
+    # 与 stream 相同, items 为 (tag, arg), 按 items 的顺序返回 (tag, func(*arg))
+    # arg 为 None 的项不执行, 返回 (tag, None), 用来在结果序列里保留不需要计算的项 (例如已经有缓存的股票)
+    # pool 为 None 时在当前进程里逐个执行
+    if pool is None:
+        for tag, arg in items:
+            yield tag, (func(*arg) if arg is not None else None)
+        return
+
+    depth = depth if depth is not None else 2 * pool.workers
+    pending = []
+    items = iter(items)
+
+    def submit():
+        for tag, arg in items:
+            pending.append((tag, pool.apply_async(func, arg) if arg is not None else None))
+            return True
+        return False
+
+    while len(pending) < depth and submit():
+        pass
+    while pending:
+        tag, result = pending.pop(0)
+        result = result.get() if result is not None else None
+        submit()
+        yield tag, result
@@ -0,0 +1,143 @@
+# 特征缩放
+# Transform5M, Transform5M_T1, Transform5M_T2 的缩放规则用声明式的 spec 描述: {列名: 变换}
+#   ('scale', k)                    x * k
+#   ('shift', c, k)                 (x - c) * k
+#   ('close', k)                    (x - close) / close * k, 相对收盘价
+#   ('vol', k)                      (x - vol) / vol * k, 相对成交量, 成交量为 0 时按 1 计算
+#   ('per_close', k)                x / close * k
+#   ('minmax', c, lo, hi, k)        (x - s[c]) / (s[hi] - s[lo]) * k, 按样本统计值缩放
+#   ('ratio', num, den, k)          x * s[num] / s[den] * k, num 为 None 时分子取 1
+#   ('spread', k)                   x * (s[price_max] - s[price_min]) / s[price_min] * k
+# 相同变换的列合并成一个矩阵一次计算, close / vol 始终取缩放前的值, 所以各列的计算顺序不影响结果
+#
+# 统计值 s 来自缩放样本 (ScalingParams), 可以是标量, 也可以是与每一行对应的数组 (每天的样本不同);
+# 训练时保存 ScalingParams, 预测时重新加载, 保证两边使用相同的缩放参数
+
+import json
+import numpy as np
+
+STATS = ['vol_min', 'vol_avg', 'vol_max', 'price_min', 'price_avg', 'price_max', 'count_min', 'count_max']
+
+
+def _columns(names, transform):
+    return {name: transform for name in names}
+
+
+# Transform5M / Transform5MRange, 写入 feature_scaled 表
+SPEC_5M = {}
+SPEC_5M.update(_columns(['open_change', 'high_change', 'low_change', 'close_change',
+                         'open_vec', 'high_vec', 'low_vec', 'close_vec'], ('scale', 150)))
+# 下面这组数据应该与收盘价来做缩放, 否则这么多维度数据数值都非常接近
+SPEC_5M.update(_columns(['ma5', 'ma15', 'ma25', 'ma40', 'ema_5', 'ema_15', 'ema_25', 'ema_40',
+                         'boll_up', 'boll_dn', 'boll_md'], ('close', 50)))
+SPEC_5M.update(_columns(['v_ma5', 'v_ma15', 'v_ma25', 'v_ma40'], ('vol', 0.5)))
+SPEC_5M.update(_columns(['mi_5', 'mi_10', 'mi_20', 'mi_30'], ('per_close', 80)))
+SPEC_5M.update(_columns(['change', 'amplitude', 'amplitude_maxs', 'amplitude_maxb'], ('scale', 100)))
+SPEC_5M.update({'turnover': ('scale', 1000), 'roc_12': ('scale', 50), 'roc_25': ('scale', 50)})
+SPEC_5M.update({'count': ('minmax', 'count_min', 'count_min', 'count_max', 1),
+                'vol': ('minmax', 'vol_max', 'vol_min', 'vol_max', 6),
+                'vr': ('scale', 0.5)})
+SPEC_5M.update(_columns(['cci_5', 'cci_15', 'cci_30'], ('scale', 0.003)))
+SPEC_5M.update(_columns(['rsi_6', 'rsi_12', 'rsi_24', 'k9', 'd9', 'j9'], ('scale', 0.01)))
+SPEC_5M.update(_columns(['wr_5', 'wr_10', 'wr_20'], ('scale', 0.04)))
+SPEC_5M.update({'oscv': ('scale', 0.01)})
+SPEC_5M.update(_columns(['dma_dif', 'dma_ama'], ('spread', 8)))
+SPEC_5M.update(_columns(['ar', 'br'], ('shift', 100, 0.01)))
+SPEC_5M.update({'mdi': ('scale', 2), 'pdi': ('scale', 2), 'adx': ('scale', 0.5), 'adxr': ('scale', 0.5)})
+SPEC_5M.update(_columns(['asi_5', 'asi_15', 'asi_25', 'asi_40'], ('ratio', None, 'price_avg', 1)))
+SPEC_5M.update(_columns(['macd_bar', 'macd_dea', 'macd_dif'], ('ratio', None, 'price_avg', 100)))
+SPEC_5M.update(_columns(['psy', 'psy_ma'], ('scale', 0.01)))
+SPEC_5M.update(_columns(['emv_emv', 'emv_maemv'], ('ratio', 'price_avg', 'vol_avg', 1)))
+SPEC_5M.update(_columns(['wvad', 'wvad_ma'], ('minmax', 'vol_min', 'vol_min', 'vol_max', 2.4)))
+
+# Transform5M_T1, 与 SPEC_5M 相同, 只是成交量按最小值缩放
+SPEC_T1 = dict(SPEC_5M)
+SPEC_T1['vol'] = ('minmax', 'vol_min', 'vol_min', 'vol_max', 6)
+
+# Transform5M_T2, 价格按 [price_floor, price_ceil] 做最小-最大缩放
+SPEC_T2 = {}
+SPEC_T2.update(_columns(['open_change', 'high_change', 'low_change', 'close_change', 'change', 'amplitude',
+                         'turnover', 'roc_12', 'roc_25'], ('scale', 100)))
+SPEC_T2.update(_columns(['close', 'ma5', 'ma15', 'ma25', 'ma40', 'boll_up', 'boll_dn'],
+                        ('minmax', 'price_floor', 'price_floor', 'price_ceil', 1)))
+SPEC_T2.update(_columns(['count', 'vol', 'v_ma5', 'v_ma15', 'v_ma25', 'v_ma40'], ('scale', 0.001)))
+SPEC_T2.update(_columns(['cci_5', 'cci_15', 'cci_30'], ('scale', 0.01)))
+SPEC_T2.update(_columns(['rsi_6', 'rsi_12', 'rsi_24', 'k9', 'd9', 'j9'], ('scale', 0.01)))
+
+
+class ScalingParams:
+    # 缩放样本的统计值 {STATS: 值}
+
+    def __init__(self, **stats):
+        self.stats = stats
+
+    @classmethod
+    def fit(cls, df):
+        # 从样本K线 (close, vol, count 列) 计算统计值
+        return cls(vol_min=df['vol'].min(), vol_avg=df['vol'].mean(), vol_max=df['vol'].max(),
+                   price_min=df['close'].min(), price_avg=df['close'].mean(), price_max=df['close'].max(),
+                   count_min=df['count'].min(), count_max=df['count'].max())
+
+    def save(self, path):
+        stats = {name: np.asarray(value, dtype=np.float64).tolist() for name, value in self.stats.items()}
+        with open(path, 'w') as f:
+            json.dump(stats, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def apply(self, df, spec):
+        return scale(df, spec, self)
+
+
+def _derived(stats):
+    stats = {name: np.asarray(value, dtype=np.float64) for name, value in stats.items()}
+    if 'price_min' in stats and 'price_max' in stats:
+        stats['price_floor'] = np.ceil(stats['price_min'] * 0.7)
+        stats['price_ceil'] = np.ceil(stats['price_max'] * 1.3)
+    # 每行一个值的统计量按列广播
+    return {name: value[:, None] if value.ndim == 1 else value for name, value in stats.items()}
+
+
+def _apply(transform, x, close, vol, s):
+    kind, args = transform[0], transform[1:]
+    if kind == 'scale':
+        return x * args[0]
+    if kind == 'shift':
+        return (x - args[0]) * args[1]
+    if kind == 'close':
+        return (x - close) / close * args[0]
+    if kind == 'vol':
+        return (x - vol) / vol * args[0]
+    if kind == 'per_close':
+        return x / close * args[0]
+    if kind == 'minmax':
+        center, low, high, k = args
+        return (x - s[center]) / (s[high] - s[low]) * k
+    if kind == 'ratio':
+        num, den, k = args
+        return x * ((s[num] if num is not None else 1) / s[den] * k)
+    if kind == 'spread':
+        return x * ((s['price_max'] - s['price_min']) / s['price_min'] * args[0])
+    raise RuntimeError('Unknown scaling transform {}'.format(transform))
+
+
+def scale(df, spec, stats):
+    # 按 spec 缩放 df 的列, stats 为 ScalingParams 或 {统计量: 值}
+    # 返回缩放后的新 DataFrame, 传入的 df 不变 (特征可能还在等待写入或缓存)
+    s = _derived(stats.stats if isinstance(stats, ScalingParams) else stats)
+    close = df['close'].to_numpy(dtype=np.float64)[:, None] if 'close' in df.columns else None
+    vol = df['vol'].to_numpy(dtype=np.float64)[:, None] if 'vol' in df.columns else None
+    if vol is not None:
+        vol = np.where(vol == 0, 1, vol)
+
+    groups = {}
+    for name, transform in spec.items():
+        groups.setdefault(transform, []).append(name)
+    result = df.copy()
+    for transform, columns in groups.items():
+        x = df[columns].to_numpy(dtype=np.float64)
+        result[columns] = _apply(transform, x, close, vol, s)
+    return result
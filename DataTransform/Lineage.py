@@ -0,0 +1,126 @@
+# 原始数据到衍生数据的依赖关系
+# 某只股票某一天的5分钟K线 (或日线) 重新导入或修正后, 求出依赖它的下游记录和缓存, 只删除并重算这些, 不再全部重建
+#
+# 原始数据 (code, d) 影响:
+#   features  feature_extracted 的 d': 读取 d' 之前 L 个交易日到 d' 的K线 (L = LookbackPlanner.lookback_days)
+#             => d 当天和之后的 L 个交易日
+#   scaled    feature_scaled 的 d': 当天的 features 和 [d' - 37, d' - 7) 天的缩放样本
+#             => features 的日期, 加上 (d + 7, d + 37] 内的交易日 (stats, scaling_stats 表里这些日期的记录)
+#   results   result 的 d': 当天和下一个交易日的K线 => d 和 d 之前的一个交易日
+# 缓存:
+#   指标缓存 (IndicatorCache) 里 features 日期的行
+#   DailyFullMarket2D 的 .h5 / -result.csv, 文件覆盖的日期里有 scaled 或 results 的日期时删除
+#   Model5M_T1/T2 的缓存按股票保存, 不区分日期, 股票有修改就删除
+
+from datetime import timedelta
+from collections import defaultdict
+from sqlalchemy.orm import sessionmaker
+import os
+
+STAGE_TABLES = ['features', 'scaled', 'results']  # 与 TransformManifest.STAGES 相同
+MODEL_CACHE_PREFIX = 'transformed_stock_trading_5min_t1_data_'
+
+
+def downstream(calendar, changed, lookback_days=None, offset=30, bias=7):
+    # changed 为修改过的 [(code, date)], 返回 {'features' / 'scaled' / 'results' / 'stats': {code: [日期]}}
+    if lookback_days is None:
+        from FeatureExtractor import Engine
+        from DataTransform import LookbackPlanner
+        lookback_days = LookbackPlanner.lookback_days(Engine.FEATURES)
+
+    plan = {name: defaultdict(set) for name in STAGE_TABLES + ['stats']}
+    for code, date in changed:
+        features = calendar.window(code, date, date, after=lookback_days)
+        stats = calendar.dates(code, date + timedelta(days=bias + 1), date + timedelta(days=offset + bias))
+        plan['features'][code].update(features)
+        plan['stats'][code].update(stats)
+        plan['scaled'][code].update(features + stats)
+        plan['results'][code].update(calendar.window(code, date, date, before=1))
+    return {name: {code: sorted(dates) for code, dates in sorted(codes.items()) if len(dates) > 0}
+            for name, codes in plan.items()}
+
+
+def affected_files(calendar, plan, ranges):
+    # ranges 为 DailyFullMarket2D.cached_ranges(), 返回需要删除的缓存文件
+    dates = sorted(set(date for name in ['scaled', 'results'] for dates in plan[name].values() for date in dates))
+    files = []
+    for path, start_date, end_date in ranges:
+        first_date = calendar.previous(None, start_date) or start_date
+        if any(first_date <= date <= end_date for date in dates):
+            files.append(path)
+    return files
+
+
+def _day_conditions(column, dates):
+    if column == 'date':
+        return "`date` IN ({})".format(", ".join("'{}'".format(date) for date in dates))
+    return "(" + " OR ".join("(`time`>='{}' AND `time`<='{}')".format(date, date + timedelta(days=1))
+                             for date in dates) + ")"
+
+
+def invalidate(db, calendar, changed, manifest, cache_dir=None):
+    # 删除 changed 的下游记录, 清除完成清单里对应的阶段, 删除受影响的缓存, 返回 downstream 的结果
+    # 调用方负责 manifest.save()
+    from DataTransform.Transform5M import TABLE_NAME_5MIN_EXTRACTED, TABLE_NAME_5MIN_SCALED, TABLE_NAME_5MIN_RESULT, \
+        SAMPLE_DATE_OFFSET, SAMPLE_DATE_BIAS
+    from DataCache import ScalingStats
+    from DataCache.IndicatorCache import IndicatorCache
+    from DataCache.CacheManager import CacheManager
+    from DataProviders import DailyFullMarket2D
+
+    plan = downstream(calendar, changed, offset=SAMPLE_DATE_OFFSET, bias=SAMPLE_DATE_BIAS)
+    tables = [('features', TABLE_NAME_5MIN_EXTRACTED, 'time'), ('scaled', TABLE_NAME_5MIN_SCALED, 'time'),
+              ('results', TABLE_NAME_5MIN_RESULT, 'date')]
+    if ScalingStats.has_table():
+        tables.append(('stats', ScalingStats.TABLE_NAME_SCALING_STATS, 'date'))
+    for name, table, column in tables:
+        for code, dates in plan[name].items():
+            db.execute("DELETE FROM {0} WHERE `code`='{1}' AND {2}".format(
+                table, code, _day_conditions(column, dates)))
+    db.commit()
+
+    # features 重做时 scaled 也要重做, 这两个阶段一起清除
+    for code, dates in plan['features'].items():
+        manifest.clear(code, dates, ['features', 'scaled'])
+        IndicatorCache(code).evict(dates)
+    for code, dates in plan['scaled'].items():
+        manifest.clear(code, dates, ['scaled'])
+    for code, dates in plan['results'].items():
+        manifest.clear(code, dates, ['results'])
+
+    files = affected_files(calendar, plan, DailyFullMarket2D.cached_ranges(cache_dir))
+    for path in files:
+        os.remove(path)
+    for code in sorted(set(code for code, _ in changed)):
+        CacheManager(MODEL_CACHE_PREFIX + code).clear_cache()
+    plan['files'] = files
+    return plan
+
+
+def rebuild(changed, **kwargs):
+    # 删除 changed 的下游记录和缓存, 然后只重算这些日期, kwargs 传给 Transform5M.process_date_range
+    import Common.config as config
+    from DataCache.TradingCalendar import TradingCalendar, MARGIN_DAYS
+    from DataCache.TransformManifest import TransformManifest
+    from DataTransform import Transform5M
+
+    changed = sorted(set(changed))
+    if len(changed) == 0:
+        return []
+    dates = [date for _, date in changed]
+    session = sessionmaker()
+    session.configure(bind=config.DB_CONN)
+    db = session()
+    calendar = TradingCalendar.load(db, min(dates), max(dates) + timedelta(days=MARGIN_DAYS))
+    codes = sorted(set(code for code, _ in changed))
+    manifest = TransformManifest().load(codes)
+    plan = invalidate(db, calendar, changed, manifest)
+    manifest.save()
+    db.close()
+
+    dates = [date for name in STAGE_TABLES for dates in plan[name].values() for date in dates]
+    print("Invalidated {} raw days: {} features, {} scaled, {} results, {} cache files".format(
+        len(changed), *[sum(len(dates) for dates in plan[name].values()) for name in STAGE_TABLES],
+        len(plan['files'])))
+    # 只处理修改过的股票, 完成清单里被清除的日期 (以及原来就没有完成的日期) 会被安排
+    return Transform5M.process_date_range(min(dates), max(dates) + timedelta(days=1), codes=codes, **kwargs)
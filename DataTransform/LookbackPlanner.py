@@ -0,0 +1,18 @@
+# 历史数据读取计划
+# 每个指标模块声明自己需要的历史K线数 (LOOKBACK), Registry.lookback 沿依赖关系累加,
+# 这里把需要的K线数换算成目标日期之前需要读取的交易日数, 替代固定的 DATE_OFFSET
+# 特征列越少需要读取的历史越短, 指标需要的历史超过两天时也不会再因为数据不足而出错
+
+import numpy as np
+from FeatureExtractor import Registry
+
+BARS_PER_DAY = 48  # 每个交易日的5分钟K线数
+
+
+def lookback_bars(features, available=('date',)):
+    return Registry.lookback(features, available)
+
+
+def lookback_days(features, available=('date',), bars_per_day=BARS_PER_DAY):
+    # 目标日期第一根K线之前需要的完整交易日数
+    return int(np.ceil(lookback_bars(features, available) / bars_per_day))
@@ -0,0 +1,143 @@
+# 读取 / 计算 / 写入三段流水线
+# 原来每个 worker 先等 SQL 读完, 再计算, 再等写入完成, 读写时 CPU 空闲, 计算时数据库空闲
+# 这里把三步拆开, 用有界队列连接:
+#   读取: io_threads 个线程在主进程里读取任务需要的数据 fetch(task) -> payload
+#   计算: 进程池 (WorkerPool) 里执行 compute(payload) -> result, compute 必须是模块级函数, 不访问数据库
+#   写入: 一个线程在主进程里写入 write(result) -> TaskStatus
+# 计算当前任务的同时, 读取线程在读后面的任务, 写入线程在写前面的任务, 总耗时取决于 CPU 和数据库中较慢的一个
+#
+# payload 和 result 在主进程和计算进程之间 pickle 传递 (Transform5M 为读好的 Transform5M 对象和输出的 DataFrame),
+# 计算进程不连接数据库, 换来读写与计算重叠; 与 WorkerPool.run 在 worker 里写入, 只返回 TaskStatus 的方式不同
+#
+# 读好等待计算的任务最多 depth 个, 正在计算和等待写入的任务最多 depth 个, 内存占用不随任务数增长
+# 某个任务出错时打印错误并继续处理其他任务, 出错的任务没有 TaskStatus
+# worker 被杀死 (例如内存不足) 时进程池不会调用任务的回调, 计算超过 timeout 秒的任务按出错处理并释放名额,
+# 之后才返回的结果被丢弃, 没有 TaskStatus 的任务不记入完成清单, 下次转换时重新安排
+
+import queue
+import threading
+import time
+import traceback
+from DataTransform.WorkerPool import print_progress, print_summary
+
+IO_THREADS = 4
+TASK_TIMEOUT = 600  # 一个任务从交给进程池到计算完成最多等待的秒数
+POLL_SECONDS = 5  # 等待名额时检查超时任务的间隔
+
+
+class Pipeline:
+
+    def __init__(self, pool, fetch, compute, write, io_threads=IO_THREADS, depth=None, timeout=TASK_TIMEOUT):
+        # pool 为 WorkerPool, depth 默认为进程数的两倍, 计算进程总有下一个任务可做
+        self.pool = pool
+        self.fetch = fetch
+        self.compute = compute
+        self.write = write
+        self.io_threads = io_threads
+        self.depth = depth if depth is not None else 2 * pool.workers
+        self.timeout = timeout
+
+    def run(self, tasks, callback=None):
+        # 返回所有成功写入的任务的 TaskStatus, callback(status) 在写入线程里对每个任务调用一次
+        count = len(tasks)
+        statuses = []
+        started = time.time()
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        for _ in range(self.io_threads):
+            pending.put(None)
+        fetched = queue.Queue(maxsize=self.depth)
+        computed = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.depth)  # 正在计算和等待写入的任务
+
+        def read():
+            while True:
+                task = pending.get()
+                if task is None:
+                    fetched.put(None)
+                    return
+                try:
+                    fetched.put(self.fetch(task))
+                except Exception:
+                    print("\nFetch failed: {}".format(task))
+                    traceback.print_exc()
+
+        def write():
+            while True:
+                result = computed.get()
+                if result is None:
+                    return
+                try:
+                    status = self.write(result)
+                    statuses.append(status)
+                    if callback is not None:
+                        callback(status)
+                    print_progress(statuses, count, started)
+                except Exception:
+                    print("\nWrite failed")
+                    traceback.print_exc()
+                finally:
+                    in_flight.release()
+
+        # 正在计算的任务 {编号: 截止时间}, 回调和超时只有先到的一个生效, 名额只释放一次
+        computing = {}
+        lock = threading.Lock()
+
+        def finish(key):
+            with lock:
+                return computing.pop(key, None) is not None
+
+        def computed_callback(key):
+            def done(result):
+                if finish(key):
+                    computed.put(result)
+
+            def failed(e):
+                if finish(key):
+                    print("\nCompute failed: {}".format(e))
+                    in_flight.release()
+            return done, failed
+
+        def expire():
+            now = time.time()
+            with lock:
+                expired = [key for key, deadline in computing.items() if deadline < now]
+                for key in expired:
+                    del computing[key]
+            self.pool.lost += len(expired)
+            for key in expired:
+                print("\nCompute timed out after {} seconds".format(self.timeout))
+                in_flight.release()
+
+        def acquire():
+            while not in_flight.acquire(timeout=min(POLL_SECONDS, self.timeout)):
+                expire()
+
+        readers = [threading.Thread(target=read, daemon=True) for _ in range(self.io_threads)]
+        writer = threading.Thread(target=write, daemon=True)
+        for thread in readers + [writer]:
+            thread.start()
+
+        # 主线程把读好的任务交给进程池, 正在计算和等待写入的任务达到 depth 个时等待
+        finished = 0
+        submitted = 0
+        while finished < self.io_threads:
+            payload = fetched.get()
+            if payload is None:
+                finished += 1
+                continue
+            acquire()
+            submitted += 1
+            done, failed = computed_callback(submitted)
+            with lock:
+                computing[submitted] = time.time() + self.timeout
+            self.pool.apply_async(self.compute, (payload,), callback=done, error_callback=failed)
+
+        # 取回所有名额即所有任务都已写入或出错
+        for _ in range(self.depth):
+            acquire()
+        computed.put(None)
+        writer.join()
+        print_summary(statuses, count)
+        return statuses
@@ -0,0 +1,91 @@
+# 由1分钟K线合成 5/15/30/60 分钟K线
+# A股交易时段为 9:30-11:30, 13:00-15:00, K线以结束时间标记 (例如 5分钟线 9:35 ... 11:30, 13:05 ... 15:00)
+# 合成的K线不会跨越午间休市, 所以周期必须能整除上午的 120 分钟
+#
+# 每根1分钟K线先换算成当天交易时段内的分钟序号 (1 - 240), 9:30 集合竞价和 13:00 的K线分别并入
+# 上午和下午的第一根, 再按 ceil(序号 / 周期) 分组, 用 reduceat 一次完成所有分组的聚合
+# 合成结果通过 CacheManager 缓存, 入库时只需要导入1分钟数据
+
+from datetime import timedelta
+from sqlalchemy.orm import sessionmaker
+import numpy as np
+import pandas as pd
+
+TABLE_NAME_1MIN = "raw_stock_trading_1min"
+COLUMNS = ['code', 'time', 'open', 'high', 'low', 'close', 'vol', 'amount', 'count']
+SESSION_MINUTES = 120  # 上午和下午各 120 分钟
+
+
+def _session_minutes(times):
+    # 交易时段内的分钟序号, 上午 1 - 120, 下午 121 - 240
+    times = pd.DatetimeIndex(times)
+    minutes = np.asarray(times.hour * 60 + times.minute)
+    morning = np.clip(minutes - (9 * 60 + 30), 1, SESSION_MINUTES)
+    afternoon = np.clip(minutes - 13 * 60, 1, SESSION_MINUTES) + SESSION_MINUTES
+    return np.where(minutes <= 11 * 60 + 30, morning, afternoon)
+
+
+def resample(df, period):
+    # df 为一只或多只股票的1分钟K线, 列为 COLUMNS, 返回相同列的 period 分钟K线
+    if SESSION_MINUTES % period != 0:
+        raise RuntimeError("Period {} does not divide the {} minutes session".format(period, SESSION_MINUTES))
+
+    df = df.sort_values(['code', 'time'])
+    times = pd.DatetimeIndex(df['time'])
+    bucket = (_session_minutes(times) + period - 1) // period
+    dates = times.normalize()
+
+    # 股票, 日期或分组变化的位置就是一根新K线的开始
+    codes = df['code'].values
+    key_changed = (codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1]) | (bucket[1:] != bucket[:-1])
+    starts = np.flatnonzero(np.concatenate([[True], key_changed]))
+    ends = np.concatenate([starts[1:], [len(df)]]) - 1
+
+    # 结束时间: 上午从 9:30 起算, 下午从 13:00 起算
+    end_minute = bucket[starts] * period
+    offset = np.where(end_minute <= SESSION_MINUTES,
+                      9 * 60 + 30 + end_minute,
+                      13 * 60 + end_minute - SESSION_MINUTES)
+    bar_time = dates[starts] + pd.to_timedelta(offset, unit='m')
+
+    result = pd.DataFrame({
+        'code': codes[starts],
+        'time': bar_time,
+        'open': df['open'].values[starts],
+        'high': np.maximum.reduceat(df['high'].values, starts),
+        'low': np.minimum.reduceat(df['low'].values, starts),
+        'close': df['close'].values[ends],
+        'vol': np.add.reduceat(df['vol'].values, starts),
+        'amount': np.add.reduceat(df['amount'].values, starts),
+        'count': np.add.reduceat(df['count'].values, starts),
+    })
+    return result
+
+
+def load_bars(code, start_date, end_date, period, use_cache=True):
+    # 读取 [start_date, end_date] 的1分钟K线并合成 period 分钟K线, 结果以 time 为索引
+    import Common.config as config
+    from DataCache.CacheManager import CacheManager
+    cache = CacheManager('resampled_stock_trading_{}min_{}_{}_{}'.format(period, code, start_date, end_date))
+    if use_cache and cache.has_cached_data():
+        return cache.load_cached_data()
+
+    session = sessionmaker()
+    session.configure(bind=config.DB_CONN)
+    s = session()
+    rs = s.execute(
+        "SELECT `code`, `time`, `open`, `high`, `low`, `close`, `vol`, `amount`, `count` "
+        "FROM {0} "
+        "WHERE `code`='{1}' AND `time`>='{2}' AND `time`<'{3}' "
+        "ORDER BY time ASC".format(
+            TABLE_NAME_1MIN, code, start_date, end_date + timedelta(days=1)))
+    df = pd.DataFrame(rs.fetchall())
+    s.close()
+    if df.empty:
+        raise RuntimeError("No 1 minute data for {} from {} to {}".format(code, start_date, end_date))
+    df.columns = COLUMNS
+
+    df = resample(df, period)
+    df = df.set_index(['time'], drop=True)
+    df['date'] = [time.date() for time in df.index.tolist()]
+    return cache.cache_data(df)
@@ -0,0 +1,134 @@
+# 结果 (标签) 计算
+# 输入一只股票按时间排序的连续5分钟K线 (time, open, high, low, close 列), 可以覆盖任意多个交易日,
+# 先按 (交易日, 上午/下午) 分段, 用 reduceat 一次求出每天每个时段的开/高/低/收和最高/最低点出现的时间 (day_summary),
+# 然后每个标签都只是两个交易日汇总值之间的数组运算, 不再每天单独查询和筛选K线
+#
+# 新的预测期限只需要再取一次汇总值, 例如第 2 个交易日的收盘涨幅:
+#   summary = day_summary(bars)
+#   this, after = take(summary, dates), take(summary, dates_after_2_days)
+#   rate(after['day_close'], this['day_close'])
+#
+# 最高/最低点取时段内第一次出现的位置, 与 rolling_argmax / rolling_argmin 相同
+# 当天上午/下午或下一个交易日上午没有K线的日期 (complete 为 False) 不输出记录, 标签不会是 nan
+
+import numpy as np
+import pandas as pd
+
+SESSIONS = ['day', 'am', 'pm']
+FIELDS = ['open', 'high', 'low', 'close', 'high_minute', 'low_minute']
+NOON = 12 * 60  # 12:00 之前为上午
+AM_OPEN = 9 * 60 + 30
+PM_OPEN = 13 * 60
+
+RESULT_COLUMNS = ['nextday_open', 'nextday_high', 'nextday_low', 'nextday_close',
+                  'this_pm_close_rate', 'this_pm_low_rate', 'this_pm_low_timing',
+                  'next_am_open_rate', 'next_am_high_rate', 'next_am_high_timing',
+                  't1_max_profit_rate']
+
+
+def _first(values, extreme, starts, lengths):
+    # 每段第一次出现极值的位置
+    positions = np.arange(len(values))
+    hit = values == np.repeat(extreme, lengths)
+    return np.minimum.reduceat(np.where(hit, positions, len(values)), starts)
+
+
+def _segments(key, values, minutes):
+    # key 相同的连续K线为一段, 返回每段的 key 和汇总值
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    lengths = np.diff(np.r_[starts, len(key)])
+    high = np.maximum.reduceat(values['high'], starts)
+    low = np.minimum.reduceat(values['low'], starts)
+    return key[starts], {
+        'open': values['open'][starts],
+        'high': high,
+        'low': low,
+        'close': values['close'][starts + lengths - 1],
+        'high_minute': minutes[_first(values['high'], high, starts, lengths)],
+        'low_minute': minutes[_first(values['low'], low, starts, lengths)],
+    }
+
+
+def day_summary(bars):
+    # 返回 {'date': 交易日数组, '<时段>_<字段>': 与交易日对应的数组},
+    # 每个数组末尾多一个 nan, 找不到的日期 (位置 -1) 取到 nan
+    times = pd.DatetimeIndex(bars['time']).values
+    days = times.astype('datetime64[D]')
+    minutes = ((times - days) // np.timedelta64(1, 'm')).astype(np.int64)
+    values = {name: bars[name].to_numpy(dtype=np.float64) for name in ['open', 'high', 'low', 'close']}
+
+    dates, day_index = np.unique(days, return_inverse=True)
+    summary = {'date': pd.DatetimeIndex(dates).date}
+    if len(days) == 0:
+        for session in SESSIONS:
+            summary.update({'{}_{}'.format(session, name): np.full(1, np.nan) for name in FIELDS})
+        return summary
+
+    pm = minutes >= NOON
+    for session, key in [('day', day_index), ('am', np.where(pm, -1, day_index)), ('pm', np.where(pm, day_index, -1))]:
+        segment_keys, segments = _segments(key, values, minutes)
+        found = segment_keys >= 0
+        for name in FIELDS:
+            column = np.full(len(dates) + 1, np.nan)
+            column[segment_keys[found]] = segments[name][found]
+            summary['{}_{}'.format(session, name)] = column
+    return summary
+
+
+def locate(summary, dates):
+    # dates 在汇总里的位置, 没有K线的日期为 -1
+    index = pd.Index(summary['date'])
+    return index.get_indexer(pd.Index(list(dates)))
+
+
+def take(summary, dates):
+    positions = locate(summary, dates)
+    return {name: values[positions] for name, values in summary.items() if name != 'date'}
+
+
+def rate(value, base):
+    return (value - base) / base * 100
+
+
+def complete(summary, dates, next_dates):
+    # 每一天能否算出全部标签: 当天上午和下午, 下一个交易日上午都有K线
+    this, nxt = take(summary, dates), take(summary, next_dates)
+    return ~np.isnan(this['am_close']) & ~np.isnan(this['pm_close']) & ~np.isnan(nxt['am_open'])
+
+
+def results(code, bars, dates, next_dates):
+    # dates 中每一天的 result 表记录, next_dates 为对应的下一个交易日, 缺少K线的日期被去掉
+    summary = day_summary(bars)
+    keep = complete(summary, dates, next_dates)
+    dates = [date for date, ok in zip(dates, keep) if ok]
+    next_dates = [date for date, ok in zip(next_dates, keep) if ok]
+    this, nxt = take(summary, dates), take(summary, next_dates)
+
+    this_am_close = this['am_close']
+    thisday_close = this['day_close']
+    result_df = pd.DataFrame({'code': code, 'date': list(dates)})
+
+    result_df['nextday_open'] = rate(nxt['day_open'], thisday_close)
+    result_df['nextday_high'] = rate(nxt['day_high'], thisday_close)
+    result_df['nextday_low'] = rate(nxt['day_low'], thisday_close)
+    result_df['nextday_close'] = rate(nxt['day_close'], thisday_close)
+
+    result_df['this_pm_close_rate'] = rate(this['pm_close'], this_am_close)
+    result_df['this_pm_low_rate'] = rate(this['pm_low'], this_am_close)
+    result_df['this_pm_low_timing'] = (this['pm_low_minute'] - PM_OPEN) % 1440 / 5  # 1 to 24
+
+    result_df['next_am_open_rate'] = rate(nxt['am_open'], this_am_close)
+    result_df['next_am_high_rate'] = rate(nxt['am_high'], this_am_close)
+    result_df['next_am_high_timing'] = (nxt['am_high_minute'] - AM_OPEN) % 1440 / 5  # 1 to 24
+
+    result_df['t1_max_profit_rate'] = rate(nxt['am_high'], this['pm_low'])  # -10 to +10
+    return result_df
+
+
+def open_gap_classes(open, last_close, threshold=0.5):
+    # 开盘相对前一天收盘的跳空分类 one-hot: [下跌, 平, 上涨]
+    change = rate(np.asarray(open, dtype=np.float64), np.asarray(last_close, dtype=np.float64))
+    classes = np.ones(len(change), dtype=np.int64)
+    classes[change >= threshold] = 2
+    classes[change <= -threshold] = 0
+    return np.eye(3, dtype=np.int64)[classes]
@@ -0,0 +1,330 @@
+# 全市场横截面转换
+# 一次读取某个交易日 (以及指标需要的之前几个交易日和标签需要的下一个交易日) 全部股票的5分钟K线,
+# 每个字段组成 (股票数, K线数) 的矩阵, 沿时间轴一次算出所有股票的指标,
+# 不再为每只股票单独查询数据库和计算 96 行的 DataFrame
+#
+# 只处理这几个交易日K线完整, 每天都有流通股数据, 统计表里有缩放样本, 并且能算出全部标签的股票,
+# 其余当天有交易的股票 (停牌, 缺数据) 由 process_date_range 交给 Transform5M 逐只处理, 出错原因与逐只处理相同
+# 写入三张输出表的列与 Transform5M 相同, 完成的阶段记入同一份完成清单
+
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+import numpy as np
+import pandas as pd
+import sys
+
+from FeatureExtractor import Engine, Registry
+from DataTransform import LookbackPlanner, FeatureScaling, ResultLabels
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+from DataTransform import Transform5M
+from DataTransform.Transform5M import TABLE_NAME_DAILY, TABLE_NAME_5MIN, TABLE_NAME_5MIN_EXTRACTED, \
+    TABLE_NAME_5MIN_SCALED, TABLE_NAME_5MIN_RESULT, SAMPLE_DATE_OFFSET, SAMPLE_DATE_BIAS, NotReadyError, write_table
+from DataTransform.BulkWriter import BulkWriter
+from DataCache import ScalingStats
+from DataCache.TradingCalendar import TradingCalendar, install, installed
+from DataCache.TransformManifest import TransformManifest
+RAW_FIELDS = ['open', 'high', 'low', 'close', 'vol', 'amount', 'count']
+
+
+def stack_stocks(df, daily_df, dates):
+    # df 为 dates 这几个交易日的5分钟K线 (code, time, RAW_FIELDS), 按 code, time 排序
+    # daily_df 为每只股票每天的流通股手数 (code, date, total_vol)
+    # 返回 (股票代码, (股票数, K线数) 的时间, {字段: (股票数, K线数) 矩阵}, 数据不完整的股票代码)
+    length = len(dates) * BARS_PER_DAY
+
+    # 每只股票都要有完整的 length 根K线, 才能直接 reshape 成矩阵
+    counts = df.groupby('code').size()
+    complete = counts.index[counts == length]
+
+    # 某天没有日线 (或市值为空) 的股票 total_vol 为 nan, 换手率会变成 nan, 同样交给 Transform5M
+    total_vol = daily_df.pivot(index='code', columns='date', values='total_vol')
+    total_vol = total_vol.reindex(index=complete, columns=dates).astype(np.float64)
+    total_vol = total_vol[total_vol.notna().all(axis=1)]
+
+    dropped = sorted(set(df['code']) - set(total_vol.index))
+    df = df[df['code'].isin(total_vol.index)]
+    if df.empty:
+        return [], None, None, dropped
+    codes = df['code'].values[::length].tolist()
+    times = df['time'].values.reshape(-1, length)
+    data = {field: df[field].values.astype(np.float64).reshape(-1, length) for field in RAW_FIELDS}
+    # 每根K线当天的流通股手数
+    data['total_vol'] = np.repeat(total_vol.reindex(codes).values, BARS_PER_DAY, axis=1)
+    return codes, times, data, dropped
+
+
+def unstack_features(codes, times, data, date):
+    # 沿时间轴一次算出所有股票的指标, 只保留 date 当天的K线, 展开成与 Transform5M.extract_features 相同的长表
+    columns = Engine.compute(data['open'], data['high'], data['low'], data['close'],
+                             data['vol'], data['amount'], data['count'], data['total_vol'])
+    df = pd.DataFrame({'code': np.repeat(codes, BARS_PER_DAY), 'time': times[:, -BARS_PER_DAY:].ravel()})
+    for field in RAW_FIELDS:
+        df[field] = columns[field][:, -BARS_PER_DAY:].ravel()
+    df['date'] = date
+    for indicator in Registry.resolve(Engine.FEATURES):
+        for name in indicator.OUTPUTS:
+            df[name] = columns[name][:, -BARS_PER_DAY:].ravel()
+    return df
+
+
+class Transform5MMarket:
+    db = None
+    writer = None  # BulkWriter, 为空时直接 to_sql
+    calendar = None  # TradingCalendar
+    date = datetime.now().date()
+
+    def __init__(self, date, code_list=[]):
+        self.date = date
+        self.code_list = code_list
+        self._trading_dates = None
+        self._next_date = None
+        self._codes = None
+        self._dropped = None
+        self._times = None
+        self._data = None
+        self._scaling_stats = None
+        self._results = None
+        self._features = None
+        self._feature_extracted_data = None
+        self._feature_scaled_data = None
+        self._result_data = None
+        return
+
+    def _get_calendar(self):
+        # 进程池里使用 install 的日历, 单独运行时加载这一天前后的交易日
+        if self.calendar is None:
+            self.calendar = installed()
+        if self.calendar is None:
+            self.calendar = TradingCalendar.load(self.db, self.date, self.date, self.code_list or None)
+        return self.calendar
+
+    def _code_query(self):
+        if len(self.code_list) == 0:
+            return ""
+        return "AND `code` in ('{}')".format("','".join(self.code_list))
+
+    def _get_trading_dates(self):
+        # 当天以及指标需要的之前几个交易日, 按日期升序, 同时找出全市场的下一个交易日
+        if self._trading_dates is not None:
+            return self._trading_dates
+
+        calendar = self._get_calendar()
+        if not calendar.is_trading_date(None, self.date):
+            raise RuntimeError('{} is not a trading date'.format(self.date))
+        lookback_days = LookbackPlanner.lookback_days(Engine.FEATURES)
+        first_date = calendar.previous(None, self.date, lookback_days) if lookback_days > 0 else self.date
+        if first_date is None:
+            raise RuntimeError('Ignore the date, because there are '
+                               'no more data before {}'.format(self.date))
+        next_date = calendar.next(None, self.date)
+        if next_date is None:
+            raise NotReadyError('No more trading date after {}'.format(self.date))
+
+        self._next_date = next_date
+        self._trading_dates = calendar.dates(None, first_date, self.date)
+        return self._trading_dates
+
+    def codes(self):
+        # 在矩阵里一起处理的股票
+        self.prepare_data()
+        return self._codes
+
+    def dropped(self):
+        # 当天有交易但是不能放进矩阵的股票, 需要交给 Transform5M 逐只处理
+        self.prepare_data()
+        return self._dropped
+
+    def prepare_data(self):
+        # 返回 {字段: (股票数, K线数) 矩阵}, 股票顺序与 self._codes 一致
+        if self._data is not None or self._codes is not None:
+            return self._data
+
+        dates = self._get_trading_dates()
+        calendar = self._get_calendar()
+        trading_codes = [code for code in (self.code_list or calendar.codes)
+                         if calendar.is_trading_date(code, self.date)]
+
+        rs = self.db.execute(
+            "SELECT * "
+            "FROM {0} "
+            "WHERE `time`>='{1}' AND `time`<='{2}' {3} "
+            "ORDER BY `code` ASC, `time` ASC".format(
+                TABLE_NAME_5MIN, dates[0], self._next_date + timedelta(days=1), self._code_query()))
+        df = pd.DataFrame(rs.fetchall(), columns=['code', 'time'] + RAW_FIELDS)
+        df['time'] = pd.to_datetime(df['time'])
+
+        rs = self.db.execute(
+            "SELECT `code`, `date`, ROUND((`traded_market_value`/`close`)) as total_vol "
+            "FROM {0} "
+            "WHERE `date`>='{1}' AND `date`<='{2}' {3}".format(
+                TABLE_NAME_DAILY, dates[0], self.date, self._code_query()))
+        daily_df = pd.DataFrame(rs.fetchall(), columns=['code', 'date', 'total_vol'])
+
+        # 下一个交易日的K线只用来计算标签
+        codes, times, data, dropped = stack_stocks(df[df['time'] < pd.Timestamp(self._next_date)], daily_df, dates)
+
+        # 统计表里有缩放样本, 标签完整, 并且到下一个交易日是连续的, 才留在矩阵里
+        stats = ScalingStats.lookup_date(self.db, self.date) if ScalingStats.has_table() else \
+            pd.DataFrame(columns=FeatureScaling.STATS)
+        result_bars = df[(df['time'] >= pd.Timestamp(self.date)) & df['code'].isin(stats.index.intersection(codes))]
+        results = [ResultLabels.results(code, bars, [self.date], [self._next_date])
+                   for code, bars in result_bars.groupby('code', sort=False)]
+        results = pd.concat(results, ignore_index=True) if len(results) > 0 else \
+            pd.DataFrame(columns=['code', 'date'] + ResultLabels.RESULT_COLUMNS)
+        continuous = calendar.continuous(dates[0], self._next_date)
+        labelled = set(results['code'])
+        keep = np.array([continuous and code in labelled and calendar.next(code, self.date) == self._next_date
+                         for code in codes], dtype=bool)
+
+        self._codes = [code for code, ok in zip(codes, keep) if ok]
+        self._dropped = sorted((set(trading_codes) | set(dropped)) - set(self._codes))
+        if len(self._codes) == 0:
+            return None
+
+        self._times = times[keep]
+        self._scaling_stats = stats.reindex(self._codes).astype(np.float64)
+        self._results = results[results['code'].isin(self._codes)].reset_index(drop=True)
+        self._data = {field: values[keep] for field, values in data.items()}
+        return self._data
+
+    def _existing_codes(self, table, dup_op):
+        # 目标表里当天已经有记录的股票, replace 时删除矩阵里的股票的记录并返回空集合
+        if table == TABLE_NAME_5MIN_RESULT:
+            condition = "`date`='{}'".format(self.date)
+        else:
+            condition = "`time`>='{}' AND `time`<='{}'".format(self.date, self.date + timedelta(days=1))
+        rs = self.db.execute(
+            "SELECT DISTINCT `code` FROM {0} WHERE {1} {2}".format(table, condition, self._code_query()))
+        existing = set(row[0] for row in rs.fetchall())
+        if dup_op == 'replace':
+            existing &= set(self._codes)
+            if len(existing) > 0:
+                self.db.execute("DELETE FROM {0} WHERE {1} AND `code` in ('{2}')".format(
+                    table, condition, "','".join(sorted(existing))))
+                self.db.commit()
+            return set()
+        return existing
+
+    def _get_features(self):
+        # 矩阵里所有股票当天的指标, 特征和缩放两个阶段共用
+        if self._features is None:
+            self._features = unstack_features(self._codes, self._times, self._data, self.date)
+        return self._features
+
+    def transform(self, dup_op="skip"):
+        # 依次执行三个阶段, 与 Transform5M.transform 相同
+        self.extract_features(dup_op=dup_op)
+        self.feature_scaling(dup_op=dup_op)
+        self.extract_results(dup_op=dup_op)
+        return
+
+    def extract_features(self, dup_op="skip"):
+        if self._feature_extracted_data is not None:
+            return self._feature_extracted_data
+
+        if self.prepare_data() is None:
+            return
+
+        # check duplicate
+        # 看一下目标表 当天已经有哪些股票的记录, 如果需要替换, 那就删掉表里的记录重生成
+        df = self._get_features()
+        df = df[~df['code'].isin(self._existing_codes(TABLE_NAME_5MIN_EXTRACTED, dup_op))]
+        self._feature_extracted_data = df
+        if not df.empty:
+            write_table(TABLE_NAME_5MIN_EXTRACTED, df, self.writer)
+        return df
+
+    def feature_scaling(self, dup_op="skip"):
+        if self._feature_scaled_data is not None:
+            return self._feature_scaled_data
+
+        if self.prepare_data() is None:
+            return
+
+        df = self._get_features()
+        df = df[~df['code'].isin(self._existing_codes(TABLE_NAME_5MIN_SCALED, dup_op))]
+        if not df.empty:
+            # 每只股票使用自己的缩放样本
+            stats = self._scaling_stats.reindex(df['code'])
+            stats = {name: stats[name].values for name in FeatureScaling.STATS}
+            df = FeatureScaling.scale(df, FeatureScaling.SPEC_5M, stats)
+
+        # 重新排序一下列的顺序
+        df = df[['code', 'time'] + Engine.FEATURES]
+        self._feature_scaled_data = df
+        if not df.empty:
+            write_table(TABLE_NAME_5MIN_SCALED, df, self.writer)
+        return df
+
+    def extract_results(self, dup_op="skip"):
+        if self._result_data is not None:
+            return self._result_data
+
+        if self.prepare_data() is None:
+            return
+
+        df = self._results
+        df = df[~df['code'].isin(self._existing_codes(TABLE_NAME_5MIN_RESULT, dup_op))]
+        self._result_data = df
+        if not df.empty:
+            write_table(TABLE_NAME_5MIN_RESULT, df, self.writer)
+        return df
+
+
+def process_date_range(start_date, end_date, dup="skip", resume=True, retry_failed=False):
+    # 与 Transform5M.process_date_range 一样不包括 end_date, 使用同一份完成清单
+    # 每个交易日先在矩阵里处理K线完整的股票, 其余的股票由 Transform5M.process_single_shot 逐只处理
+    import Common.config as config
+    last_date = end_date - timedelta(days=1)
+    session = sessionmaker()
+    session.configure(bind=config.DB_CONN)
+    s = session()
+    writer = BulkWriter()
+
+    # 交易日历和缩放统计值只准备一次, 逐只处理的股票也使用同一份日历
+    calendar = TradingCalendar.load(s, start_date, last_date)
+    install(calendar)
+    manifest = TransformManifest().load(calendar.codes)
+    ScalingStats.build(s, calendar, writer, start_date, last_date, offset=SAMPLE_DATE_OFFSET, bias=SAMPLE_DATE_BIAS)
+    writer.flush()
+
+    for the_date in calendar.dates(None, start_date, last_date):
+        codes = [code for code in calendar.codes if calendar.is_trading_date(code, the_date)]
+        if resume and dup != 'replace':
+            codes = [code for code in codes if len(manifest.pending(code, [the_date], retry_failed)) > 0]
+        if len(codes) == 0:
+            continue
+
+        print("Transforming market data: {}\t".format(the_date), end="")
+        sys.stdout.flush()
+        # 每只股票的 (完成的阶段数, 失败原因)
+        outcomes = {}
+        t = Transform5MMarket(the_date, codes)
+        t.db = s
+        t.writer = writer
+        t.calendar = calendar
+        try:
+            t.transform(dup_op=dup)
+            outcomes.update((code, (3, None)) for code in t.codes())
+            dropped = t.dropped()
+        except NotReadyError as e:
+            # 下一个交易日的数据还没有导入, 不做记录
+            print(" - {}".format(e))
+            continue
+        except RuntimeError as e:
+            print(" - {}".format(e), end="")
+            dropped = codes
+
+        for code in dropped:
+            _, completed, reason = Transform5M.process_single_shot(code, the_date, dup, db=s, writer=writer)
+            outcomes[code] = (completed, reason)
+
+        # 写入数据库之后才记入清单
+        writer.flush()
+        for code, (completed, reason) in outcomes.items():
+            manifest.record(code, [(the_date, completed, reason)])
+            manifest.save(code)
+        print(" - {} stocks by market, {} stocks one by one".format(len(outcomes) - len(dropped), len(dropped)))
+
+    s.close()
+    return
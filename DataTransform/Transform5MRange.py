@@ -0,0 +1,351 @@
+# 按日期区间处理一只股票
+# Transform5M 每个 (股票, 日期) 都要单独查询一次数据库, 并在之前几个交易日和当天的K线上重新计算指标, 同一根K线会被处理多次
+# Transform5MRange 一次读取整个区间的K线, 包括指标和缩放样本需要的之前的数据, 以及标签需要的下一个交易日,
+# 在连续的序列上计算一次指标, 再输出区间内每一天的 feature_extracted / feature_scaled / result 记录
+#
+# 哪些日期会输出与 Transform5M 的规则相同:
+#   之前有足够的交易日, 有下一个交易日, 且与下一个交易日的间隔不超过一周 (最长的假期也就是黄金周)
+#   当天正好 48 根K线, 缩放样本 (提前 SAMPLE_DATE_BIAS 天的 SAMPLE_DATE_OFFSET 天) 内有数据
+#   下一个交易日上午有K线, 可以算出所有标签
+# 递推的指标 (EMA, MACD, KDJ, DMI) 在连续的序列上计算, 不会每天从窗口开头重新递推, 因此与逐日的结果有很小的差别
+
+from datetime import timedelta
+from sqlalchemy.orm import sessionmaker
+from time import perf_counter
+import Common.config as config
+import numpy as np
+import pandas as pd
+import sys, traceback
+
+from FeatureExtractor import Engine
+from DataTransform import LookbackPlanner, FeatureScaling, ResultLabels, WorkerPool
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+from DataCache.IndicatorCache import IndicatorCache
+from DataCache import ScalingStats
+from DataCache.TransformManifest import TransformManifest
+from DataCache.TradingCalendar import TradingCalendar, installed
+from DataTransform.Transform5M import TABLE_NAME_DAILY, TABLE_NAME_5MIN, TABLE_NAME_5MIN_EXTRACTED, \
+    TABLE_NAME_5MIN_SCALED, TABLE_NAME_5MIN_RESULT, SAMPLE_DATE_OFFSET, SAMPLE_DATE_BIAS, \
+    write_table
+from DataTransform.BulkWriter import process_writer
+
+CHUNK_DAYS = 120  # 每个任务处理的交易日数, 比 Transform5M 的块大, 摊薄每个任务多读的样本和回看K线
+RAW_COLUMNS = ['code', 'time', 'open', 'high', 'low', 'close', 'vol', 'amount', 'count']
+
+
+class Transform5MRange:
+    db = None
+    writer = None  # BulkWriter, 为空时每次直接 to_sql
+    calendar = None  # TradingCalendar
+
+    def __init__(self, code, start_date, end_date):
+        # 处理 [start_date, end_date] 之间的交易日
+        self.code = code
+        self.start_date = start_date
+        self.end_date = end_date
+        self._trading_dates = None
+        self._data = None
+        self._daily_df = None
+        self._dates = None
+        self._scaling_stats = None
+        self._features = None
+        self._feature_extracted_data = None
+        self._feature_scaled_data = None
+        self._result_data = None
+        return
+
+    def _get_calendar(self):
+        # 进程池里使用 install 的日历, 单独运行时只加载这只股票的交易日
+        if self.calendar is None:
+            self.calendar = installed()
+        if self.calendar is None:
+            self.calendar = TradingCalendar.load(self.db, codes=[self.code])
+        return self.calendar
+
+    def _get_trading_dates(self):
+        # 区间之前指标需要的交易日, 区间内的交易日和区间之后的第一个交易日, 按日期升序
+        if self._trading_dates is not None:
+            return self._trading_dates
+
+        calendar = self._get_calendar()
+        if len(calendar.dates(self.code, self.start_date, self.end_date)) == 0:
+            raise RuntimeError('No trading date for {} from {} to {}'.format(
+                self.code, self.start_date, self.end_date))
+
+        lookback_days = LookbackPlanner.lookback_days(Engine.FEATURES)
+        self._trading_dates = calendar.window(self.code, self.start_date, self.end_date,
+                                              before=lookback_days, after=1)
+        return self._trading_dates
+
+    def prepare_data(self):
+        # 一次读取所有需要的5分钟K线和每天的流通股手数, 以 time 为索引
+        if self._data is not None:
+            return self._data
+
+        trading_dates = self._get_trading_dates()
+        first_date = min(trading_dates[0], self.start_date - timedelta(days=SAMPLE_DATE_OFFSET + SAMPLE_DATE_BIAS))
+
+        rs = self.db.execute(
+            "SELECT `date`, ROUND((`traded_market_value`/`close`)) as total_vol "
+            "FROM {0} "
+            "WHERE `code`='{1}' AND `date`>='{2}' AND `date`<='{3}' "
+            "ORDER BY `date` ASC".format(
+                TABLE_NAME_DAILY, self.code, first_date, trading_dates[-1]))
+        daily_df = pd.DataFrame(rs.fetchall())
+        daily_df.columns = ['date', 'total_vol']
+        daily_df = daily_df.set_index(['date'], drop=True)
+
+        rs = self.db.execute(
+            "SELECT * "
+            "FROM {0} "
+            "WHERE `code`='{1}' AND `time`>='{2}' AND `time`<='{3}' "
+            "ORDER BY time ASC".format(
+                TABLE_NAME_5MIN, self.code, first_date, trading_dates[-1] + timedelta(days=1)))
+        df = pd.DataFrame(rs.fetchall())
+        if df.empty:
+            raise RuntimeError("No 5 minutes data for {} from {} to {}".format(
+                self.code, self.start_date, self.end_date))
+        df.columns = RAW_COLUMNS
+        df['time'] = pd.to_datetime(df['time'])
+        df = df.set_index(['time'], drop=True)
+        df = df.drop(labels='code', axis=1)
+        df['date'] = [time.date() for time in df.index.tolist()]
+
+        # 没有日线记录的日期换手率为 nan
+        self._daily_df = daily_df.reindex(sorted(set(df['date']) | set(daily_df.index)))
+        self._data = df
+        return self._data
+
+    def _get_dates(self):
+        # 区间内可以输出的交易日, 同时求出每一天的缩放样本统计值
+        if self._dates is not None:
+            return self._dates
+
+        trading_dates = self._get_trading_dates()
+        df = self.prepare_data()
+        lookback_days = LookbackPlanner.lookback_days(Engine.FEATURES)
+
+        # 每一天的缩放样本统计值, 与 Transform5M.prepare_data 的聚合查询相同
+        daily_stats = ScalingStats.daily_aggregates(df)
+        sample_stats = ScalingStats.rolling_stats(daily_stats, trading_dates, SAMPLE_DATE_OFFSET, SAMPLE_DATE_BIAS)
+
+        dates = []
+        next_dates = []
+        self._scaling_stats = {}
+        for i, date in enumerate(trading_dates):
+            if date < self.start_date or date > self.end_date:
+                continue
+            if i < lookback_days or i + 1 >= len(trading_dates):
+                continue
+            shifted_date = trading_dates[i - lookback_days]
+            next_trading_date = trading_dates[i + 1]
+            if (next_trading_date - date).days > 7 or (next_trading_date - shifted_date).days > 7:
+                continue
+            if date not in daily_stats.index or daily_stats.loc[date, 'bars'] != BARS_PER_DAY:
+                continue
+            stats = sample_stats.loc[date]
+            if stats.isnull().any():
+                continue
+            dates.append(date)
+            next_dates.append(next_trading_date)
+            self._scaling_stats[date] = stats.to_dict()
+
+        # 当天上午/下午和下一个交易日上午都要有K线, 否则算不出标签, 三个阶段都不输出
+        keep = ResultLabels.complete(ResultLabels.day_summary(df.reset_index()), dates, next_dates)
+        dates = [date for date, ok in zip(dates, keep) if ok]
+        self._dates = dates
+        return self._dates
+
+    def outcomes(self):
+        # 区间内每个交易日的 (日期, 完成的阶段数, 原因), 记入完成清单
+        # 最后一个交易日还没有下一个交易日的数据, 不做记录, 下次转换时重试
+        trading_dates = self._get_trading_dates()
+        dates = set(self._get_dates())
+        outcomes = []
+        for date in trading_dates[:-1]:
+            if self.start_date <= date <= self.end_date:
+                outcomes.append((date, 3, None) if date in dates else
+                                (date, 0, 'Not enough data to transform {} at {}'.format(self.code, date)))
+        return outcomes
+
+    def _existing_dates(self, table, dup_op):
+        # 目标表里区间内已经有记录的日期, replace 时删除这些记录并返回空集合
+        if table == TABLE_NAME_5MIN_RESULT:
+            column, end = 'date', self.end_date
+        else:
+            column, end = 'time', self.end_date + timedelta(days=1)
+
+        if dup_op == 'replace':
+            self.db.execute(
+                "DELETE FROM {0} WHERE `code`='{1}' AND `{2}`>='{3}' AND `{2}`<='{4}'".format(
+                    table, self.code, column, self.start_date, end))
+            self.db.commit()
+            return set()
+
+        rs = self.db.execute(
+            "SELECT DISTINCT `{2}` "
+            "FROM {0} "
+            "WHERE `code`='{1}' AND `{2}`>='{3}' AND `{2}`<='{4}'".format(
+                table, self.code, column, self.start_date, end))
+        return set(pd.to_datetime([row[0] for row in rs.fetchall()]).date)
+
+    def _get_features(self, use_cache=True):
+        # 在整段K线上计算一次指标, 只保留可以输出的日期
+        if self._features is not None:
+            return self._features
+
+        dates = self._get_dates()
+        df = self.prepare_data().copy()
+        rows = df['date'].isin(dates).values
+        cache = IndicatorCache(self.code) if use_cache else None
+        df = Engine.calculate(df, self._daily_df, cache=cache, cache_rows=rows)
+
+        # 与 Transform5M.extract_features 相同的列顺序
+        df['code'] = self.code
+        df['time'] = df.index
+        columns = ['code', 'time'] + df.columns.tolist()[:len(df.columns.tolist()) - 2]
+        self._features = df[columns][rows]
+        return self._features
+
+    def extract_features(self, dup_op="skip", use_cache=True):
+        if self._feature_extracted_data is not None:
+            return self._feature_extracted_data
+
+        df = self._get_features(use_cache)
+        df = df[~df['date'].isin(self._existing_dates(TABLE_NAME_5MIN_EXTRACTED, dup_op))]
+        self._feature_extracted_data = df
+        if not df.empty:
+            write_table(TABLE_NAME_5MIN_EXTRACTED, df, self.writer)
+        return df
+
+    def feature_scaling(self, dup_op="skip", use_cache=True):
+        if self._feature_scaled_data is not None:
+            return self._feature_scaled_data
+
+        df = self._get_features(use_cache)
+        df = df[~df['date'].isin(self._existing_dates(TABLE_NAME_5MIN_SCALED, dup_op))]
+        if not df.empty:
+            # 每一天使用自己的缩放样本
+            stats = pd.DataFrame([self._scaling_stats[date] for date in df['date']])
+            stats = {name: stats[name].values for name in stats.columns}
+            df = FeatureScaling.scale(df, FeatureScaling.SPEC_5M, stats)
+
+        # 重新排序一下列的顺序
+        df = df[['code', 'time'] + Engine.FEATURES]
+        self._feature_scaled_data = df
+        if not df.empty:
+            write_table(TABLE_NAME_5MIN_SCALED, df, self.writer)
+        return df
+
+    def extract_results(self, dup_op="skip"):
+        if self._result_data is not None:
+            return self._result_data
+
+        dates = self._get_dates()
+        trading_dates = self._get_trading_dates()
+        existing = self._existing_dates(TABLE_NAME_5MIN_RESULT, dup_op)
+        dates = [date for date in dates if date not in existing]
+        next_dates = [trading_dates[trading_dates.index(date) + 1] for date in dates]
+        bars = self.prepare_data().reset_index()
+        result_df = ResultLabels.results(self.code, bars, dates, next_dates)
+
+        self._result_data = result_df
+        if not result_df.empty:
+            write_table(TABLE_NAME_5MIN_RESULT, result_df, self.writer)
+        return result_df
+
+
+def process_date_range(start_date, end_date, dup="skip", workers=WorkerPool.WORKERS,
+                       max_tasks_per_child=WorkerPool.MAX_TASKS_PER_CHILD, chunk_days=CHUNK_DAYS,
+                       resume=True, retry_failed=False):
+    # 与 Transform5M.process_date_range 一样不包括 end_date, 使用同一份完成清单
+    # 每个任务处理一只股票 chunk_days 个交易日, 样本统计和指标回看的K线在任务内一次读出, 块越大重复读取越少
+    # 块内夹着已经完成的日期时, 由 _existing_dates 跳过它们
+    last_date = end_date - timedelta(days=1)
+    calendar = TradingCalendar.load(None, start_date, last_date)
+    manifest = TransformManifest().load(calendar.codes)
+    select = None
+    if resume and dup != 'replace':
+        def select(code, dates):
+            return manifest.pending(code, dates, retry_failed)
+    tasks = WorkerPool.chunk_tasks(calendar, calendar.codes, start_date, last_date, chunk_days, select)
+
+    stock_count = len(set(code for code, _ in tasks))
+    print("Transforming data: {} - {}\t - {} stocks found, {} tasks".format(start_date, end_date, stock_count,
+                                                                          len(tasks)))
+    if stock_count == 0:
+        return []
+
+    def record(status):
+        manifest.record(status.code, status.outcomes)
+        manifest.save(status.code)
+
+    with WorkerPool.WorkerPool(calendar, workers, max_tasks_per_child) as pool:
+        print("{} processes will be used for processing".format(pool.workers))
+        statuses = pool.run(process_block, tasks, callback=record, dup=dup)
+    return statuses
+
+
+def process_block(code, dates, dup="skip"):
+    # 进程池任务: 一次处理一只股票连续的多个交易日, 处理完写入数据库, 返回 TaskStatus
+    started = perf_counter()
+    status, outcomes = process_single_shot(code, dates[0], dates[-1], dup)
+    process_writer().flush()
+    done = sum(1 for _, completed, _ in outcomes if completed == 3)
+    failed = len(outcomes) if status == 'failed' else 0
+    return WorkerPool.TaskStatus(code, dates[0], dates[-1], done, len(outcomes) - done - failed, failed,
+                                 perf_counter() - started, outcomes)
+
+
+proc_db = None
+
+
+def process_single_shot(code, start_date, end_date, dup="skip", db=None, writer=None):
+    own_session = False
+    global proc_db
+    if proc_db is not None:
+        db = proc_db
+    elif db is None:
+        session = sessionmaker()
+        session.configure(bind=config.DB_CONN)
+        db = session()
+        proc_db = db
+        own_session = True
+    if writer is None:
+        writer = process_writer()
+
+    # 返回 (状态, 每个交易日的 (日期, 完成的阶段数, 失败原因)), 出错时区间内的每一天都记为同样的结果
+    status = 'done'
+    completed = 0
+    reason = None
+    outcomes = None
+    t = Transform5MRange(code, start_date, end_date)
+    try:
+        t.db = db
+        t.writer = writer
+        t.extract_features(dup_op=dup)
+        completed = 1
+        t.feature_scaling(dup_op=dup)
+        completed = 2
+        t.extract_results(dup_op=dup)
+        completed = 3
+        outcomes = t.outcomes()
+    except RuntimeError as e:
+        status = 'skipped'
+        reason = str(e)
+    except Exception as e:
+        status = 'failed'
+        reason = "{}: {}".format(type(e).__name__, e)
+        print("\n\n\n")
+        print("Code: {}\tDate: {} - {}".format(code, start_date, end_date))
+        print(e)
+        tb = sys.exc_info()[2]
+        traceback.print_tb(tb)
+
+    if own_session == True:
+        db.close()
+    if outcomes is None:
+        calendar = t.calendar if t.calendar is not None else installed()
+        dates = calendar.dates(code, start_date, end_date) if calendar is not None else []
+        outcomes = [(date, completed, reason) for date in dates]
+    return status, outcomes
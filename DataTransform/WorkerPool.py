@@ -0,0 +1,116 @@
+# 转换任务的进程池
+# 整个日期区间只启动一个进程池, 任务按 (股票, 一段交易日) 分块, 不再每天新建一个进程池, 也没有每天结束时的等待
+#
+# worker 启动时:
+#   - 换掉从父进程 fork 过来的数据库连接池 (不关闭父进程的连接), worker 里的会话使用自己的连接
+#   - install 交易日历, 任务里查交易日不再访问数据库
+# 两种用法:
+#   run(): 每个任务在 worker 里读取, 计算并写入数据库, 只返回一条很小的 TaskStatus 记录 (Transform5MRange)
+#   apply_async(): 只做计算的任务, 读好的数据传给 worker, 算出的 DataFrame 传回主进程写入 (见 Pipeline, Transform5M),
+#                  多了 pickle 的开销, 换来 worker 不等待数据库
+# maxtasksperchild 让 worker 处理一定数量的任务后重启, 释放长时间运行累积的内存
+
+import sys
+import time
+import multiprocessing as mp
+from collections import namedtuple
+from DataCache.TradingCalendar import install
+
+WORKERS = None  # 默认为 CPU 数
+MAX_TASKS_PER_CHILD = 50
+CHUNK_DAYS = 20  # 每个任务处理一只股票的多少个交易日
+
+# 一个任务的结果: done 为处理完的日期数, skipped 为数据不足跳过的日期数, failed 为出错的日期数
+# outcomes 为每天的 (日期, 完成的阶段数, 失败原因), 由主进程记入 TransformManifest
+TaskStatus = namedtuple('TaskStatus', ['code', 'start_date', 'end_date', 'done', 'skipped', 'failed', 'seconds',
+                                       'outcomes'], defaults=((),))
+
+
+def _init_worker(calendar):
+    # fork 继承的连接池不能在子进程里继续使用, 换一个新的连接池, 父进程的连接保持不动
+    # 父进程没有导入数据库配置时 (只做计算的进程池) 没有需要更换的连接
+    config = sys.modules.get('Common.config')
+    if config is not None:
+        try:
+            config.DB_CONN.dispose(close=False)
+        except TypeError:  # SQLAlchemy < 1.4.33
+            config.DB_CONN.pool = config.DB_CONN.pool.recreate()
+    if calendar is not None:
+        install(calendar)
+
+
+def chunk_tasks(calendar, codes, start_date, end_date, chunk_days=CHUNK_DAYS, select=None):
+    # 把每只股票 [start_date, end_date] 内的交易日按 chunk_days 分块, 返回 [(code, [日期])]
+    # 先按时间段再按股票排列, 前面的日期先处理完
+    # select(code, dates) 返回需要处理的日期, 例如 TransformManifest.pending, 只安排还没有完成的工作
+    blocks = {}
+    for code in codes:
+        dates = calendar.dates(code, start_date, end_date)
+        if select is not None:
+            dates = select(code, dates)
+        for i in range(0, len(dates), chunk_days):
+            blocks.setdefault(i, []).append((code, dates[i:i + chunk_days]))
+    return [task for i in sorted(blocks) for task in blocks[i]]
+
+
+def print_progress(statuses, count, started):
+    print(">> Processing ... {}%\t\tCode: {} [{}/{}]  {:.0f}s  \r".format(
+        round(len(statuses) / count * 100, 1), statuses[-1].code, len(statuses), count,
+        time.time() - started), end="")
+    sys.stdout.flush()
+
+
+def print_summary(statuses, count):
+    if count > 0:
+        print(" " * 100 + "\r", end="")
+        print(">> {} tasks done, {} days processed, {} skipped, {} failed".format(
+            count, sum(s.done for s in statuses), sum(s.skipped for s in statuses),
+            sum(s.failed for s in statuses)))
+
+
+def _run_task(args):
+    func, code, dates, kwargs = args
+    return func(code, dates, **kwargs)
+
+
+class WorkerPool:
+
+    def __init__(self, calendar=None, workers=WORKERS, max_tasks_per_child=MAX_TASKS_PER_CHILD):
+        self.workers = workers if workers is not None else mp.cpu_count()
+        self._pool = mp.Pool(processes=self.workers, initializer=_init_worker, initargs=(calendar,),
+                             maxtasksperchild=max_tasks_per_child)
+        self.lost = 0  # 等不到结果的任务数 (worker 被杀死或超时), 由 Pipeline 计数
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        # close + join 让 worker 正常退出, 进程级的 BulkWriter 才会写入剩下的记录
+        # 有任务丢失时 join 会一直等待它的结果, 只能 terminate (Pipeline 的 worker 没有待写入的记录)
+        if self.lost > 0:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+
+    def run(self, func, tasks, callback=None, **kwargs):
+        # func(code, dates, **kwargs) 返回 TaskStatus, 必须是模块级函数; 按完成顺序显示进度, 返回所有 TaskStatus
+        # callback(status) 在主进程里对每个完成的任务调用一次
+        count = len(tasks)
+        statuses = []
+        started = time.time()
+        for status in self._pool.imap_unordered(_run_task, [(func, code, dates, kwargs) for code, dates in tasks]):
+            statuses.append(status)
+            if callback is not None:
+                callback(status)
+            print_progress(statuses, count, started)
+        print_summary(statuses, count)
+        return statuses
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        # 单个任务, 给 Pipeline 的计算阶段和 DatasetBuilder.stream 使用
+        return self._pool.apply_async(func, args, callback=callback, error_callback=error_callback)
@@ -5,33 +5,32 @@
 
 import pandas as pd
 import numpy as np
+from Common.MathFunctions import shift
+from Common.RollingWindow import rolling_mean, lag
 
+INPUTS = ['open', 'high', 'low', 'close']
+OUTPUTS = ['ar', 'br']
+LOOKBACK = 27
 
-def calculate(df):
+
+def compute(open, high, low, close):
     # n = 26
     # ar = ma(high - open, n) / ma(open - low ,n )* 100
     # br = ma(high - close_last,n) / ma(close_last - low, n)* 100
 
     n = 26
-    ar_list = []
-    br_list = []
-
-    for i in range(0, df.shape[0]):
-        ma_open = np.mean(df.iloc[i - n:i, df.columns.get_loc('open')])
-        ma_high = np.mean(df.iloc[i - n:i, df.columns.get_loc('high')])
-        ma_low = np.mean(df.iloc[i - n:i, df.columns.get_loc('low')])
-        ma_close_last = np.mean(df.iloc[i - n - 1:i - 1, df.columns.get_loc('close')])
+    ma_open = lag(rolling_mean(open, n))
+    ma_high = lag(rolling_mean(high, n))
+    ma_low = lag(rolling_mean(low, n))
+    ma_close_last = shift(lag(rolling_mean(close, n)), 1)
 
-        ar, br = 0, 0
-        if (ma_open - ma_low) != 0:
-            ar = (ma_high - ma_open) / (ma_open - ma_low) * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ar = np.where((ma_open - ma_low) != 0, (ma_high - ma_open) / (ma_open - ma_low) * 100, 0)
+        br = np.where((ma_close_last - ma_low) != 0, (ma_high - ma_close_last) / (ma_close_last - ma_low) * 100, 0)
+    return {'ar': ar, 'br': br}
 
-        if (ma_close_last - ma_low) != 0:
-            br = (ma_high - ma_close_last) / (ma_close_last - ma_low) * 100
 
-        ar_list.append(ar)
-        br_list.append(br)
-
-    df['ar'] = pd.Series(ar_list, index=df.index)
-    df['br'] = pd.Series(br_list, index=df.index)
+def calculate(df):
+    for name, values in compute(df['open'], df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -3,60 +3,52 @@
 
 import pandas as pd
 import numpy as np
+from Common.MathFunctions import shift
+from Common.RollingWindow import rolling_sum, lag
+
+ASI_STEPS = [5, 15, 25, 40]
+INPUTS = ['open', 'high', 'low', 'close']
+OUTPUTS = ['asi_' + str(step) for step in ASI_STEPS]
+LOOKBACK = 41
+
+
+def compute(open, high, low, close):
+    open = np.asarray(open, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    close_last = shift(close, 1)
+    open_last = shift(open, 1)
+    low_last = shift(low, 1)
+
+    a = np.abs(high - close_last)
+    b = np.abs(low - close_last)
+    c = np.abs(high - low_last)
+    d = np.abs(close_last - open_last)
+
+    max_v = np.max([a, b, c], axis=0)
+    r = np.where(max_v == a, a + 0.5 * b + 0.25 * d,
+                 np.where(max_v == b, b + 0.5 * a + 0.25 * d, c + 0.25 * d))
+    e = close - close_last
+    f = close - open
+    g = close_last - open_last
+    x = e + 0.5 * f + g
+    k = np.maximum(a, b)
+    l = 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        si = np.where((r == 0) | (k == 0), 0, 50 * x / r * k / l)
+    si[..., 0] = 0
+
+    result = {}
+    for step in ASI_STEPS:
+        asi_n = lag(rolling_sum(si, step))
+        # 不足N根K线的部分没有数据
+        asi_n[..., :step] = 0
+        result['asi_' + str(step)] = asi_n
+    return result
 
 
 def calculate(df):
-    si_list = []
-
-    asi_steps = [5, 15, 25, 40]
-    asi_matrix = np.zeros((len(asi_steps), df.shape[0]), dtype=np.float32)
-
-    for i in range(0, df.shape[0]):
-        open = df.iloc[i, df.columns.get_loc('open')]
-        high = df.iloc[i, df.columns.get_loc('high')]
-        low = df.iloc[i, df.columns.get_loc('low')]
-        close = df.iloc[i, df.columns.get_loc('close')]
-
-        close_last = df.iloc[i - 1:i, df.columns.get_loc('close')]
-        open_last = df.iloc[i - 1:i, df.columns.get_loc('open')]
-        low_last = df.iloc[i - 1:i, df.columns.get_loc('low')]
-
-        if i == 0:
-            si_list.append(0)
-            continue
-
-        a = float(np.abs(high - close_last))
-        b = float(np.abs(low - close_last))
-        c = float(np.abs(high - low_last))
-        d = float(np.abs(close_last - open_last))
-
-        max_v = np.max([a, b, c])
-        if max_v == a:
-            r = a + 0.5 * b + 0.25 * d
-        elif max_v == b:
-            r = b + 0.5 * a + 0.25 * d
-        elif max_v == c:
-            r = c + 0.25 * d
-        e = close - close_last
-        f = close - open
-        g = close_last - open_last
-        x = e + 0.5 * f + g
-        k = np.max([a, b])
-        l = 3
-        if r == 0 or k == 0:
-            si = 0
-        else:
-            si = 50 * x / r * k / l
-            si = float(si)
-        si_list.append(si)
-
-    for i in range(0, df.shape[0]):
-        for j in range(0, len(asi_steps)):
-            step = asi_steps[j]
-            asi_n = np.sum(si_list[i - step:i])
-            asi_matrix[j, i] = asi_n
-
-    for i in range(0, len(asi_steps)):
-        step = asi_steps[i]
-        df['asi_' + str(step)] = pd.Series(asi_matrix[i], index=df.index)
+    for name, values in compute(df['open'], df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -2,23 +2,32 @@
 
 import pandas as pd
 import numpy as np
+from Common.RollingWindow import rolling_means, lag
 
-def calculate(df):
+BIAS_STEPS = [5, 10, 30]
+PREFIX = 'bias_'
+INPUTS = ['close']
+OUTPUTS = [PREFIX + str(step) for step in BIAS_STEPS]
+LOOKBACK = 30
+
+
+def compute(close, steps=BIAS_STEPS):
     # N日BIAS=（当日收盘价—N日移动平均价）÷N日移动平均价×100
 
-    bias_steps = [5, 10, 30]
-    bias_matrix = np.zeros((len(bias_steps), df.shape[0]), dtype=np.float32)
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+    for step, close_mean_n in rolling_means(close, steps).items():
+        close_mean_n = lag(close_mean_n)
+        result[PREFIX + str(step)] = (close - close_mean_n) / close_mean_n * 100
+    return result
 
-    for i in range(0, df.shape[0]):
-        close = df.iloc[i, df.columns.get_loc('close')]
-        for j in range(0, len(bias_steps)):
-            step = bias_steps[j]
 
-            close_mean_n = np.mean(df.iloc[i - step:i, df.columns.get_loc('close')])
-            bias_n = (close - close_mean_n) / close_mean_n * 100
-            bias_matrix[j, i] = bias_n
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
 
-    for i in range(0, len(bias_steps)):
-        step = bias_steps[i]
-        df['bias_' + str(step)] = pd.Series(bias_matrix[i], index=df.index)
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -1,9 +1,14 @@
 import pandas as pd
 import numpy as np
-import math
+from Common.MathFunctions import lag_windows
+from Common.RollingWindow import rolling_mean, lag
 
+INPUTS = ['close']
+OUTPUTS = ['boll_up', 'boll_md', 'boll_dn']
+LOOKBACK = 21
 
-def calculate(df):
+
+def compute(close):
     # （1）计算MA
     # MA = N日内的收盘价之和÷N
     # （2）计算标准差MD
@@ -16,21 +21,20 @@ def calculate(df):
 
     n = 20
     k = 2
-    mb_list, up_list, dn_list = [],[],[]
-    for i in range(0, df.shape[0]):
-        ma = np.mean(df.iloc[i - n:i, df.columns.get_loc('close')])
-        c = np.sum((df.iloc[i - n - 1:i, df.columns.get_loc('close')] - ma) ** 2) / n
-        md = math.sqrt(c)
+    ma = lag(rolling_mean(close, n))
+    close_n = lag_windows(close, n + 1)
+    c = np.sum((close_n - ma[..., None]) ** 2, axis=-1) / n
+    md = np.sqrt(c)
 
-        mb = np.mean(df.iloc[i - n - 1:i, df.columns.get_loc('close')])
-        up = mb + k * md
-        dn = mb - k * md
+    mb = lag(rolling_mean(close, n + 1))
+    return {
+        'boll_up': mb + k * md,
+        'boll_md': mb,
+        'boll_dn': mb - k * md,
+    }
 
-        mb_list.append(mb)
-        up_list.append(up)
-        dn_list.append(dn)
 
-    df['boll_up'] = pd.Series(up_list, index=df.index)
-    df['boll_md'] = pd.Series(mb_list, index=df.index)
-    df['boll_dn'] = pd.Series(dn_list, index=df.index)
-    return df
\ No newline at end of file
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
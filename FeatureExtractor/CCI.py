@@ -1,40 +1,43 @@
 import pandas as pd
 import numpy as np
-import math
+from Common.RollingWindow import rolling_means, rolling_mad, lag
 
+CCI_STEPS = [5, 15, 30]
+PREFIX = 'cci_'
+INPUTS = ['high', 'low', 'close']
+OUTPUTS = [PREFIX + str(step) for step in CCI_STEPS]
+LOOKBACK = 30
 
-def calculate(df):
+
+def compute(high, low, close, steps=CCI_STEPS):
     # TYP: = (HIGH + LOW + CLOSE) / 3;
     # MA = MA(TYP, N))
     # MD = AVEDEV(TYP, N)
     # CCI: (TYP - MA / (0.015 * MD);
 
     magic_rate = 0.015
-    cci_steps = [5, 15, 30]
-    cci_matrix = np.zeros((len(cci_steps), df.shape[0]), dtype=np.float32)
-
-    for i in range(0, df.shape[0]):
-        index = df.index[i]
-        high, low, close = df.loc[index, ['high', 'low', 'close']]
-        # print(index, high, low, close)
-        tp = (high + low + close) / 3
-        for j in range(0, len(cci_steps)):
-            step = cci_steps[j]
-            ma_n = np.sum(np.mean(df.iloc[i - step:i,
-                                  [df.columns.get_loc('high'), df.columns.get_loc('low'),
-                                   df.columns.get_loc('close')]])) / 3
-            tp_n = np.sum(df.iloc[i - step:i,
-                          [df.columns.get_loc('high'), df.columns.get_loc('low'),
-                           df.columns.get_loc('close')]], axis=1) / 3
-            md_n = np.mean(np.abs(tp_n - ma_n))
-
-            p = magic_rate * md_n
-            # print(p)
-            if p > 0:
-                cci_n = (tp - ma_n) / p
-                cci_matrix[j, i] = cci_n
-
-    for i in range(0, len(cci_steps)):
-        step = cci_steps[i]
-        df['cci_' + str(step)] = pd.Series(cci_matrix[i], index=df.index)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    tp = (high + low + close) / 3
+
+    result = {}
+    for step, ma_n in rolling_means(tp, steps).items():
+        ma_n = lag(ma_n)
+        md_n = lag(rolling_mad(tp, step))
+        p = magic_rate * md_n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cci_n = np.where(p > 0, (tp - ma_n) / p, 0)
+        result[PREFIX + str(step)] = cci_n
+    return result
+
+
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
+
+
+def calculate(df):
+    for name, values in compute(df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -3,10 +3,14 @@
 
 import pandas as pd
 import numpy as np
-import math
+from Common.RollingWindow import rolling_mean, rolling_sum_if, rolling_count_if, lag
 
+INPUTS = ['close']
+OUTPUTS = ['dma_dif', 'dma_ama']
+LOOKBACK = 60  # ma50 + dif 的 10 日均线
 
-def calculate(df):
+
+def compute(close):
     # DIF：ma（c，n1）- ma（c，n2）
     # AMA：ma（dif，m）
 
@@ -14,20 +18,18 @@ def calculate(df):
     n2 = 50
     m = 10
 
-    dif_list = []
-    ama_list = []
-
-    idx_close = df.columns.get_loc('close')
-    for i in range(0, df.shape[0]):
-        ma_n1 = float(np.mean(df.iloc[i - n1:i, idx_close]))
-        ma_n2 = float(np.mean(df.iloc[i - n2:i, idx_close]))
-        dif = ma_n1 - ma_n2
-        dif_list.append(dif)
-    df['dma_dif'] = pd.Series(dif_list, index=df.index)
-
-    idx_dif = df.columns.get_loc('dma_dif')
-    for i in range(0, df.shape[0]):
-        ama = float(np.mean(df.iloc[i - m:i, idx_dif]))
-        ama_list.append(ama)
-    df['dma_ama'] = pd.Series(ama_list, index=df.index)
+    dif = lag(rolling_mean(close, n1)) - lag(rolling_mean(close, n2))
+
+    # 前 n2 根K线没有 dif, 均线只取窗口内有数据的部分
+    valid = ~np.isnan(dif)
+    valid_m = lag(rolling_count_if(valid, m, min_periods=1), 1, 0)
+    dif_m = lag(rolling_sum_if(dif, valid, m, min_periods=1), 1, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ama = np.where(valid_m > 0, dif_m / valid_m, np.nan)
+    return {'dma_dif': dif, 'dma_ama': ama}
+
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -4,72 +4,83 @@
 
 import pandas as pd
 import numpy as np
+from Common.MathFunctions import shift, wilder, sma_step, settle_bars
+from Common.RollingWindow import rolling_sum, lag
 
+INPUTS = ['high', 'low', 'close']
+OUTPUTS = ['pdi', 'mdi', 'adx', 'adxr']
+LOOKBACK = 1 + 7 + settle_bars(15, 1) + 21  # pdm/mdm 7 日和 + ADX 初值影响衰减 + adxr 的 21 根
+WINDOW = 7 + 2  # update() 需要之前 7 根K线的 tr/pdm/mdm, 以及再之前一根的价格
 
-def calculate(df):
+
+def compute(high, low, close):
     n = 7
     m = 15
     m2 = 21
-    pdi_list, mdi_list, adx_list, adxr_list = [], [], [], []
-    pdm_list, mdm_list, tr_list, dx_list = [], [], [], []
-
-    for i in range(0, df.shape[0]):
-        high = df.iloc[i, df.columns.get_loc('high')]
-        high_last = df.iloc[i - 1, df.columns.get_loc('high')]
-        low = df.iloc[i, df.columns.get_loc('low')]
-        low_last = df.iloc[i - 1, df.columns.get_loc('low')]
-        close = df.iloc[i, df.columns.get_loc('close')]
-        close_last = df.iloc[i - 1, df.columns.get_loc('close')]
-
-        pdm = high - high_last
-        if pdm <= 0:
-            pdm = 0
-        mdm = low_last - low
-        if mdm <= 0:
-            mdm = 0
-
-        t = []
-        t.append(np.abs(high - close_last))
-        t.append(np.abs(close - low))
-        t.append(np.abs(low - close_last))
-        tr = np.max(t)
-
-        pdm_list.append(pdm)
-        mdm_list.append(mdm)
-        tr_list.append(tr)
-
-    for i in range(0, df.shape[0]):
-        tr_n = np.sum(tr_list[i - n:i])
-        pdm_n = np.sum(pdm_list[i - n:i])
-        mdm_n = np.sum(mdm_list[i - n:i])
-        if tr_n != 0:
-            pdi_n = pdm_n / tr_n
-            mdi_n = mdm_n / tr_n
-        else:
-            pdi_n, mdi_n, tr_n = 0, 0, 0
-        di_sum = pdi_n + mdm_n
-        di_diff = pdi_n - mdm_n
-        dx = np.abs(di_diff - di_sum) * 50
-
-        pdi_list.append(pdi_n)
-        mdi_list.append(mdi_n)
-        dx_list.append(dx)
-
-    for i in range(0, df.shape[0]):
-        if (i - m - 1) > 0:
-            dx = dx_list[i]
-            adx = (np.mean(dx_list[i - m - 1:i - 1]) + dx) / m
-            adx_list.append(adx)
-        else:
-            adx_list.append(0)
-
-    for i in range(0, df.shape[0]):
-        adx = adx_list[i]
-        adxr = (adx_list[i - m2] + adx) / 2
-        adxr_list.append(adxr)
-
-    df['pdi'] = pd.Series(pdi_list, index=df.index)
-    df['mdi'] = pd.Series(mdi_list, index=df.index)
-    df['adx'] = pd.Series(adx_list, index=df.index)
-    df['adxr'] = pd.Series(adxr_list, index=df.index)
+
+    pdi, mdi, dx = _directional(high, low, close, n)
+
+    # adx = (adx_last * (m - 1) + dx) / m
+    adx = wilder(dx, m)
+    adx[..., :m + 2] = 0
+    adxr = (shift(adx, m2) + adx) / 2
+
+    return {'pdi': pdi, 'mdi': mdi, 'adx': adx, 'adxr': adxr}
+
+
+def _directional(high, low, close, n):
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    high_last = shift(high, 1)
+    low_last = shift(low, 1)
+    close_last = shift(close, 1)
+
+    pdm = np.maximum(high - high_last, 0)
+    mdm = np.maximum(low_last - low, 0)
+    tr = np.max([np.abs(high - close_last),
+                 np.abs(close - low),
+                 np.abs(low - close_last)], axis=0)
+
+    # 不足N根K线的部分没有数据
+    tr_n = lag(rolling_sum(tr, n))
+    pdm_n = lag(rolling_sum(pdm, n))
+    mdm_n = lag(rolling_sum(mdm, n))
+    tr_n[..., :n], pdm_n[..., :n], mdm_n[..., :n] = 0, 0, 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pdi = np.where(tr_n != 0, pdm_n / tr_n, 0)
+        mdi = np.where(tr_n != 0, mdm_n / tr_n, 0)
+    di_sum = pdi + mdm_n
+    di_diff = pdi - mdm_n
+    dx = np.abs(di_diff - di_sum) * 50
+    return pdi, mdi, dx
+
+
+def update(state, high, low, close):
+    # 流式计算: 输入截止到最新一根K线, 至少包含 WINDOW 根K线
+    # state 保存上一根K线的 adx 和之前 21 根K线的 adx
+    n = 7
+    m = 15
+    m2 = 21
+
+    bars = state.get('bars', 0)
+    pdi, mdi, dx = _directional(high[..., -WINDOW:], low[..., -WINDOW:], close[..., -WINDOW:], n)
+    adx_smooth = sma_step(dx[..., -1], state.get('adx_smooth'), m, 1)
+    adx = adx_smooth if bars >= m + 2 else 0
+
+    # 不足 21 根K线时没有 adx_last, 按 0 处理
+    history = state.get('adx_history', [])
+    adx_last = history[-m2] if len(history) >= m2 else 0
+    history = (history + [adx])[-m2:]
+
+    state['adx_smooth'] = adx_smooth
+    state['adx_history'] = history
+    state['bars'] = bars + 1
+    return {'pdi': pdi[..., -1], 'mdi': mdi[..., -1], 'adx': adx, 'adxr': (adx_last + adx) / 2}
+
+
+def calculate(df):
+    for name, values in compute(df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -4,10 +4,15 @@
 
 import pandas as pd
 import numpy as np
-import math
+from Common.MathFunctions import shift
+from Common.RollingWindow import rolling_sum, rolling_mean, lag
 
+INPUTS = ['high', 'low', 'vol']
+OUTPUTS = ['emv_emv', 'emv_maemv']
+LOOKBACK = 24  # 1 + em 的 14 日和 + emv 的 9 日均线
 
-def calculate(df):
+
+def compute(high, low, vol):
     # A = (high-low)/2
     # B = (high_last - low_last)/2
     # C = high - low
@@ -20,44 +25,25 @@ def calculate(df):
     n = 14
     m = 9
 
-    em_list = []
-    emv_list = []
-    maemv_list = []
-
-    idx_high = df.columns.get_loc('high')
-    idx_low = df.columns.get_loc('low')
-    idx_vol = df.columns.get_loc('vol')
-
-    for i in range(0, df.shape[0]):
-        high = df.iloc[i, idx_high]
-        high_last = df.iloc[i - 1, idx_high]
-        low = df.iloc[i, idx_low]
-        low_last = df.iloc[i - 1, idx_low]
-        vol = df.iloc[i, idx_vol]
-
-        a = (high - low) / 2
-        b = (high_last - low_last) / 2
-        c = high - low
-        if vol != 0:
-            em = (a - b) * c / vol
-        else:
-            em = 0
-        em *= 1000000
-        em_list.append(em)
-    df['emv_em'] = pd.Series(em_list, index=df.index)
-
-
-    idx_em = df.columns.get_loc('emv_em')
-    for i in range(0, df.shape[0]):
-        emv = np.sum(df.iloc[i - n:i, idx_em])
-        emv_list.append(emv)
-    df['emv_emv'] = pd.Series(emv_list, index=df.index)
-
-    idx_emv = df.columns.get_loc('emv_emv')
-    for i in range(0, df.shape[0]):
-        maemv = float(np.mean(df.iloc[i - m:i, idx_emv]))
-        maemv_list.append(maemv)
-    df['emv_maemv'] = pd.Series(maemv_list, index=df.index)
-
-    df = df.drop(labels="emv_em", axis=1)
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    vol = np.asarray(vol, dtype=np.float64)
+
+    a = (high - low) / 2
+    b = (shift(high, 1) - shift(low, 1)) / 2
+    c = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        em = np.where(vol != 0, (a - b) * c / vol, 0)
+    em *= 1000000
+
+    emv = lag(rolling_sum(em, n))
+    # 不足N根K线的部分没有数据
+    emv[..., :n] = 0
+    maemv = lag(rolling_mean(emv, m))
+    return {'emv_emv': emv, 'emv_maemv': maemv}
+
+
+def calculate(df):
+    for name, values in compute(df['high'], df['low'], df['vol']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
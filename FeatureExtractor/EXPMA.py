@@ -3,30 +3,48 @@
 
 
 import pandas as pd
-import numpy as np
-from Common.MathFunctions import EMA
+from Common.MathFunctions import ema, sma_step, shift, settle_bars
 
+EMA_STEPS = [5, 15, 25, 40]
+PREFIX = 'ema_'
+INPUTS = ['close']
+OUTPUTS = [PREFIX + str(step) for step in EMA_STEPS]
+LOOKBACK = 1 + settle_bars(max(EMA_STEPS) + 1, 2)  # 初值影响衰减到千分之一
+WINDOW = 1  # update() 只用到最新一根K线
 
-def calculate(df):
+
+def compute(close, steps=EMA_STEPS):
     # ema_n = ema_last + 2/(n+1) * (close-ema_last)
 
-    ema_steps = [5, 15, 25, 40]
-    ema_matrix = np.zeros((len(ema_steps), df.shape[0]), dtype=np.float32)
+    # 与均线一样只用到上一根K线的收盘价
+    result = {}
+    for step in steps:
+        ema_n = shift(ema(close, step), 1)
+        # 不足N根K线的部分没有数据
+        ema_n[..., :step] = 0
+        result[PREFIX + str(step)] = ema_n
+    return result
 
-    idx_close = df.columns.get_loc('close')
 
-    for i in range(0, df.shape[0]):
-        for j in range(0, len(ema_steps)):
-            step = ema_steps[j]
-            if len(df.iloc[i - step:i, idx_close]) > 1:
-                ema = EMA(df.iloc[i - step:i, idx_close], step)
-            else:
-                ema = 0
-            ema_matrix[j, i] = ema
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return 1 + settle_bars(max(steps) + 1, 2)
 
-    for i in range(0, len(ema_steps)):
-        step = ema_steps[i]
-        df['ema_' + str(step)] = pd.Series(ema_matrix[i], index=df.index)
 
-    return df
+def update(state, close):
+    # 流式计算: 输入截止到最新一根K线, state 保存上一根K线的 ema, 返回最新一根K线的指标
+    bars = state.get('bars', 0)
+    result = {}
+    for step in EMA_STEPS:
+        name = PREFIX + str(step)
+        last = state.get(name)
+        result[name] = last if bars >= step else 0
+        state[name] = sma_step(close[..., -1], last, step + 1, 2)
+    state['bars'] = bars + 1
+    return result
 
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
@@ -0,0 +1,56 @@
+# 列式指标计算引擎
+# 输入整段 OHLCV 数组, 一次性算出 Transform5M.features() 列出的全部 74 个特征
+# 每个指标模块的 compute() 只接收 numpy 数组, 不再逐行访问 DataFrame
+
+import pandas as pd
+import numpy as np
+from FeatureExtractor import Registry
+
+FEATURES = ["open_vec", "high_vec", "low_vec", "close_vec",
+            "open_change", "high_change", "low_change", "close_change",
+            "ma5", "ma15", "ma25", "ma40",
+            "ema_5", "ema_15", "ema_25", "ema_40",
+            "boll_up", "boll_md", "boll_dn",
+            "turnover", "count",
+            "vol", "vr", "v_ma5", "v_ma15", "v_ma25", "v_ma40",
+            "cci_5", "cci_15", "cci_30",
+            "rsi_6", "rsi_12", "rsi_24",
+            "k9", "d9", "j9",
+            "bias_5", "bias_10", "bias_30",
+            "roc_12", "roc_25",
+            "change", "amplitude", "amplitude_maxb", "amplitude_maxs",
+            "wr_5", "wr_10", "wr_20",
+            "mi_5", "mi_10", "mi_20", "mi_30",
+            "oscv",
+            "dma_dif", "dma_ama",
+            "ar", "br",
+            "pdi", "mdi", "adx", "adxr",
+            "asi_5", "asi_15", "asi_25", "asi_40",
+            "macd_dif", "macd_dea", "macd_bar",
+            "psy", "psy_ma",
+            "emv_emv", "emv_maemv",
+            "wvad", "wvad_ma"
+            ]
+
+
+def compute(open, high, low, close, vol, amount, count, total_vol, features=FEATURES):
+    # 返回 {列名: 数组}, total_vol 为每根K线当天的流通股手数
+    # 只计算 features 依赖到的指标
+    columns = {
+        'open': open, 'high': high, 'low': low, 'close': close,
+        'vol': vol, 'amount': amount, 'count': count, 'total_vol': total_vol,
+    }
+    columns = {k: np.asarray(v, dtype=np.float64) for k, v in columns.items() if v is not None}
+    return Registry.compute(features, columns)
+
+
+def extract(open, high, low, close, vol, amount, count, total_vol, features=FEATURES):
+    # 返回 (K线数, len(features)) 的矩阵, 列顺序与 features 一致
+    columns = compute(open, high, low, close, vol, amount, count, total_vol, features)
+    return np.column_stack([columns[name] for name in features])
+
+
+def calculate(df, daily_df, features=FEATURES, cache=None, cache_rows=None):
+    # 与逐个调用 FeatureExtractor 模块的结果相同, 已经存在的列不会重新计算
+    # cache 为 DataCache.IndicatorCache 时只计算缓存中缺少的指标, 见 Registry.calculate
+    return Registry.calculate(df, daily_df, features, cache, cache_rows)
@@ -1,36 +1,65 @@
 import pandas as pd
 import numpy as np
+from Common.MathFunctions import sma_reset, sma_step, settle_bars
+from Common.RollingWindow import rolling_max, rolling_min, lag
 
+INPUTS = ['high', 'low', 'close']
+OUTPUTS = ['k9', 'd9', 'j9']
+LOOKBACK = 9 + 1 + settle_bars(3, 1)  # RSV 窗口 + K/D 初值影响衰减到千分之一
+WINDOW = 9 + 1  # update() 需要之前 9 根K线的最高/最低价
 
-def calculate(df):
+
+def compute(high, low, close):
     # n日RSV=（Cn－Ln）/（Hn－Ln）×100
+    # K = SMA(RSV, M1, 1)
+    # D = SMA(K, M2, 1)
+    # J = 3K - 2D
 
-    k_list, d_list, j_list = [], [], []
-    k, d, j = 50, 50, 50
     k_n = 9
-    d_n = 3
-    j_n = 3
-
-
-    for i in range(0, df.shape[0]):
-        high = np.max(df.iloc[i - k_n:i, df.columns.get_loc('high')])
-        low = np.min(df.iloc[i - k_n:i, df.columns.get_loc('low')])
-        close = df.iloc[i, df.columns.get_loc('close')]
-
-        if i > n:
-            if high != low:
-                rsv = (close - low) / (high - low) * 100
-                k = 2 / 3 * k_list[i - 1] + 1 / 3 * rsv
-                d = 2 / 3 * d_list[i - 1] + 1 / 3 * k
-                j = 3 * k - 2 * d
-            else:
-                k, d, j = 50, 50, 50
-        k_list.append(k)
-        d_list.append(d)
-        j_list.append(j)
-
-    df['k9'] = pd.Series(k_list, index=df.index)
-    df['d9'] = pd.Series(d_list, index=df.index)
-    df['j9'] = pd.Series(j_list, index=df.index)
+    m1 = 3
+    m2 = 3
+
+    rsv, reset = _rsv(high, low, close, k_n)
+    reset[..., :k_n + 1] = True
+    k = sma_reset(rsv, reset, m1, 1, 50)
+    d = sma_reset(k, reset, m2, 1, 50)
+    j = 3 * k - 2 * d
+
+    return {'k9': k, 'd9': d, 'j9': j}
+
+
+def _rsv(high, low, close, k_n):
+    high_n = lag(rolling_max(high, k_n))
+    low_n = lag(rolling_min(low, k_n))
+    close = np.asarray(close, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (close - low_n) / (high_n - low_n) * 100
+
+    # 最高价等于最低价时 K/D/J 重置为 50, 之后从 50 开始继续平滑
+    reset = high_n == low_n
+    return rsv, reset
 
+
+def update(state, high, low, close):
+    # 流式计算: 输入截止到最新一根K线, 至少包含 WINDOW 根K线
+    # state 保存上一根K线的 K/D
+    k_n = 9
+    m1 = 3
+    m2 = 3
+
+    bars = state.get('bars', 0)
+    rsv, reset = _rsv(high[..., -WINDOW:], low[..., -WINDOW:], close[..., -WINDOW:], k_n)
+    # 输入为 (股票数, K线数) 时每只股票分别判断是否重置
+    reset = reset[..., -1] | (bars <= k_n)
+    k = sma_step(rsv[..., -1], state.get('k', 50.0), m1, 1)
+    d = sma_step(k, state.get('d', 50.0), m2, 1)
+    k, d = np.where(reset, 50.0, k), np.where(reset, 50.0, d)
+    state['k'], state['d'] = k, d
+    state['bars'] = bars + 1
+    return {'k9': k, 'd9': d, 'j9': 3 * k - 2 * d}
+
+
+def calculate(df):
+    for name, values in compute(df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -2,34 +2,44 @@
 # 输出  DIF, DEA, MACD
 
 import pandas as pd
-import numpy as np
-from Common.MathFunctions import EMA
+from Common.MathFunctions import ema, sma, sma_step, shift, settle_bars
+
+SHORT = 12
+LONG = 26
+MID = 9
+INPUTS = ['close']
+OUTPUTS = ['macd_dif', 'macd_dea', 'macd_bar']
+LOOKBACK = 1 + settle_bars(LONG + 1, 2) + settle_bars(MID + 1, 2)  # EMA26 和 DEA 初值影响衰减到千分之一
+WINDOW = 1  # update() 只用到最新一根K线
+
+
+def compute(close):
+    # 只用到上一根K线的收盘价
+    dif = shift(ema(close, SHORT) - ema(close, LONG), 1)
+    # 不足N根K线的部分没有数据
+    dif[..., :LONG] = 0
+
+    # dea = dea_last * 0.8 + dif * 0.2
+    dea = sma(dif, MID + 1, 2, seed=0)
+    macd = (dif - dea) * 2
+    return {'macd_dif': dif, 'macd_dea': dea, 'macd_bar': macd}
+
+
+def update(state, close):
+    # 流式计算: state 保存上一根K线的 ema12 / ema26 / dea
+    bars = state.get('bars', 0)
+    ema_short, ema_long = state.get('ema_short'), state.get('ema_long')
+    dif = ema_short - ema_long if bars >= LONG else 0
+    dea = sma_step(dif, state.get('dea', 0), MID + 1, 2)
+
+    state['ema_short'] = sma_step(close[..., -1], ema_short, SHORT + 1, 2)
+    state['ema_long'] = sma_step(close[..., -1], ema_long, LONG + 1, 2)
+    state['dea'] = dea
+    state['bars'] = bars + 1
+    return {'macd_dif': dif, 'macd_dea': dea, 'macd_bar': (dif - dea) * 2}
 
 
 def calculate(df):
-    n_short = 12
-    n_long = 26
-    dif_list, dea_list, macd_list = [], [], []
-    for i in range(0, df.shape[0]):
-        close_list = df.iloc[i - n_long: i, df.columns.get_loc('close')]
-        if len(close_list) > 0:
-            ema_short = EMA(close_list, n_short)
-            ema_long = EMA(close_list, n_long)
-        else:
-            ema_short = 0
-            ema_long = 0
-        dif = ema_short - ema_long
-        if i == 0:
-            dea_last = 0
-        else:
-            dea_last = dea_list[i - 1]
-        dea = dea_last * 0.8 + dif * 0.2
-        macd = (dif - dea) * 2
-        dif_list.append(dif)
-        dea_list.append(dea)
-        macd_list.append(macd)
-
-    df['macd_dif'] = pd.Series(dif_list, index=df.index)
-    df['macd_dea'] = pd.Series(dea_list, index=df.index)
-    df['macd_bar'] = pd.Series(macd_list, index=df.index)
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
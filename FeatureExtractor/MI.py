@@ -3,30 +3,34 @@
 
 import pandas as pd
 import numpy as np
-import math
+from Common.MathFunctions import shift
 
+MI_STEPS = [5, 10, 20, 30]
+PREFIX = 'mi_'
+INPUTS = ['close']
+OUTPUTS = [PREFIX + str(step) for step in MI_STEPS]
+LOOKBACK = 30
 
-def calculate(df):
+
+def compute(close, steps=MI_STEPS):
     # 動量指標
     # Momentum = 即日收巿價 － n天前收巿價
     # 返回结果可能有负数，差距不会很大，通常不用缩放，
     # 但是如果在分钟线上，估计还是要放大10倍 看的更清楚一点
 
-    mi_steps = [5, 10, 20, 30]
-    mi_matrix = np.zeros((len(mi_steps), df.shape[0]), dtype=np.float32)
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+    for step in steps:
+        result[PREFIX + str(step)] = close - shift(close, step)
+    return result
 
-    for i in range(0, df.shape[0]):
-        index = df.index[i]
-        close = df.loc[index, 'close']
 
-        for j in range(0, len(mi_steps)):
-            step = mi_steps[j]
-            close_n = np.max(df.iloc[i - step, df.columns.get_loc('close')])
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
 
-            mi_n = close - close_n
-            mi_matrix[j, i] = mi_n
 
-    for i in range(0, len(mi_steps)):
-        step = mi_steps[i]
-        df['mi_' + str(step)] = pd.Series(mi_matrix[i], index=df.index)
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -5,26 +5,28 @@
 
 import pandas as pd
 import numpy as np
-import math
+from Common.RollingWindow import rolling_mean, lag
 
+INPUTS = ['vol']
+OUTPUTS = ['oscv']
+LOOKBACK = 30
 
-def calculate(df):
+
+def compute(vol):
     # OSCV - Volume Oscillator 成交量擺動指標
     # oscp = ( vol_ma_min - vol_ma_max ) / vol_ma_min * 100
 
     oscv_min = 10
     oscv_max = 30
 
-    oscv_list = []
-    idx_vol = df.columns.get_loc('vol')
-    for i in range(0, df.shape[0]):
-        vol_ma_min = float(np.mean(df.iloc[i - oscv_min:i, idx_vol]))
-        vol_ma_max = float(np.mean(df.iloc[i - oscv_max:i, idx_vol]))
-        if vol_ma_min != 0:
-            oscv = (vol_ma_min - vol_ma_max) / vol_ma_min * 100
-        else:
-            oscv = 0
-        oscv_list.append(oscv)
-
-    df['oscv'] = pd.Series(oscv_list, index=df.index)
+    vol_ma_min = lag(rolling_mean(vol, oscv_min))
+    vol_ma_max = lag(rolling_mean(vol, oscv_max))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        oscv = np.where(vol_ma_min != 0, (vol_ma_min - vol_ma_max) / vol_ma_min * 100, 0)
+    return {'oscv': oscv}
+
+
+def calculate(df):
+    for name, values in compute(df['vol']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -4,9 +4,14 @@
 
 import pandas as pd
 import numpy as np
+from Common.RollingWindow import rolling_count_if, rolling_mean, lag
 
+INPUTS = ['change']
+OUTPUTS = ['psy', 'psy_ma']
+LOOKBACK = 18
 
-def calculate(df):
+
+def compute(change):
     # n = 12
     # m = 6
     # 1.PSY = N日内上涨天数 / N * 100
@@ -16,21 +21,16 @@ def calculate(df):
 
     n = 12
     m = 6
-    psy_list = []
-    psyma_list = []
-
-    for i in range(0, df.shape[0]):
-        psy = len(np.where(df.iloc[i - n:i, df.columns.get_loc('change')] > 0)[0])
-        psy = psy / n * 100
-        psy_list.append(psy)
-
-    for i in range(0, df.shape[0]):
-        if i > m:
-            psyma = np.mean(psy_list[i - m:i])
-        else:
-            psyma = 0
-        psyma_list.append(psyma)
-
-    df['psy'] = pd.Series(psy_list, index=df.index)
-    df['psy_ma'] = pd.Series(psyma_list, index=df.index)
+
+    psy = lag(rolling_count_if(np.asarray(change) > 0, n)) / n * 100
+    # 不足N根K线的部分没有数据
+    psy[..., :n] = 0
+    psyma = lag(rolling_mean(psy, m))
+    psyma[..., :m + 1] = 0
+    return {'psy': psy, 'psy_ma': psyma}
+
+
+def calculate(df):
+    for name, values in compute(df['change']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
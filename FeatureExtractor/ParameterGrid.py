@@ -0,0 +1,62 @@
+# 按参数网格计算指标, 用于搜索窗口长度
+# 指标族 (MA, EMA, RSI, WR, CCI, ROC, BIAS, MI) 的 compute() 接受任意一组窗口,
+# 同一族的所有窗口共用一次计算 (例如一次分块累加得到所有长度的均线), 耗时随输出列数增长而不是随计算次数增长
+#
+# grid 为 {族名: 窗口列表}, 例如 {'ma': range(3, 61), 'rsi': [6, 9, 14, 24]}
+# 输出列名与默认特征的命名相同 (前缀 + 窗口), 例如 ma7, rsi_9
+
+import numpy as np
+import pandas as pd
+from FeatureExtractor import Registry, PriceMA, VolMA, EXPMA, RSI, WR, CCI, ROC, BIAS, MI
+
+FAMILIES = {
+    'ma': PriceMA, 'v_ma': VolMA, 'ema': EXPMA, 'rsi': RSI, 'wr': WR,
+    'cci': CCI, 'roc': ROC, 'bias': BIAS, 'mi': MI,
+}
+
+
+def _family(name):
+    if name not in FAMILIES:
+        raise RuntimeError("Unknown indicator family {}".format(name))
+    return FAMILIES[name]
+
+
+def _steps(steps):
+    # 去重并排序, 窗口至少为 1 根K线
+    steps = sorted(set(int(step) for step in steps))
+    if len(steps) == 0 or steps[0] < 1:
+        raise RuntimeError("Windows must be positive integers: {}".format(steps))
+    return steps
+
+
+def outputs(grid):
+    # 按 grid 的顺序返回输出的列名
+    return [_family(name).PREFIX + str(step) for name, steps in grid.items() for step in _steps(steps)]
+
+
+def lookback(grid):
+    # 所有输出都有效需要的历史K线数, 包含依赖的指标 (例如 RSI 依赖 change)
+    ret = 0
+    for name, steps in grid.items():
+        family = _family(name)
+        ret = max(ret, family.lookback(_steps(steps)) + Registry.lookback(family.INPUTS))
+    return ret
+
+
+def compute(grid, columns):
+    # columns 为 {列名: 数组}, 至少包含用到的原始列, 数组可以是序列或 (股票数, K线数) 矩阵
+    # 返回 {列名: 数组}, 只包含 grid 的输出
+    inputs = [c for name in grid for c in _family(name).INPUTS]
+    columns = Registry.compute(inputs, {k: np.asarray(v, dtype=np.float64) for k, v in columns.items()})
+    result = {}
+    for name, steps in grid.items():
+        family = _family(name)
+        result.update(family.compute(*[columns[c] for c in family.INPUTS], steps=_steps(steps)))
+    return result
+
+
+def calculate(df, grid):
+    columns = {c: df[c].values for c in Registry.RAW_COLUMNS if c in df.columns}
+    for name, values in compute(grid, columns).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
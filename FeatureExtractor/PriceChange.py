@@ -1,15 +1,22 @@
 import pandas as pd
+import numpy as np
+from Common.MathFunctions import shift
 
+INPUTS = ['close']
+OUTPUTS = ['change']
+LOOKBACK = 1
 
-def calculate(df):
+
+def compute(close):
     # 计算价格涨幅
     # open_price_change = ( close - last_close ) / last_close
     # 数值范围 +0.1 / - 0.1
-    price_change_list = []
-    idx_close = df.columns.get_loc('close')
-    for i in range(0, df.shape[0]):
-        last_close = df.iloc[i - 1, 3]
-        open_price_change = (df.iloc[i, idx_close] - last_close) / last_close
-        price_change_list.append(open_price_change)
-    df['change'] = pd.Series(price_change_list, index=df.index)
-    return df
\ No newline at end of file
+    close = np.asarray(close, dtype=np.float64)
+    last_close = shift(close, 1)
+    return {'change': (close - last_close) / last_close}
+
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
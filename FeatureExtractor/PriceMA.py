@@ -1,20 +1,28 @@
 import pandas as pd
-import numpy as np
+from Common.RollingWindow import rolling_means, lag
 
-def calculate(df):
+MA_STEPS = [5, 15, 25, 40]
+PREFIX = 'ma'
+INPUTS = ['close']
+OUTPUTS = [PREFIX + str(step) for step in MA_STEPS]
+LOOKBACK = 40
+
+
+def compute(close, steps=MA_STEPS):
     # 计算收盘价的N日均线
     # calculate ma5, ma10, ma20, ma30
-    ma_steps = [5, 15, 25, 40]
-    ma_matrix = np.zeros((len(ma_steps), df.shape[0]), dtype=np.float32)
-    idx_close = df.columns.get_loc('close')
-    for i in range(0, df.shape[0]):
-        for j in range(0, len(ma_steps)):
-            step = ma_steps[j]
-            ma_matrix[j, i] = float(np.mean(df.iloc[i - step:i,
-                                            idx_close]))
+    result = {}
+    for step, ma_n in rolling_means(close, steps).items():
+        result[PREFIX + str(step)] = lag(ma_n)
+    return result
 
-    for i in range(0, len(ma_steps)):
-        step = ma_steps[i]
-        df['ma' + str(step)] = pd.Series(ma_matrix[i], index=df.index)
 
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
+
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -1,25 +1,34 @@
 import pandas as pd
 import numpy as np
+from Common.MathFunctions import shift
 
-def calculate(df):
+ROC_STEPS = [12, 25]
+PREFIX = 'roc_'
+INPUTS = ['close']
+OUTPUTS = [PREFIX + str(step) for step in ROC_STEPS]
+LOOKBACK = 25
+
+
+def compute(close, steps=ROC_STEPS):
     # 1、 AX=今天的收盘价—12天前的收盘价
     # 2、 BX=12天前的收盘价
     # 3、 ROC=AX/BX
 
-    roc_steps = [12,25]
-    roc_matrix = np.zeros((len(roc_steps), df.shape[0]), dtype=np.float32)
-
-    for i in range(0, df.shape[0]):
-        index = df.index[i]
-        close = df.loc[index, 'close']
-        for j in range(0, len(roc_steps)):
-            step = roc_steps[j]
-            bx = df.iloc[i - step, df.columns.get_loc('close')]
-            ax = close - bx
-            roc_n = ax/bx
-            roc_matrix[j, i] = roc_n
-
-    for i in range(0, len(roc_steps)):
-        step = roc_steps[i]
-        df['roc_' + str(step)] = pd.Series(roc_matrix[i], index=df.index)
-    return df
\ No newline at end of file
+    close = np.asarray(close, dtype=np.float64)
+    result = {}
+    for step in steps:
+        bx = shift(close, step)
+        ax = close - bx
+        result[PREFIX + str(step)] = ax / bx
+    return result
+
+
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
+
+
+def calculate(df):
+    for name, values in compute(df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
@@ -1,28 +1,41 @@
 import pandas as pd
 import numpy as np
+from Common.RollingWindow import rolling_sums, lag
 
+RSI_STEPS = [6, 12, 24]
+PREFIX = 'rsi_'
+INPUTS = ['change']
+OUTPUTS = [PREFIX + str(step) for step in RSI_STEPS]
+LOOKBACK = 24
 
-def calculate(df):
+
+def compute(change, steps=RSI_STEPS):
     # N日RS=[A÷B]×100%
     # A——N日内收盘涨幅之和
     # B——N日内收盘跌幅之和(取正值)
     # RSI_N=100-100/(1+RS)
 
-    rsi_steps = [6, 12, 24]
-    rsi_matrix = np.zeros((len(rsi_steps), df.shape[0]), dtype=np.float32)
-
-    for i in range(0, df.shape[0]):
-        for j in range(0, len(rsi_steps)):
-            step = rsi_steps[j]
-            change = df.iloc[i - step:i, df.columns.get_loc('change')].to_frame(name='change')
-            change_up = float(np.sum(change[change['change'] > 0]))
-            change_down = float(np.abs(np.sum(change[change['change'] < 0])))
-            if (change_down > 0):
-                rs = change_up / change_down
-                rsi_n = 100 - 100 / (1 + rs)
-                rsi_matrix[j, i] = rsi_n
-
-    for i in range(0, len(rsi_steps)):
-        step = rsi_steps[i]
-        df['rsi_' + str(step)] = pd.Series(rsi_matrix[i], index=df.index)
+    change = np.asarray(change, dtype=np.float64)
+    ups = rolling_sums(np.where(change > 0, change, 0), steps)
+    downs = rolling_sums(np.where(change < 0, change, 0), steps)
+    result = {}
+    for step in steps:
+        change_up = lag(ups[step])
+        change_down = np.abs(lag(downs[step]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi_n = np.where(change_down > 0, 100 - 100 / (1 + change_up / change_down), 0)
+        # 不足N根K线的部分没有数据
+        rsi_n[..., :step] = 0
+        result[PREFIX + str(step)] = rsi_n
+    return result
+
+
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
+
+
+def calculate(df):
+    for name, values in compute(df['change']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -0,0 +1,138 @@
+# 指标注册表
+# 每个指标模块声明 INPUTS / OUTPUTS / LOOKBACK:
+#   INPUTS   compute() 需要的列, 可以是原始列也可以是其他指标的输出 (例如 RSI 依赖 change)
+#   OUTPUTS  compute() 返回的列, 顺序与返回值一致
+#   LOOKBACK 在输入列上需要的历史K线数
+#   VERSION  (可选, 默认为 1) 实现版本, 修改 compute() 的计算方法时加 1, 使指标缓存失效
+# 按需要的特征列求出最小的依赖闭包, 只计算闭包内的指标
+
+import hashlib
+import pandas as pd
+import numpy as np
+from FeatureExtractor import PriceAmplitude, PriceVec, PriceChange, \
+    CCI, PriceMA, VolMA, Turnover, RSI, KDJ, BIAS, BOLL, ROC, \
+    VR, WR, MI, OSCV, DMA, EMV, EXPMA, ARBR, DMI, ASI, MACD, PSY, WVAD
+
+RAW_COLUMNS = ['open', 'high', 'low', 'close', 'vol', 'amount', 'count', 'total_vol']
+
+INDICATORS = [PriceVec, PriceMA, VolMA, PriceChange, PriceAmplitude, CCI, RSI, KDJ, BIAS,
+              BOLL, ROC, VR, Turnover, WR, MI, OSCV, DMA, EMV, EXPMA, ARBR, DMI, ASI,
+              MACD, PSY, WVAD]
+
+_PROVIDERS = {}
+for _indicator in INDICATORS:
+    for _column in _indicator.OUTPUTS:
+        _PROVIDERS[_column] = _indicator
+
+
+def provider(column):
+    # 返回输出该列的指标模块, 原始列返回 None
+    if column in RAW_COLUMNS:
+        return None
+    if column not in _PROVIDERS:
+        raise RuntimeError("No indicator provides column {}".format(column))
+    return _PROVIDERS[column]
+
+
+def resolve(features, available=()):
+    # 按依赖顺序返回需要计算的指标模块
+    # available 中的列视为已经算好, 不会再计算
+    resolved = []
+
+    def visit(column):
+        if column in available:
+            return
+        indicator = provider(column)
+        if indicator is None or indicator in resolved:
+            return
+        for input_column in indicator.INPUTS:
+            visit(input_column)
+        resolved.append(indicator)
+
+    for column in features:
+        visit(column)
+    return resolved
+
+
+def lookback(features, available=()):
+    # 计算 features 中每一列都有效所需要的历史K线数, 包含依赖的指标
+    # available 中的列 (例如 date) 不需要历史数据
+    def visit(column):
+        if column in available:
+            return 0
+        indicator = provider(column)
+        if indicator is None:
+            return 0
+        return indicator.LOOKBACK + max([visit(c) for c in indicator.INPUTS])
+
+    return max([visit(column) for column in features] + [0])
+
+
+def compute(features, columns):
+    # columns 为 {列名: 数组}, 至少包含依赖闭包里用到的原始列
+    # 返回的字典包含 columns 原有的列和新算出的列
+    columns = dict(columns)
+    for indicator in resolve(features, available=columns):
+        args = [columns[c] for c in indicator.INPUTS]
+        columns.update(indicator.compute(*args))
+    return columns
+
+
+def params(indicator):
+    # 模块中大写的常量 (窗口长度等), 改变参数时 key 随之改变
+    return {k: v for k, v in vars(indicator).items()
+            if k.isupper() and k != 'VERSION' and isinstance(v, (int, float, str, list, tuple))}
+
+
+def key(indicator):
+    # 指标结果的缓存 key: 参数, 实现版本 (模块的 VERSION, 修改 compute() 时加 1) 和依赖指标的 key
+    parts = [indicator.__name__, repr(sorted(params(indicator).items())), str(getattr(indicator, 'VERSION', 1))]
+    for c in indicator.INPUTS:
+        if provider(c) is not None:
+            parts.append(key(provider(c)))
+    return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def calculate(df, daily_df=None, features=None, cache=None, cache_rows=None):
+    # 只计算 df 中缺少的 features 列, features 为空时计算全部指标
+    # cache 为 DataCache.IndicatorCache 时, cache_rows (默认全部行) 上已经缓存的指标直接读取,
+    # 缺少的指标连同它依赖的指标在整段数据上计算, 再把 cache_rows 上的结果写入缓存;
+    # 读取缓存的列在 cache_rows 以外的行为 nan
+    if features is None:
+        features = list(_PROVIDERS.keys())
+
+    features = [c for c in features if c not in df.columns]
+    indicators = resolve(features, available=df.columns)
+    rows = np.ones(len(df), dtype=bool) if cache_rows is None else np.asarray(cache_rows, dtype=bool)
+    loaded = {}
+    if cache is not None:
+        for indicator in indicators:
+            values = cache.load(indicator, key(indicator), df.index[rows])
+            if values is not None:
+                loaded[indicator] = values
+    missing = [c for indicator in indicators if indicator not in loaded for c in indicator.OUTPUTS]
+    computed = resolve(missing, available=df.columns)
+
+    columns = {}
+    for indicator in computed:
+        for c in indicator.INPUTS:
+            if c == 'total_vol':
+                dates = [time.date() for time in df.index]
+                columns[c] = daily_df.loc[dates, 'total_vol']
+            elif c in df.columns:
+                columns[c] = df[c]
+
+    columns = compute(missing, columns)
+    for indicator in indicators:
+        if indicator in computed:
+            values = {c: np.asarray(columns[c], dtype=np.float64) for c in indicator.OUTPUTS}
+            if cache is not None:
+                cache.save(indicator, key(indicator), df.index[rows], {c: v[rows] for c, v in values.items()})
+        else:
+            values = {}
+            for c in indicator.OUTPUTS:
+                values[c] = np.full(len(df), np.nan)
+                values[c][rows] = loaded[indicator][c]
+        for c in indicator.OUTPUTS:
+            df[c] = pd.Series(values[c], index=df.index)
+    return df
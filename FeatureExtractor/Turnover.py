@@ -1,4 +1,16 @@
 import pandas as pd
+import numpy as np
+
+INPUTS = ['vol', 'total_vol']
+OUTPUTS = ['turnover']
+LOOKBACK = 0
+
+
+def compute(vol, total_vol):
+    # total_vol 为每根K线当天的流通股手数
+    vol = np.asarray(vol, dtype=np.float64)
+    total_vol = np.asarray(total_vol, dtype=np.float64)
+    return {'turnover': vol / total_vol * 100}
 
 
 def calculate(df, daily_df):
@@ -8,12 +20,8 @@ def calculate(df, daily_df):
     # turnover_rate = volume / total_vol
     # 数值范围 0 - 0.3
     # turnover_change
-    turnover_list = []
-    for i in range(0, df.shape[0]):
-        date = df.index[i].date()
-        total_vol = daily_df.loc[date, 'total_vol']
-        turnover = df.loc[df.index[i], 'vol'] / total_vol * 100
-        turnover_list.append(turnover)
-    df['turnover'] = pd.Series(turnover_list, index=df.index)
-
+    dates = [time.date() for time in df.index]
+    total_vol = daily_df.loc[dates, 'total_vol']
+    for name, values in compute(df['vol'], total_vol).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
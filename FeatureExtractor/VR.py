@@ -1,8 +1,13 @@
 import pandas as pd
 import numpy as np
+from Common.RollingWindow import rolling_sum_if, lag
 
+INPUTS = ['change', 'vol']
+OUTPUTS = ['vr']
+LOOKBACK = 24
 
-def calculate(df):
+
+def compute(change, vol):
     # 1．24 天以来凡是股价上涨那一天的成交量都称为AV，将24天内的AV总和相加后称为AVS。
     # 2．24 天以来凡是股价下跌那一天的成交量都称为BV，将24天内的BV总和相加后称为BVS。
     # 3．24 天以来凡是股价不涨不跌，则那一天的成交量都称为CV，将24天内的CV总和相加后称为CVS。
@@ -10,16 +15,18 @@ def calculate(df):
     # VR =（AVS + 1/2 * CVS） / （BVS + 1/2 * CVS）
 
     n = 24
-    vr_list = []
-    for i in range(0, df.shape[0]):
-        mx = df.iloc[i - n:i, [df.columns.get_loc('change'), df.columns.get_loc('vol')]]
-        avs = float(np.sum(mx.query("change>0").drop('change', axis=1)))
-        bvs = float(np.sum(mx.query("change<0").drop('change', axis=1)))
-        cvs = float(np.sum(mx.query("change==0").drop('change', axis=1)))
-        vr = 0
-        if (bvs + 0.5 * cvs) != 0:
-            vr = (avs + 0.5 * cvs) / (bvs + 0.5 * cvs)
-        vr_list.append(vr)
+    change = np.asarray(change, dtype=np.float64)
+    avs = lag(rolling_sum_if(vol, change > 0, n))
+    bvs = lag(rolling_sum_if(vol, change < 0, n))
+    cvs = lag(rolling_sum_if(vol, change == 0, n))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vr = np.where((bvs + 0.5 * cvs) != 0, (avs + 0.5 * cvs) / (bvs + 0.5 * cvs), 0)
+    # 不足N根K线的部分没有数据
+    vr[..., :n] = 0
+    return {'vr': vr}
 
-    df['vr'] = pd.Series(vr_list, index=df.index)
+
+def calculate(df):
+    for name, values in compute(df['change'], df['vol']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
@@ -1,20 +1,28 @@
 import pandas as pd
-import numpy as np
+from Common.RollingWindow import rolling_means, lag
 
-def calculate(df):
+MA_STEPS = [5, 15, 25, 40]
+PREFIX = 'v_ma'
+INPUTS = ['vol']
+OUTPUTS = [PREFIX + str(step) for step in MA_STEPS]
+LOOKBACK = 40
+
+
+def compute(vol, steps=MA_STEPS):
     # calculate ma5, ma10, ma20, ma30
     # 计算成交量的N日均线
-    ma_steps = [5, 15, 25, 40]
-    ma_matrix = np.zeros((len(ma_steps), df.shape[0]), dtype=np.float32)
-    idx_vol = df.columns.get_loc('vol')
-    for i in range(0, df.shape[0]):
-        for j in range(0, len(ma_steps)):
-            step = ma_steps[j]
-            ma_matrix[j, i] = float(np.mean(df.iloc[i - step:i,
-                                            idx_vol]))
+    result = {}
+    for step, ma_n in rolling_means(vol, steps).items():
+        result[PREFIX + str(step)] = lag(ma_n)
+    return result
 
-    for i in range(0, len(ma_steps)):
-        step = ma_steps[i]
-        df['v_ma' + str(step)] = pd.Series(ma_matrix[i], index=df.index)
 
-    return df
\ No newline at end of file
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
+
+
+def calculate(df):
+    for name, values in compute(df['vol']).items():
+        df[name] = pd.Series(values, index=df.index)
+    return df
@@ -3,33 +3,42 @@
 
 import pandas as pd
 import numpy as np
-import math
+from Common.RollingWindow import rolling_maxes, rolling_mins, lag
 
+WR_STEPS = [5, 10, 20]
+PREFIX = 'wr_'
+INPUTS = ['high', 'low', 'close']
+OUTPUTS = [PREFIX + str(step) for step in WR_STEPS]
+LOOKBACK = 20
 
-def calculate(df):
+
+def compute(high, low, close, steps=WR_STEPS):
     # 以N日威廉指标为例，
     # WR(N) = 100 * [HIGH(N) - C] / [HIGH(N) - LOW(N)]
     # C：当日收盘价
     # HIGH(N)：N日内的最高价
     # LOW(n)：N日内的最低价
 
-    wr_steps = [5, 10, 20]
-    wr_matrix = np.zeros((len(wr_steps), df.shape[0]), dtype=np.float32)
+    close = np.asarray(close, dtype=np.float64)
+    highs = rolling_maxes(high, steps)
+    lows = rolling_mins(low, steps)
+    result = {}
+    for step in steps:
+        high_n = lag(highs[step])
+        low_n = lag(lows[step])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = high_n / low_n
+            wr_n = np.where(p != 0, 100 * (high_n - close) / p, 0)
+        result[PREFIX + str(step)] = wr_n
+    return result
+
 
-    for i in range(0, df.shape[0]):
-        index = df.index[i]
-        close = df.loc[index, 'close']
+def lookback(steps):
+    # 窗口为 steps 时需要的历史K线数
+    return max(steps)
 
-        for j in range(0, len(wr_steps)):
-            step = wr_steps[j]
-            high_n = np.max(df.iloc[i - step:i, df.columns.get_loc('high')])
-            low_n = np.min(df.iloc[i - step:i, df.columns.get_loc('low')])
-            p = high_n / low_n
-            if p != 0:
-                wr_n = 100 * (high_n - close) / p
-                wr_matrix[j, i] = wr_n
 
-    for i in range(0, len(wr_steps)):
-        step = wr_steps[i]
-        df['wr_' + str(step)] = pd.Series(wr_matrix[i], index=df.index)
+def calculate(df):
+    for name, values in compute(df['high'], df['low'], df['close']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
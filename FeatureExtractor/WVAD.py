@@ -4,9 +4,14 @@
 
 import pandas as pd
 import numpy as np
+from Common.RollingWindow import rolling_sum, rolling_mean, lag
 
+INPUTS = ['open', 'high', 'low', 'close', 'vol']
+OUTPUTS = ['wvad', 'wvad_ma']
+LOOKBACK = 30
 
-def calculate(df):
+
+def compute(open, high, low, close, vol):
     # n = 12
     # m = 6
     # A=当天收盘价－当天开盘价
@@ -16,35 +21,22 @@ def calculate(df):
 
     n = 24
     m = 6
-    v_list = []
-    wvad_list = []
-    wvadma_list = []
-
-    for i in range(0, df.shape[0]):
-        close = df.iloc[i, df.columns.get_loc('close')]
-        open = df.iloc[i, df.columns.get_loc('open')]
-        high = df.iloc[i, df.columns.get_loc('high')]
-        low = df.iloc[i, df.columns.get_loc('low')]
-        vol = df.iloc[i, df.columns.get_loc('vol')]
-        a = close - open
-        b = high - low
-        if b == 0:
-            v = 0
-        else:
-            v = (a / b) * vol
-        v_list.append(v)
-
-    for i in range(0, df.shape[0]):
-        wvad = np.sum(v_list[i - n:i])
-        wvad_list.append(wvad)
-
-    for i in range(0, df.shape[0]):
-        if i > m:
-            wvadma = np.mean(wvad_list[i - m:i])
-        else:
-            wvadma = 0
-        wvadma_list.append(wvadma)
-
-    df['wvad'] = pd.Series(wvad_list, index=df.index)
-    df['wvad_ma'] = pd.Series(wvadma_list, index=df.index)
+
+    a = np.asarray(close, dtype=np.float64) - np.asarray(open, dtype=np.float64)
+    b = np.asarray(high, dtype=np.float64) - np.asarray(low, dtype=np.float64)
+    vol = np.asarray(vol, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.where(b == 0, 0, (a / b) * vol)
+
+    wvad = lag(rolling_sum(v, n))
+    # 不足N根K线的部分没有数据
+    wvad[..., :n] = 0
+    wvadma = lag(rolling_mean(wvad, m))
+    wvadma[..., :m + 1] = 0
+    return {'wvad': wvad, 'wvad_ma': wvadma}
+
+
+def calculate(df):
+    for name, values in compute(df['open'], df['high'], df['low'], df['close'], df['vol']).items():
+        df[name] = pd.Series(values, index=df.index)
     return df
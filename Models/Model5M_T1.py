@@ -26,6 +26,9 @@ from keras.models import load_model
 
 from DataCache.CacheManager import CacheManager
 import DataTransform.Transform5M_T1 as t5m
+from DataTransform.WorkerPool import WorkerPool
+from DataTransform import DatasetBuilder
+from DataTransform.LookbackPlanner import BARS_PER_DAY
 import numpy as np
 import os
 
@@ -410,23 +413,99 @@ class Model5MT1:
     def data_features(self):
         return t5m.features()
 
-    def prepare_data(self, stock_code, start_date, end_date, use_cache=True):
-        TMP_DATA_TABLE_NAME = 'transformed_stock_trading_5min_t1_data_' + stock_code
-        cache = CacheManager(TMP_DATA_TABLE_NAME)
-
-        t5m.init(stock_code, start_date)
-        if use_cache and cache.has_cached_data():
+    def iter_data(self, stock_codes, start_date, end_date, use_cache=True, chunk_days=DatasetBuilder.CHUNK_DAYS,
+                  workers=None):
+        # 按块生成 (X, y), 每块为一只股票最多 chunk_days 个交易日, 内存只与块的大小有关, 不随区间和股票数增长
+        # 所有股票的块交给同一个进程池, 不同股票的块同时计算 (workers 为 1 时在当前进程里计算), 按股票和日期的顺序返回
+        if isinstance(stock_codes, str):
+            stock_codes = [stock_codes]
+        if workers == 1:
+            yield from iter_stocks(stock_codes, start_date, end_date, use_cache, chunk_days)
+            return
+        with WorkerPool(workers=workers) as pool:
+            yield from iter_stocks(stock_codes, start_date, end_date, use_cache, chunk_days, pool)
+
+    def prepare_data(self, stock_codes, start_date, end_date, use_cache=True, workers=None):
+        # stock_codes 为一只或多只股票, 返回合并后的 (X, y), 按 stock_codes 的顺序
+        chunks = list(self.iter_data(stock_codes, start_date, end_date, use_cache, workers=workers))
+        if len(chunks) == 0:
+            # 区间内没有交易日, 返回 0 个样本
+            return np.zeros((0, DatasetBuilder.BARS_PER_DAY, len(t5m.features()))), np.zeros((0, 3))
+        return np.concatenate([X for X, _ in chunks]), np.concatenate([y for _, y in chunks])
+
+
+def _block(context, first_date, block_end, keep):
+    # 一块交易日的 (X, y), keep 时同时返回写入缓存的 (缩放前的) DataFrame; 模块级函数, 可以交给进程池
+    context = context.block(first_date)
+    d = context.prepare_data(block_end)
+    d = context.feature_extraction(d)
+    d = t5m.feature_select(d)
+    cached = d if keep else None
+    d = context.feature_scaling(d)
+    index, X = t5m.feature_reshaping(d)
+    return cached, X, context.prepare_result(index, block_end)
+
+
+def _cache_name(stock_code):
+    return 'transformed_stock_trading_5min_t1_data_' + stock_code
+
+
+def _tasks(stock_codes, start_date, end_date, use_cache, chunk_days):
+    # 所有股票的块按股票和日期的顺序排成一个任务序列, 每项为 ((context, 有缓存, 块序号, 块数), _block 的参数)
+    # 有缓存或者没有交易日的股票只有一项, 参数为 None, 由 iter_stocks 在当前进程里读取缓存
+    # DatasetBuilder.stream_tagged 按需取用, 后面股票的 Context 在前面股票的块计算时才创建
+    for stock_code in stock_codes:
+        context = t5m.Context(stock_code, start_date)
+        if use_cache and CacheManager(_cache_name(stock_code)).has_cached_data():
+            yield (context, True, 0, 0), None
+            continue
+        blocks = context.blocks(end_date, chunk_days)
+        if len(blocks) == 0:
+            yield (context, False, 0, 0), None
+            continue
+        for i, (first_date, block_end) in enumerate(blocks):
+            yield (context, False, i, len(blocks)), (context, first_date, block_end, use_cache)
+
+
+def _iter_cache(context, cache, chunk_days):
+    # 在日期边界处分块读取缓存, 每块单独缩放和变形, 不把整段缓存读进内存
+    for d in cache.iter_cached_data(chunk_days * BARS_PER_DAY):
+        d = context.feature_scaling(d)
+        index, X = t5m.feature_reshaping(d)
+        if len(index) == 0:
+            continue
+        first_date, last_date = DatasetBuilder.as_date(index[0]), DatasetBuilder.as_date(index[-1])
+        yield X, context.block(first_date).prepare_result(index, last_date)
+
+
+def iter_stocks(stock_codes, start_date, end_date, use_cache=True, chunk_days=DatasetBuilder.CHUNK_DAYS, pool=None):
+    # 按股票和日期的顺序生成 (X, y), pool 为 WorkerPool 时所有股票的块在进程池里计算
+    # 有缓存时按块读取缓存; 没有缓存时逐块写入这只股票的临时缓存, 全部完成后再改名
+    temp = None
+    samples = 0
+    tasks = _tasks(stock_codes, start_date, end_date, use_cache, chunk_days)
+    for (context, cached, i, count), result in DatasetBuilder.stream_tagged(pool, _block, tasks):
+        name = _cache_name(context.stock_code)
+        if cached:
             print("Loading data from cache")
-            d = cache.load_cached_data()
+            samples = 0
+            for X, y in _iter_cache(context, CacheManager(name), chunk_days):
+                samples += len(X)
+                yield X, y
+        elif result is not None:
+            if i == 0:
+                print("Loading data from query")
+                samples = 0
+                temp = CacheManager(name + '_tmp') if use_cache else None
+            d, X, y = result
+            if temp is not None:
+                temp.cache_data(d, append=i > 0)
+            samples += len(X)
+            yield X, y
+            if i < count - 1:
+                continue
+            if temp is not None:
+                temp.rename(name)
         else:
-            print("Loading data from query")
-            d = t5m.prepare_data(start_date, end_date)
-            d = t5m.feature_extraction(d)
-            d = t5m.feature_select(d)
-            d = cache.cache_data(d)
-        # d = d[:500  # 忽略后面的数据 优化测试性能
-        d = t5m.feature_scaling(d)
-        d = t5m.feature_reshaping(d)
-        X = d[1]
-        y = t5m.prepare_result(d[0], stock_code, start_date, end_date)
-        return X, y
+            samples = 0
+        print("Stock code: {0}  {1} samples".format(context.stock_code, samples))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+'''
+重新导入或修正某些股票的5分钟K线后, 只删除并重算依赖这些K线的下游数据
+start_date - end_date 内这些股票的交易日视为已修改, 删除对应的特征, 缩放特征, 结果, 缩放统计值和缓存文件, 然后重新转换
+'''
+
+import os, sys, datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(PROJECT_ROOT)
+
+from sqlalchemy.orm import sessionmaker
+import Common.config as config
+from DataCache.TradingCalendar import TradingCalendar
+from DataTransform import Lineage
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(("{0} start_date end_date code [code ...]".format(sys.argv[0])))
+        exit(0)
+
+    start_date = datetime.datetime.strptime(str(sys.argv[1]), "%Y-%m-%d").date()
+    end_date = datetime.datetime.strptime(str(sys.argv[2]), "%Y-%m-%d").date()
+    codes = sys.argv[3:]
+
+    session = sessionmaker()
+    session.configure(bind=config.DB_CONN)
+    db = session()
+    calendar = TradingCalendar.load(db, start_date, end_date, codes)
+    db.close()
+    Lineage.rebuild([(code, date) for code in codes for date in calendar.dates(code, start_date, end_date)])
@@ -2,6 +2,9 @@
 '''
 转换5分钟K线的原始数据
 默认先查找当天数据库的所有股票，然后按每日便利每只股票
+加上 market 参数时按日读取全市场数据, 一次计算所有股票的特征, 缩放特征和结果, 数据不完整的股票逐只处理
+加上 range 参数时每只股票一次读取整个区间的数据, 输出区间内每天的特征, 缩放特征和结果
+已经完成或失败过的日期记在完成清单里, 重新运行时只处理剩下的日期, 加上 retry 参数时重试失败过的日期
 '''
 
 import os, sys, datetime
@@ -10,12 +13,20 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
 sys.path.append(PROJECT_ROOT)
 
 from DataTransform.Transform5M import process_date_range
+from DataTransform import Transform5MMarket, Transform5MRange
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(("{0} start_date end_date".format(sys.argv[0])))
+    if len(sys.argv) not in [3, 4, 5]:
+        print(("{0} start_date end_date [market|range] [retry]".format(sys.argv[0])))
         exit(0)
 
     start_date = datetime.datetime.strptime(str(sys.argv[1]), "%Y-%m-%d").date()
     end_date = datetime.datetime.strptime(str(sys.argv[2]), "%Y-%m-%d").date()
-    process_date_range(start_date, end_date)
+    options = sys.argv[3:]
+    retry_failed = 'retry' in options
+    if 'market' in options:
+        Transform5MMarket.process_date_range(start_date, end_date, retry_failed=retry_failed)
+    elif 'range' in options:
+        Transform5MRange.process_date_range(start_date, end_date, retry_failed=retry_failed)
+    else:
+        process_date_range(start_date, end_date, retry_failed=retry_failed)
@@ -0,0 +1,106 @@
+# 指标计算性能测试
+# 用固定种子生成的 OHLCV 数据分别运行每个 FeatureExtractor 模块和整条特征计算链, 输出每秒处理的K线数
+# python benchmark_indicators.py [重复次数]
+#
+# 单只股票的数据按一维数组输入 (Transform5M 的方式), 多只股票按 (股票数, K线数) 矩阵输入 (Transform5MMarket 的方式)
+# 每个指标模块只计时自身的 compute(), 输入列事先由整条计算链算好
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from FeatureExtractor import Engine, Registry
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+
+RAW_FIELDS = ['open', 'high', 'low', 'close', 'vol', 'amount', 'count']
+
+# (名称, 股票数, 交易日数), 多只股票用一个月的数据, 避免整条计算链的中间结果占用过多内存
+SIZES = [('1 day', 1, 1), ('1 month', 1, 21), ('1 year', 1, 250), ('100 stocks', 100, 21)]
+
+
+def synthetic_bars(stocks, days, seed=0):
+    # 返回 {字段: (股票数, K线数) 矩阵}, 包含 RAW_FIELDS 和 total_vol
+    # 使用 RandomState, 不同 numpy 版本生成的数据相同
+    rng = np.random.RandomState(seed)
+    shape = (stocks, days * BARS_PER_DAY)
+    start = rng.uniform(5, 50, (stocks, 1))
+    close = np.round(start * np.exp(np.cumsum(rng.normal(0, 0.003, shape), axis=1)), 2)
+    open = np.round(np.concatenate([close[:, :1], close[:, :-1]], axis=1) * (1 + rng.normal(0, 0.001, shape)), 2)
+    high = np.round(np.maximum(open, close) * (1 + np.abs(rng.normal(0, 0.002, shape))), 2)
+    low = np.round(np.minimum(open, close) * (1 - np.abs(rng.normal(0, 0.002, shape))), 2)
+    # 一字线和零成交量的K线, 覆盖 KDJ 重置和除零的分支
+    flat = rng.rand(*shape) < 0.03
+    high[flat] = low[flat] = open[flat] = close[flat]
+    vol = rng.randint(0, 50000, shape).astype(np.float64)
+    vol[rng.rand(*shape) < 0.01] = 0
+    total_vol = rng.randint(10 ** 6, 10 ** 7, (stocks, days)).astype(np.float64)
+    return {
+        'open': open, 'high': high, 'low': low, 'close': close,
+        'vol': vol, 'amount': np.round(vol * close, 2), 'count': rng.randint(1, 500, shape).astype(np.float64),
+        'total_vol': np.repeat(total_vol, BARS_PER_DAY, axis=1),
+    }
+
+
+def synthetic_frame(days, seed=0):
+    # 单只股票的 (df, daily_df), 与 Transform5M.prepare_data 的格式相同, 用于 Engine.calculate
+    data = synthetic_bars(1, days, seed)
+    bar_times = [pd.Timedelta(hours=9, minutes=35 + 5 * i) for i in range(BARS_PER_DAY // 2)] + \
+                [pd.Timedelta(hours=13, minutes=5 + 5 * i) for i in range(BARS_PER_DAY // 2)]
+    dates = pd.bdate_range('2016-01-04', periods=days)
+    index = pd.DatetimeIndex([date + t for date in dates for t in bar_times], name='time')
+    df = pd.DataFrame({field: data[field][0] for field in RAW_FIELDS}, index=index)
+    df['date'] = [t.date() for t in index]
+    daily_df = pd.DataFrame({'total_vol': data['total_vol'][0, ::BARS_PER_DAY]},
+                            index=pd.Index([date.date() for date in dates], name='date'))
+    return df, daily_df
+
+
+def _best_time(func, repeat):
+    # 先运行一次不计时, 排除 numba 编译和缓存的开销
+    func()
+    best = None
+    for _ in range(repeat):
+        start_ts = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start_ts
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark(repeat=3, sizes=SIZES):
+    # 返回 {名称: {规模: 每秒K线数}}
+    results = {}
+    for size, stocks, days in sizes:
+        data = synthetic_bars(stocks, days)
+        if stocks == 1:
+            data = {field: values[0] for field, values in data.items()}
+        bars = stocks * days * BARS_PER_DAY
+        columns = Registry.compute(Engine.FEATURES, data)
+
+        for indicator in Registry.INDICATORS:
+            args = [columns[c] for c in indicator.INPUTS]
+            elapsed = _best_time(lambda: indicator.compute(*args), repeat)
+            results.setdefault(indicator.__name__.split('.')[-1], {})[size] = bars / elapsed
+
+        elapsed = _best_time(lambda: Registry.compute(Engine.FEATURES, data), repeat)
+        results.setdefault('Engine.compute', {})[size] = bars / elapsed
+
+        if stocks == 1:
+            # Transform5M.extract_features 使用的 DataFrame 接口
+            df, daily_df = synthetic_frame(days)
+            elapsed = _best_time(lambda: Engine.calculate(df.copy(), daily_df), repeat)
+            results.setdefault('Engine.calculate', {})[size] = bars / elapsed
+    return results
+
+
+def print_results(results, sizes=SIZES):
+    names = [size for size, _, _ in sizes]
+    print("{:<18}".format('bars/s') + "".join("{:>14}".format(name) for name in names))
+    for indicator, speeds in results.items():
+        print("{:<18}".format(indicator) +
+              "".join("{:>14}".format("{:,.0f}".format(speeds[name]) if name in speeds else '-') for name in names))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print_results(benchmark(repeat))
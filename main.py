@@ -23,36 +23,10 @@ TEST_SAMPLES = 100
 
 m5m = Model5MT2(MODEL_NAME)
 
-# # 训练模型 准备数据
-# X_list, y_list = [], []
-# for code in training_stock_codes:
-#     X, y = m5m.prepare_data(code, START_DATE, END_DATE, use_cache=True)
-#     X_list.append(X)
-#     y_list.append(y)
-#     print("\nStock code:", code)
-#     print("{0} Samples distributions: ".format(X.shape[0]))
-#     print(np.sum(y, axis=0))
-# training_set = (np.vstack(X_list), np.vstack(y_list))
-#
-# X_list, y_list = [], []
-# for code in validation_stock_codes:
-#     X, y = m5m.prepare_data(code, TESTING_START_DATE, END_DATE, use_cache=True)
-#     X_list.append(X)
-#     y_list.append(y)
-#     print("\nStock code:", code)
-#     print("{0} Samples distributions: ".format(X.shape[0]))
-#     print(np.sum(y, axis=0))
-# validation_set = (np.vstack(X_list), np.vstack(y_list))
-#
-# X_list, y_list = [], []
-# for code in test_stock_codes:
-#     X, y = m5m.prepare_data(code, TESTING_START_DATE, END_DATE, use_cache=True)
-#     X_list.append(X)
-#     y_list.append(y)
-#     print("\nStock code:", code)
-#     print("{0} Samples distributions: ".format(X.shape[0]))
-#     print(np.sum(y, axis=0))
-# test_set = (np.vstack(X_list), np.vstack(y_list))
+# # 训练模型 准备数据, 每只股票在进程池里同时准备
+# training_set = m5m.prepare_data(training_stock_codes, START_DATE, END_DATE, use_cache=True)
+# validation_set = m5m.prepare_data(validation_stock_codes, TESTING_START_DATE, END_DATE, use_cache=True)
+# test_set = m5m.prepare_data(test_stock_codes, TESTING_START_DATE, END_DATE, use_cache=True)
 #
 # print("\nTraining set: \n"
 #       "Overall {0} Samples distributions: {1}".format(training_set[0].shape[0], np.sum(training_set[1], axis=0)))
@@ -74,16 +48,9 @@ m5m = Model5MT2(MODEL_NAME)
 stock_codes = ['sz000917']
 START_DATE = date(2016, 1, 25)
 END_DATE = date(2016, 3, 25)
-X_list, y_list = [], []
-for code in stock_codes:
-    X, y = m5m.prepare_data(code, START_DATE, END_DATE, use_cache=True)
-    X_list.append(X)
-    y_list.append(y)
-    print(("\nStock code:", code))
-    print(("{0} Samples distributions: ".format(X.shape[0])))
-    print((np.sum(y, axis=0)))
-X = np.vstack(X_list)
-y = np.vstack(y_list)
+X, y = m5m.prepare_data(stock_codes, START_DATE, END_DATE, use_cache=True)
+print(("{0} Samples distributions: ".format(X.shape[0])))
+print((np.sum(y, axis=0)))
 
 # y = np.argmax(y, axis=1)
 i = 0
@@ -0,0 +1,69 @@
+# BulkWriter 重复写入同一个主键的效果是覆盖
+# python -m unittest test_bulk_writer
+
+import unittest
+from datetime import date
+import pandas as pd
+from sqlalchemy import create_engine
+from DataTransform.BulkWriter import BulkWriter
+
+
+def bars(code, times, value):
+    return pd.DataFrame({'code': code, 'time': pd.to_datetime(times), 'close': float(value)})
+
+
+def days(code, dates, value):
+    return pd.DataFrame({'code': code, 'date': dates, 'close': float(value)})
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.con = create_engine('sqlite://')
+
+    def read(self, table):
+        return pd.read_sql('SELECT * FROM {} ORDER BY 1, 2'.format(table), self.con)
+
+    def test_time_key(self):
+        times = ['2017-03-01 09:45', '2017-03-01 09:50']
+        with BulkWriter(self.con) as writer:
+            writer.write('bars', bars('sz000001', times, 1), ['code', 'time'])
+            writer.write('bars', bars('sz000002', times, 1), ['code', 'time'])
+        # 表已经存在, 按主键删除后再写入
+        with BulkWriter(self.con) as writer:
+            writer.write('bars', bars('sz000001', times, 2), ['code', 'time'])
+        df = self.read('bars')
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df[df['code'] == 'sz000001']['close'].tolist(), [2.0, 2.0])
+        self.assertEqual(df[df['code'] == 'sz000002']['close'].tolist(), [1.0, 1.0])
+        self.assertEqual(pd.to_datetime(df['time']).dt.strftime('%H:%M').tolist()[:2], ['09:45', '09:50'])
+
+    def test_date_key(self):
+        dates = [date(2017, 3, 1), date(2017, 3, 2)]
+        with BulkWriter(self.con) as writer:
+            writer.write('days', days('sz000001', dates, 1), ['code', 'date'])
+        with BulkWriter(self.con) as writer:
+            writer.write('days', days('sz000001', dates[1:], 2), ['code', 'date'])
+        self.assertEqual(self.read('days')['close'].tolist(), [1.0, 2.0])
+
+    def test_buffered_duplicates(self):
+        # 同一次 flush 里重复的主键只保留最后一次写入
+        with BulkWriter(self.con) as writer:
+            writer.write('bars', bars('sz000001', ['2017-03-01 09:45'], 1), ['code', 'time'])
+            writer.write('bars', bars('sz000001', ['2017-03-01 09:45'], 3), ['code', 'time'])
+        self.assertEqual(self.read('bars')['close'].tolist(), [3.0])
+
+    def test_batches(self):
+        # 超过 batch_size 时分多次写入, 删除语句分块绑定参数
+        times = pd.date_range('2017-03-01 09:35', periods=48, freq='5min')
+        with BulkWriter(self.con, batch_size=10, chunksize=7) as writer:
+            for value in [1, 2]:
+                for start in range(0, 48, 12):
+                    writer.write('bars', bars('sz000001', times[start:start + 12], value), ['code', 'time'])
+        df = self.read('bars')
+        self.assertEqual(len(df), 48)
+        self.assertTrue((df['close'] == 2.0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
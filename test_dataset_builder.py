@@ -0,0 +1,91 @@
+# 按天变形的视图与原来 groupby('date') + np.dstack 的结果对比
+# python -m unittest test_dataset_builder
+
+import unittest
+from datetime import date
+import numpy as np
+import pandas as pd
+from DataTransform import DatasetBuilder
+from DataCache.TradingCalendar import TradingCalendar
+from DataTransform.WorkerPool import WorkerPool
+
+
+def reference_reshaping(df, truncate_index=36):
+    # 原来 Transform5M_T1.feature_reshaping 的实现
+    data_set = []
+    index_set = []
+    for d, values in df.groupby('date'):
+        values = values.drop(labels='date', axis=1).values
+        if len(values) >= truncate_index:
+            data_set.append(values[:truncate_index])
+            index_set.append(d)
+    data_set = np.dstack(data_set)
+    data_set = np.swapaxes(data_set, 0, 2)
+    data_set = np.swapaxes(data_set, 1, 2)
+    return [index_set, data_set]
+
+
+def square(x):
+    return x * x
+
+
+def frame(bars):
+    # bars 为每天的K线数
+    days = pd.bdate_range('2017-03-01', periods=len(bars))
+    times = [day + pd.Timedelta(minutes=5 * (i + 1)) for day, n in zip(days, bars) for i in range(n)]
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(rng.randn(len(times), 5), index=pd.DatetimeIndex(times, name='time'),
+                      columns=['a', 'b', 'c', 'd', 'e'])
+    df.insert(0, 'date', [time.date() for time in df.index])
+    return df
+
+
+class DatasetBuilderTest(unittest.TestCase):
+
+    def test_regular_days(self):
+        # 每天的K线数相同时是连续数组的视图
+        df = frame([48] * 10)
+        index, X = DatasetBuilder.reshape_days(df)
+        expected = reference_reshaping(df)
+        self.assertEqual(index, expected[0])
+        np.testing.assert_array_equal(X, expected[1])
+        values = np.ascontiguousarray(df.drop(labels='date', axis=1).values)
+        starts, counts = DatasetBuilder.day_index(df['date'].values)
+        view = DatasetBuilder.day_view(values, starts)
+        self.assertTrue(np.shares_memory(view, values))
+        np.testing.assert_array_equal(view, expected[1])
+
+    def test_irregular_days(self):
+        # 缺少K线和K线不足36根的日期
+        df = frame([48, 47, 20, 48, 36, 35, 48])
+        index, X = DatasetBuilder.reshape_days(df)
+        expected = reference_reshaping(df)
+        self.assertEqual(index, expected[0])
+        self.assertEqual(len(index), 5)
+        np.testing.assert_array_equal(X, expected[1])
+
+    def test_empty(self):
+        index, X = DatasetBuilder.reshape_days(frame([20, 30]))
+        self.assertEqual(index, [])
+        self.assertEqual(X.shape, (0, 36, 5))
+
+    def test_blocks(self):
+        days = list(pd.bdate_range('2017-03-01', '2017-03-31').date)
+        calendar = TradingCalendar(pd.DataFrame({'code': 'sz000001', 'date': days}))
+        blocks = DatasetBuilder.blocks(calendar, 'sz000001', date(2017, 3, 4), date(2017, 3, 31), chunk_days=8)
+        self.assertEqual(blocks, [(date(2017, 3, 6), date(2017, 3, 16)), (date(2017, 3, 16), date(2017, 3, 28)),
+                                  (date(2017, 3, 28), date(2017, 3, 31))])
+
+    def test_stream_tagged(self):
+        # 参数为 None 的项不执行, 与计算的结果按原来的顺序返回
+        items = [(('a', i), (i,)) for i in range(5)] + [(('b', 0), None)] + [(('c', i), (i,)) for i in range(3)]
+        expected = [(tag, square(*arg) if arg is not None else None) for tag, arg in items]
+        self.assertEqual(list(DatasetBuilder.stream_tagged(None, square, items)), expected)
+        with WorkerPool(None, workers=2) as pool:
+            self.assertEqual(list(DatasetBuilder.stream_tagged(pool, square, items, depth=3)), expected)
+            self.assertEqual(list(DatasetBuilder.stream(pool, square, [(i,) for i in range(7)])),
+                             [i * i for i in range(7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# 声明式特征缩放
+# python -m unittest test_feature_scaling
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from DataTransform import FeatureScaling
+from FeatureExtractor import Engine
+from benchmark_indicators import synthetic_frame
+
+STATS = dict(vol_min=3.0, vol_avg=2000.0, vol_max=40000.0, price_min=9.0, price_avg=10.0, price_max=11.0,
+             count_min=1.0, count_max=400.0)
+
+
+class FeatureScalingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        df, daily_df = synthetic_frame(4, seed=1)
+        cls.df = Engine.calculate(df, daily_df)
+
+    def test_transforms(self):
+        df = FeatureScaling.scale(self.df, FeatureScaling.SPEC_5M, STATS)
+        close, vol = self.df['close'].values, self.df['vol'].values
+        # 成交量为 0 时按 1 计算
+        base = np.where(vol == 0, 1, vol)
+        np.testing.assert_allclose(df['ma5'], (self.df['ma5'] - close) / close * 50, rtol=1e-12)
+        np.testing.assert_allclose(df['v_ma5'], (self.df['v_ma5'] - base) / base * 0.5, rtol=1e-12)
+        np.testing.assert_allclose(df['vol'], (vol - 40000.0) / (40000.0 - 3.0) * 6, rtol=1e-12)
+        np.testing.assert_allclose(df['emv_emv'], self.df['emv_emv'] * 10.0 / 2000.0, rtol=1e-12)
+        # close 本身不在 SPEC_5M 里, 保持不变
+        np.testing.assert_array_equal(df['close'], close)
+
+    def test_input_unchanged(self):
+        # scale 返回新的 DataFrame, 传入的 df 保持缩放前的值
+        df = self.df.copy()
+        scaled = FeatureScaling.scale(df, FeatureScaling.SPEC_5M, STATS)
+        self.assertIsNot(scaled, df)
+        self.assertTrue(df.equals(self.df))
+        self.assertFalse(np.allclose(scaled['ma5'], df['ma5']))
+
+    def test_row_stats(self):
+        # 每行一个统计值与标量统计值的结果相同
+        rows = {name: np.full(len(self.df), value) for name, value in STATS.items()}
+        expected = FeatureScaling.scale(self.df, FeatureScaling.SPEC_5M, STATS)
+        actual = FeatureScaling.scale(self.df, FeatureScaling.SPEC_5M, rows)
+        for name in FeatureScaling.SPEC_5M:
+            np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+    def test_save_load(self):
+        params = FeatureScaling.ScalingParams(**STATS)
+        path = os.path.join(tempfile.mkdtemp(), 'scaling.json')
+        params.save(path)
+        loaded = FeatureScaling.ScalingParams.load(path)
+        expected = params.apply(self.df, FeatureScaling.SPEC_T2)
+        actual = loaded.apply(self.df, FeatureScaling.SPEC_T2)
+        for name in FeatureScaling.SPEC_T2:
+            np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# 指标输出的回归测试, 与冻结的 golden 数组对比
+# python -m unittest test_golden_features
+# 有意修改指标的计算方法后, 用 python test_golden_features.py update 重新生成 golden 数组
+#
+# 输入是 benchmark_indicators.synthetic_bars 生成的固定数据, 替换指标的实现时结果必须与 golden 一致
+
+import os
+import sys
+import unittest
+import numpy as np
+from FeatureExtractor import Engine, Registry
+from benchmark_indicators import synthetic_bars, synthetic_frame
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'features_5m.npz')
+GOLDEN_DAYS = 6
+GOLDEN_SEED = 0
+
+
+def golden_inputs():
+    data = synthetic_bars(1, GOLDEN_DAYS, GOLDEN_SEED)
+    return {field: values[0] for field, values in data.items()}
+
+
+def update_golden():
+    columns = Registry.compute(Engine.FEATURES, golden_inputs())
+    os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+    np.savez_compressed(GOLDEN_PATH, **columns)
+    print("Golden arrays saved to {}".format(GOLDEN_PATH))
+
+
+class GoldenFeaturesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with np.load(GOLDEN_PATH) as golden:
+            cls.golden = {name: golden[name] for name in golden.files}
+
+    def assertGolden(self, name, actual):
+        np.testing.assert_allclose(np.asarray(actual, dtype=np.float64), self.golden[name],
+                                   rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=name)
+
+    def test_features(self):
+        self.assertEqual(set(Engine.FEATURES) - set(self.golden), set())
+        columns = Engine.compute(**golden_inputs())
+        for name in Engine.FEATURES:
+            self.assertGolden(name, columns[name])
+
+    def test_indicators(self):
+        # 每个模块单独用 golden 的输入列计算, 定位出错的指标
+        for indicator in Registry.INDICATORS:
+            args = [self.golden[c] for c in indicator.INPUTS]
+            columns = indicator.compute(*args)
+            for name in indicator.OUTPUTS:
+                self.assertGolden(name, columns[name])
+
+    def test_matrix(self):
+        # (股票数, K线数) 输入中每一行与单独计算的结果相同
+        data = synthetic_bars(4, GOLDEN_DAYS, GOLDEN_SEED + 1)
+        golden = golden_inputs()
+        data = {field: np.vstack([golden[field], values]) for field, values in data.items()}
+        columns = Engine.compute(**data)
+        for name in Engine.FEATURES:
+            self.assertGolden(name, columns[name][0])
+
+    def test_calculate(self):
+        # Transform5M.extract_features 使用的 DataFrame 接口
+        df, daily_df = synthetic_frame(GOLDEN_DAYS, GOLDEN_SEED)
+        df = Engine.calculate(df, daily_df)
+        for name in Engine.FEATURES:
+            self.assertGolden(name, df[name].values)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'update':
+        update_golden()
+    else:
+        unittest.main()
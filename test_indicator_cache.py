@@ -0,0 +1,69 @@
+# 指标列缓存的读写, 以及多个进程同时合并同一个月份分区
+# python -m unittest test_indicator_cache
+
+import unittest
+import tempfile
+import multiprocessing
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from DataCache.IndicatorCache import IndicatorCache
+
+INDICATOR = SimpleNamespace(__name__='FeatureExtractor.Fake', OUTPUTS=['a', 'b'])
+
+
+def bars(day):
+    # 一天48根5分钟K线
+    return pd.date_range(pd.Timestamp(day) + pd.Timedelta(minutes=5), periods=48, freq='5min')
+
+
+def columns(times):
+    values = times.asi8.astype(np.float64)
+    return {'a': values, 'b': -values}
+
+
+def save_day(root, day):
+    times = bars(day)
+    cache = IndicatorCache('sz000001', root=root)
+    # 先读取一次, 本进程缓存的分区内容在其他进程写入后就过期了
+    cache.load(INDICATOR, 'k', times)
+    cache.save(INDICATOR, 'k', times, columns(times))
+
+
+class IndicatorCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def test_round_trip(self):
+        cache = IndicatorCache('sz000001', root=self.root)
+        times = bars('2017-03-01').append(bars('2017-04-05'))
+        self.assertIsNone(cache.load(INDICATOR, 'k', times))
+        cache.save(INDICATOR, 'k', times, columns(times))
+        loaded = IndicatorCache('sz000001', root=self.root).load(INDICATOR, 'k', times[10:60])
+        np.testing.assert_array_equal(loaded['a'], columns(times[10:60])['a'])
+        # 其他 key 不命中
+        self.assertIsNone(cache.load(INDICATOR, 'other', times))
+
+    def test_evict(self):
+        cache = IndicatorCache('sz000001', root=self.root)
+        times = bars('2017-03-01').append(bars('2017-03-02'))
+        cache.save(INDICATOR, 'k', times, columns(times))
+        cache.evict([pd.Timestamp('2017-03-02').date()])
+        self.assertIsNone(cache.load(INDICATOR, 'k', times))
+        self.assertIsNotNone(cache.load(INDICATOR, 'k', times[:48]))
+
+    def test_concurrent_save(self):
+        # 同一个月的不同日期由不同的进程同时写入, 所有行都保留
+        days = pd.bdate_range('2017-03-01', '2017-03-31')
+        context = multiprocessing.get_context('fork')
+        with context.Pool(4) as pool:
+            pool.starmap(save_day, [(self.root, day) for day in days])
+        times = pd.DatetimeIndex(np.concatenate([bars(day) for day in days]))
+        loaded = IndicatorCache('sz000001', root=self.root).load(INDICATOR, 'k', times)
+        self.assertIsNotNone(loaded)
+        np.testing.assert_array_equal(loaded['b'], columns(times)['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# 逐根K线流式更新的指标与 Engine.compute 对整段历史的计算对比, 以及保存后继续计算
+# python -m unittest test_indicator_state
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from FeatureExtractor import Engine, Registry
+from FeatureExtractor.IndicatorState import IndicatorState, MarketIndicatorState
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+from benchmark_indicators import synthetic_bars
+
+DAYS = 8
+# 批量计算的 DMI 第一根K线以回绕的收盘价为前值, ADX/ADXR 的初值不同, 误差按指数衰减
+CONVERGING = ['adx', 'adxr']
+
+
+def bars(data, start, end):
+    for i in range(start, end):
+        yield {field: values[i] for field, values in data.items()}
+
+
+class IndicatorStateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = {field: values[0] for field, values in synthetic_bars(1, DAYS, 0).items()}
+        cls.batch = Engine.compute(**cls.data)
+        cls.length = DAYS * BARS_PER_DAY
+
+    def stream(self, state, start, end):
+        return np.array([state.extract(bar) for bar in bars(self.data, start, end)])
+
+    def test_matches_batch(self):
+        state = IndicatorState()
+        streamed = self.stream(state, 0, self.length)
+        self.assertEqual(state.bars, self.length)
+        settle = Registry.lookback(Engine.FEATURES)
+        for i, name in enumerate(Engine.FEATURES):
+            expected = np.asarray(self.batch[name], dtype=np.float64)
+            if name in CONVERGING:
+                np.testing.assert_allclose(streamed[settle:, i], expected[settle:], atol=1e-2, err_msg=name)
+                # 最后一天已经收敛
+                np.testing.assert_allclose(streamed[-BARS_PER_DAY:, i], expected[-BARS_PER_DAY:], atol=1e-6,
+                                           err_msg=name)
+            else:
+                np.testing.assert_allclose(streamed[settle:, i], expected[settle:], rtol=1e-9, atol=1e-9,
+                                           equal_nan=True, err_msg=name)
+
+    def test_resume(self):
+        # 第3天收盘后保存, 载入后继续计算, 与不中断的结果完全相同
+        state = IndicatorState()
+        expected = self.stream(state, 0, self.length)
+
+        state = IndicatorState()
+        split = 3 * BARS_PER_DAY
+        first = self.stream(state, 0, split)
+        path = os.path.join(tempfile.mkdtemp(), 'state.pkl')
+        state.save(path)
+        resumed = IndicatorState.load(path)
+        self.assertEqual(resumed.bars, split)
+        self.assertEqual(resumed.features(), Engine.FEATURES)
+        second = self.stream(resumed, split, self.length)
+        np.testing.assert_array_equal(np.vstack([first, second]), expected)
+
+    def test_feature_subset(self):
+        # 只计算部分特征时依赖的指标自动加入
+        state = IndicatorState(['macd_bar', 'rsi_6'])
+        streamed = self.stream(state, 0, self.length)
+        settle = Registry.lookback(['macd_bar', 'rsi_6'])
+        for i, name in enumerate(['macd_bar', 'rsi_6']):
+            np.testing.assert_allclose(streamed[settle:, i], self.batch[name][settle:], rtol=1e-9, atol=1e-9,
+                                       err_msg=name)
+
+
+class MarketIndicatorStateTest(unittest.TestCase):
+    # 全市场一起更新与每只股票单独更新的结果相同
+
+    @classmethod
+    def setUpClass(cls):
+        cls.codes = ['sz{:06d}'.format(i) for i in range(4)]
+        cls.data = synthetic_bars(len(cls.codes), DAYS, 1)
+        cls.length = DAYS * BARS_PER_DAY
+
+    def stream(self, state, start, end):
+        return np.array([state.extract({field: values[:, i] for field, values in self.data.items()})
+                         for i in range(start, end)])
+
+    def test_matches_per_stock(self):
+        streamed = self.stream(MarketIndicatorState(self.codes), 0, self.length)
+        self.assertEqual(streamed.shape, (self.length, len(self.codes), len(Engine.FEATURES)))
+        for row in range(len(self.codes)):
+            state = IndicatorState()
+            expected = np.array([state.extract(bar) for bar in
+                                 bars({field: values[row] for field, values in self.data.items()}, 0, self.length)])
+            np.testing.assert_allclose(streamed[:, row], expected, rtol=1e-12, atol=1e-12, equal_nan=True,
+                                       err_msg=self.codes[row])
+
+    def test_resume(self):
+        expected = self.stream(MarketIndicatorState(self.codes), 0, self.length)
+        state = MarketIndicatorState(self.codes)
+        split = 3 * BARS_PER_DAY
+        first = self.stream(state, 0, split)
+        path = os.path.join(tempfile.mkdtemp(), 'market.pkl')
+        state.save(path)
+        resumed = MarketIndicatorState.load(path)
+        self.assertEqual(resumed.codes, self.codes)
+        self.assertEqual(resumed.bars, split)
+        second = self.stream(resumed, split, self.length)
+        np.testing.assert_array_equal(np.concatenate([first, second]), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
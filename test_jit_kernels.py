@@ -0,0 +1,58 @@
+# 对比 numba 编译版本和 numpy 版本的指标计算结果
+# python -m unittest test_jit_kernels
+
+import unittest
+import numpy as np
+import pandas as pd
+from Common import JitKernels
+from FeatureExtractor import ASI, KDJ, DMI, MACD, EXPMA
+
+
+def random_bars(count, seed=0):
+    rng = np.random.RandomState(seed)
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.003, count))), 2)
+    open = np.round(np.concatenate([[close[0]], close[:-1]]) * (1 + rng.normal(0, 0.001, count)), 2)
+    high = np.round(np.maximum(open, close) * (1 + np.abs(rng.normal(0, 0.002, count))), 2)
+    low = np.round(np.minimum(open, close) * (1 - np.abs(rng.normal(0, 0.002, count))), 2)
+    # 一字线让 KDJ 重置
+    flat = rng.rand(count) < 0.05
+    high[flat] = low[flat] = open[flat] = close[flat]
+    index = pd.date_range('2016-01-04 09:35', periods=count, freq='5min', name='time')
+    return pd.DataFrame({'open': open, 'high': high, 'low': low, 'close': close}, index=index)
+
+
+@unittest.skipUnless(JitKernels.HAS_NUMBA, 'numba is not installed')
+class JitKernelsTest(unittest.TestCase):
+    INDICATORS = [ASI, KDJ, DMI, MACD, EXPMA]
+
+    def tearDown(self):
+        JitKernels.USE_NUMBA = JitKernels.HAS_NUMBA
+
+    def _calculate(self, use_numba, df):
+        JitKernels.USE_NUMBA = use_numba
+        for indicator in self.INDICATORS:
+            df = indicator.calculate(df)
+        return df
+
+    def test_calculate(self):
+        for seed in range(5):
+            df = random_bars(500, seed)
+            expected = self._calculate(False, df.copy())
+            actual = self._calculate(True, df.copy())
+            pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+    def test_matrix(self):
+        # (股票数, K线数) 的输入按行递推
+        frames = [random_bars(300, seed) for seed in range(8)]
+        args = [np.stack([df[c].values for df in frames]) for c in ['high', 'low', 'close']]
+        for indicator in [KDJ, DMI]:
+            JitKernels.USE_NUMBA = False
+            expected = indicator.compute(*args)
+            JitKernels.USE_NUMBA = True
+            actual = indicator.compute(*args)
+            for name in indicator.OUTPUTS:
+                np.testing.assert_array_equal(actual[name], expected[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# 原始数据修改后的下游日期和受影响的缓存文件
+# python -m unittest test_lineage
+
+import unittest
+from datetime import date
+import pandas as pd
+from DataCache.TradingCalendar import TradingCalendar
+from DataTransform import Lineage
+
+
+class LineageTest(unittest.TestCase):
+
+    def setUp(self):
+        days = list(pd.bdate_range('2017-03-01', '2017-05-31').date)
+        # sh600000 停牌 3/20 - 3/24
+        suspended = [d for d in days if date(2017, 3, 20) <= d <= date(2017, 3, 24)]
+        df = pd.DataFrame({'code': ['sz000001'] * len(days) + ['sh600000'] * (len(days) - len(suspended)),
+                           'date': days + [d for d in days if d not in suspended]})
+        self.calendar = TradingCalendar(df)
+
+    def test_downstream(self):
+        plan = Lineage.downstream(self.calendar, [('sz000001', date(2017, 3, 15))], lookback_days=2)
+        self.assertEqual(plan['features'], {'sz000001': [date(2017, 3, 15), date(2017, 3, 16), date(2017, 3, 17)]})
+        self.assertEqual(plan['results'], {'sz000001': [date(2017, 3, 14), date(2017, 3, 15)]})
+        # 缩放样本为 [d' - 37, d' - 7), 包含 3/15 的 d' 在 (3/22, 4/21] 内
+        stats = plan['stats']['sz000001']
+        self.assertEqual((stats[0], stats[-1]), (date(2017, 3, 23), date(2017, 4, 21)))
+        self.assertEqual(plan['scaled']['sz000001'], plan['features']['sz000001'] + stats)
+
+    def test_suspension(self):
+        # 停牌的日期不在下游里, 回看窗口跳过停牌
+        plan = Lineage.downstream(self.calendar, [('sh600000', date(2017, 3, 17)), ('sh600000', date(2017, 3, 16))],
+                                  lookback_days=1)
+        self.assertEqual(plan['features'], {'sh600000': [date(2017, 3, 16), date(2017, 3, 17), date(2017, 3, 27)]})
+        self.assertEqual(plan['results'], {'sh600000': [date(2017, 3, 15), date(2017, 3, 16), date(2017, 3, 17)]})
+        self.assertNotIn(date(2017, 3, 24), plan['stats']['sh600000'])
+
+    def test_affected_files(self):
+        plan = Lineage.downstream(self.calendar, [('sz000001', date(2017, 3, 15))], lookback_days=2)
+        ranges = [('before.h5', date(2017, 3, 1), date(2017, 3, 13)),
+                  ('result.csv', date(2017, 3, 15), date(2017, 3, 20)),
+                  # 文件的第一天需要前一个交易日的数据
+                  ('next.h5', date(2017, 4, 24), date(2017, 4, 28)),
+                  ('after.h5', date(2017, 4, 25), date(2017, 4, 28))]
+        self.assertEqual(Lineage.affected_files(self.calendar, plan, ranges), ['result.csv', 'next.h5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
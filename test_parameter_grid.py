@@ -0,0 +1,48 @@
+# 参数网格计算与逐个窗口计算的结果对比
+# python -m unittest test_parameter_grid
+
+import unittest
+import numpy as np
+from FeatureExtractor import Engine, ParameterGrid
+from benchmark_indicators import synthetic_bars
+
+GRID = {
+    'ma': range(2, 61), 'v_ma': [3, 7, 40], 'ema': [3, 8, 40], 'rsi': range(3, 30, 3), 'wr': range(2, 33),
+    'cci': [5, 9, 14, 30], 'roc': [1, 6, 12, 25], 'bias': range(4, 31, 2), 'mi': [1, 5, 30],
+}
+
+
+class ParameterGridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = synthetic_bars(3, 6, seed=2)
+
+    def test_default_windows(self):
+        # 默认窗口的网格输出与特征计算链相同
+        grid = {name: [int(c[len(family.PREFIX):]) for c in family.OUTPUTS]
+                for name, family in ParameterGrid.FAMILIES.items()}
+        expected = Engine.compute(**self.data)
+        actual = ParameterGrid.compute(grid, self.data)
+        self.assertEqual(sorted(actual), sorted(ParameterGrid.outputs(grid)))
+        for name, values in actual.items():
+            np.testing.assert_allclose(values, expected[name], rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=name)
+
+    def test_shared_pass(self):
+        # 一次计算多个窗口与每个窗口单独计算的结果相同, 分块长度不同只会带来舍入误差
+        actual = ParameterGrid.compute(GRID, self.data)
+        for name, steps in GRID.items():
+            for step in steps:
+                column = ParameterGrid.FAMILIES[name].PREFIX + str(step)
+                expected = ParameterGrid.compute({name: [step]}, self.data)[column]
+                np.testing.assert_allclose(actual[column], expected, rtol=1e-9, atol=1e-9, equal_nan=True,
+                                           err_msg=column)
+
+    def test_lookback(self):
+        self.assertEqual(ParameterGrid.lookback({'ma': [5, 60]}), 60)
+        self.assertEqual(ParameterGrid.lookback({'rsi': [6, 24]}), 25)
+        with self.assertRaises(RuntimeError):
+            ParameterGrid.outputs({'unknown': [5]})
+
+
+if __name__ == '__main__':
+    unittest.main()
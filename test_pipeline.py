@@ -0,0 +1,72 @@
+# 读取 / 计算 / 写入流水线
+# python -m unittest test_pipeline
+
+import os
+import threading
+import time
+import unittest
+from DataTransform.Pipeline import Pipeline
+from DataTransform.WorkerPool import WorkerPool, TaskStatus
+
+
+def square(payload):
+    code, value = payload
+    if value == 3:
+        raise ValueError('bad value')
+    return code, value * value
+
+
+def crash(payload):
+    # 模拟被杀死的 worker, 进程池不会调用这个任务的回调
+    code, value = payload
+    if value == 5:
+        os._exit(1)
+    return code, value * value
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_run(self):
+        lock = threading.Lock()
+        state = {'open': 0, 'peak': 0}
+        written = {}
+
+        def fetch(task):
+            if task[1] == 3:
+                return task
+            with lock:
+                state['open'] += 1
+                state['peak'] = max(state['peak'], state['open'])
+            return task
+
+        def write(result):
+            code, value = result
+            with lock:
+                state['open'] -= 1
+            written[code] = value
+            return TaskStatus(code, None, None, 1, 0, 0, 0.0)
+
+        tasks = [('sz{:06d}'.format(i), i) for i in range(40)]
+        with WorkerPool(None, workers=2) as pool:
+            statuses = Pipeline(pool, fetch, square, write, io_threads=2, depth=3).run(tasks)
+        # 计算出错的任务没有结果, 其他任务都写入了
+        self.assertEqual(written, {code: value * value for code, value in tasks if value != 3})
+        self.assertEqual(sorted(s.code for s in statuses), sorted(written))
+        # 读好未写入的任务不超过 读取线程数 + 等待计算 + 主线程手里的一个 + 计算中和等待写入
+        self.assertLessEqual(state['peak'], 2 + 3 + 1 + 3)
+
+    def test_worker_dies(self):
+        # 超时的任务释放名额, 其他任务照常写入, run 不会一直等待
+        def write(result):
+            return TaskStatus(result[0], None, None, 1, 0, 0, 0.0)
+
+        tasks = [('sz{:06d}'.format(i), i) for i in range(10)]
+        started = time.time()
+        with WorkerPool(None, workers=2) as pool:
+            statuses = Pipeline(pool, lambda task: task, crash, write, io_threads=1, depth=2, timeout=3).run(tasks)
+        self.assertEqual(sorted(s.code for s in statuses), [code for code, value in tasks if value != 5])
+        self.assertLess(time.time() - started, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
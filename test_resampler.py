@@ -0,0 +1,109 @@
+# 由1分钟K线合成 15/30/60 分钟K线: K线数, 结束时间, 午间休市的边界和 OHLC/vol/amount/count 的聚合
+# python -m unittest test_resampler
+
+import unittest
+import numpy as np
+import pandas as pd
+from DataTransform import Resampler
+
+
+def one_minute_day(code, day, seed=0):
+    # 一天的1分钟K线: 9:30 集合竞价, 9:31 - 11:30, 13:00, 13:01 - 15:00, 共 242 根
+    day = pd.Timestamp(day)
+    minutes = [9 * 60 + 30 + i for i in range(121)] + [13 * 60 + i for i in range(121)]
+    times = [day + pd.Timedelta(minutes=m) for m in minutes]
+    rng = np.random.RandomState(seed)
+    close = 10 + np.cumsum(rng.randn(len(times)) * 0.01)
+    open_ = close + rng.randn(len(times)) * 0.01
+    return pd.DataFrame({
+        'code': code,
+        'time': times,
+        'open': open_,
+        'high': np.maximum(open_, close) + rng.rand(len(times)) * 0.01,
+        'low': np.minimum(open_, close) - rng.rand(len(times)) * 0.01,
+        'close': close,
+        'vol': rng.randint(100, 1000, len(times)).astype(np.float64),
+        'amount': rng.rand(len(times)) * 1e5,
+        'count': rng.randint(1, 50, len(times)).astype(np.float64),
+    })
+
+
+def session_times(day, period):
+    # period 分钟K线的结束时间: 上午 9:30 + period ... 11:30, 下午 13:00 + period ... 15:00
+    day = pd.Timestamp(day)
+    morning = [day + pd.Timedelta(hours=9, minutes=30 + period * i) for i in range(1, 120 // period + 1)]
+    afternoon = [day + pd.Timedelta(hours=13, minutes=period * i) for i in range(1, 120 // period + 1)]
+    return morning + afternoon
+
+
+def reference_bar(minutes):
+    # 一组1分钟K线手工聚合成一根K线
+    return [minutes['open'].iloc[0], minutes['high'].max(), minutes['low'].min(), minutes['close'].iloc[-1],
+            minutes['vol'].sum(), minutes['amount'].sum(), minutes['count'].sum()]
+
+
+class ResamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.day = one_minute_day('sz000001', '2017-03-01')
+
+    def test_bar_times(self):
+        for period in [15, 30, 60]:
+            result = Resampler.resample(self.day, period)
+            self.assertEqual(len(result), 240 // period)
+            self.assertEqual(list(result['time']), session_times('2017-03-01', period))
+
+    def test_session_boundary(self):
+        # 9:30 并入 9:31 开始的第一根K线, 13:00 并入下午的第一根K线, 11:30 的K线不包含 13:00
+        df = self.day.set_index('time')
+        result = Resampler.resample(self.day, 30).set_index('time')
+        first = df.loc['2017-03-01 09:30':'2017-03-01 10:00']
+        self.assertEqual(len(first), 31)
+        self.assertEqual(result.loc['2017-03-01 10:00', 'open'], first['open'].iloc[0])
+        self.assertEqual(result.loc['2017-03-01 10:00', 'vol'], first['vol'].sum())
+        noon = df.loc['2017-03-01 11:01':'2017-03-01 11:30']
+        self.assertEqual(result.loc['2017-03-01 11:30', 'close'], noon['close'].iloc[-1])
+        self.assertEqual(result.loc['2017-03-01 11:30', 'vol'], noon['vol'].sum())
+        afternoon = df.loc['2017-03-01 13:00':'2017-03-01 13:30']
+        self.assertEqual(len(afternoon), 31)
+        self.assertEqual(result.loc['2017-03-01 13:30', 'open'], afternoon['open'].iloc[0])
+        self.assertEqual(result.loc['2017-03-01 13:30', 'count'], afternoon['count'].sum())
+
+    def test_aggregation(self):
+        columns = ['open', 'high', 'low', 'close', 'vol', 'amount', 'count']
+        df = self.day.set_index('time')
+        for period in [15, 30, 60]:
+            result = Resampler.resample(self.day, period)
+            expected = []
+            for end in session_times('2017-03-01', period):
+                start = end - pd.Timedelta(minutes=period - 1)
+                # 每个时段的第一根K线包含 9:30 / 13:00
+                if start.time() in [pd.Timestamp('09:31').time(), pd.Timestamp('13:01').time()]:
+                    start -= pd.Timedelta(minutes=1)
+                expected.append(reference_bar(df.loc[start:end]))
+            np.testing.assert_allclose(result[columns].values, np.array(expected))
+        # 全天的成交量不变
+        self.assertAlmostEqual(Resampler.resample(self.day, 60)['vol'].sum(), self.day['vol'].sum())
+
+    def test_codes_and_days(self):
+        # 多只股票和多天一起合成, 输入顺序打乱, 不会跨股票或跨日期合并
+        parts = [one_minute_day(code, day, seed) for seed, (code, day) in
+                 enumerate([('sz000001', '2017-03-01'), ('sz000001', '2017-03-02'), ('sh600000', '2017-03-01')])]
+        df = pd.concat(parts).sample(frac=1, random_state=0)
+        result = Resampler.resample(df, 60)
+        self.assertEqual(len(result), 12)
+        for part in parts:
+            code = part['code'].iloc[0]
+            day = part['time'].iloc[0].normalize()
+            single = Resampler.resample(part, 60)
+            mask = (result['code'] == code) & (result['time'].dt.normalize() == day)
+            np.testing.assert_allclose(result[mask].drop(columns=['code', 'time']).values,
+                                       single.drop(columns=['code', 'time']).values)
+
+    def test_period_must_divide_session(self):
+        with self.assertRaises(RuntimeError):
+            Resampler.resample(self.day, 45)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# 按交易日分组计算的结果标签
+# python -m unittest test_result_labels
+
+import datetime
+import unittest
+import numpy as np
+import pandas as pd
+from DataTransform import ResultLabels
+
+
+def day_bars(date, closes):
+    # 一天 48 根5分钟K线, 上午 09:35-11:30, 下午 13:05-15:00
+    start = datetime.datetime.combine(date, datetime.time())
+    times = [start + datetime.timedelta(minutes=570 + 5 * (i + 1)) for i in range(24)] + \
+            [start + datetime.timedelta(minutes=780 + 5 * (i + 1)) for i in range(24)]
+    closes = np.asarray(closes, dtype=np.float64)
+    return pd.DataFrame({'time': times, 'open': closes, 'high': closes + 0.1, 'low': closes - 0.1, 'close': closes})
+
+
+class ResultLabelsTest(unittest.TestCase):
+
+    def setUp(self):
+        this_day = np.full(48, 10.0)
+        this_day[30] = this_day[40] = 9.0  # 下午第 7 根K线第一次出现最低价
+        next_day = np.full(48, 11.0)
+        next_day[5] = 12.0  # 次日上午第 6 根K线最高
+        self.dates = [datetime.date(2017, 3, 3), datetime.date(2017, 3, 6)]
+        self.bars = pd.concat([day_bars(self.dates[0], this_day), day_bars(self.dates[1], next_day)],
+                              ignore_index=True)
+
+    def test_results(self):
+        result = ResultLabels.results('sz000001', self.bars, self.dates[:1], self.dates[1:]).iloc[0]
+        self.assertEqual(result['date'], self.dates[0])
+        self.assertAlmostEqual(result['nextday_open'], 10.0)
+        self.assertAlmostEqual(result['nextday_high'], 21.0)
+        self.assertAlmostEqual(result['this_pm_low_rate'], -11.0)
+        self.assertEqual(result['this_pm_low_timing'], 7)
+        self.assertEqual(result['next_am_high_timing'], 6)
+        self.assertAlmostEqual(result['t1_max_profit_rate'], (12.1 - 8.9) / 8.9 * 100)
+
+    def test_missing_day(self):
+        # 下一个交易日没有K线时不输出记录
+        result = ResultLabels.results('sz000001', self.bars, self.dates, [self.dates[1], datetime.date(2017, 3, 7)])
+        self.assertEqual(result['date'].tolist(), self.dates[:1])
+        self.assertFalse(result[ResultLabels.RESULT_COLUMNS].isnull().values.any())
+
+    def test_missing_session(self):
+        # 当天下午或下一个交易日上午没有K线时同样不输出
+        this_am = self.bars.iloc[list(range(24)) + list(range(48, 96))]
+        self.assertTrue(ResultLabels.results('sz000001', this_am, self.dates[:1], self.dates[1:]).empty)
+        next_pm = self.bars.iloc[list(range(48)) + list(range(72, 96))]
+        self.assertTrue(ResultLabels.results('sz000001', next_pm, self.dates[:1], self.dates[1:]).empty)
+        np.testing.assert_array_equal(
+            ResultLabels.complete(ResultLabels.day_summary(next_pm), self.dates, self.dates[1:] + self.dates[:1]),
+            [False, False])
+
+    def test_open_gap_classes(self):
+        classes = ResultLabels.open_gap_classes([10.1, 9.9, 10.0], [10.0, 10.0, 10.0])
+        np.testing.assert_array_equal(classes, [[0, 0, 1], [1, 0, 0], [0, 1, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# 按天聚合后滚动计算的缩放统计值与直接聚合样本K线的结果对比
+# python -m unittest test_scaling_stats
+
+import unittest
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from DataCache import ScalingStats
+from benchmark_indicators import synthetic_frame
+
+
+class ScalingStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        df, _ = synthetic_frame(80, seed=3)
+        # 去掉几天, 样本窗口里有停牌的日期
+        self.df = df[~df['date'].isin(sorted(set(df['date']))[20:26])]
+        self.dates = sorted(set(self.df['date']))
+
+    def expected(self, date, offset=30, bias=7):
+        sample_start = date - timedelta(days=offset + bias)
+        sample = self.df[(self.df['date'] >= sample_start) & (self.df['date'] < sample_start + timedelta(days=offset))]
+        if sample.empty:
+            return None
+        return [sample['vol'].min(), sample['vol'].mean(), sample['vol'].max(),
+                sample['close'].min(), sample['close'].mean(), sample['close'].max(),
+                sample['count'].min(), sample['count'].max()]
+
+    def test_rolling_stats(self):
+        stats = ScalingStats.rolling_stats(ScalingStats.daily_aggregates(self.df), self.dates)
+        self.assertEqual(list(stats.columns), ScalingStats.STATS)
+        for date in self.dates:
+            expected = self.expected(date)
+            if expected is None:
+                self.assertTrue(stats.loc[date].isnull().all())
+            else:
+                np.testing.assert_allclose(stats.loc[date].values, expected, rtol=1e-12, err_msg=str(date))
+
+    def test_monthly(self):
+        # 同一个月的日期使用当月第一天的样本
+        stats = ScalingStats.rolling_stats(ScalingStats.daily_aggregates(self.df), self.dates, monthly=True)
+        for date in self.dates[-20:]:
+            expected = self.expected(date.replace(day=1))
+            np.testing.assert_allclose(stats.loc[date].values, expected, rtol=1e-12, err_msg=str(date))
+        months = pd.DatetimeIndex(stats.index).to_period('M')
+        self.assertEqual(stats.dropna().groupby(months[stats.notnull().all(axis=1)]).nunique().max().max(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
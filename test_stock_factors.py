@@ -2,7 +2,7 @@ import os
 import numpy as np
 from datetime import date
 from Models.Model5M_T1 import Model5MT1
-from time import clock
+from time import perf_counter
 import Common.config as config
 import Common.Visualization as v
 
@@ -17,9 +17,9 @@ END_DATE = date(2016, 12, 6)
 
 m5m = Model5MT1(MODEL_NAME)
 
-start_ts = clock()
+start_ts = perf_counter()
 X, y = m5m.prepare_data(STOCK_CODE, START_DATE, END_DATE, use_cache=True)
-finish_ts = clock()
+finish_ts = perf_counter()
 print(("\nExecution time: {:10.6} s".format(finish_ts - start_ts)))
 
 labels = m5m.data_features();
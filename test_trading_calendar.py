@@ -0,0 +1,49 @@
+# 内存交易日历
+# python -m unittest test_trading_calendar
+
+import pickle
+import unittest
+from datetime import date
+import pandas as pd
+from DataCache.TradingCalendar import TradingCalendar
+
+EXCHANGE_DAYS = [date(2017, 9, 27), date(2017, 9, 28), date(2017, 9, 29), date(2017, 10, 9), date(2017, 10, 10),
+                 date(2017, 10, 11)]
+
+
+class TradingCalendarTest(unittest.TestCase):
+
+    def setUp(self):
+        suspended = [date(2017, 9, 29), date(2017, 10, 9)]
+        df = pd.DataFrame({'code': ['sz000001'] * len(EXCHANGE_DAYS) +
+                                   ['sh600000'] * (len(EXCHANGE_DAYS) - len(suspended)),
+                           'date': EXCHANGE_DAYS + [d for d in EXCHANGE_DAYS if d not in suspended]})
+        self.calendar = TradingCalendar(df)
+
+    def test_shift(self):
+        calendar = self.calendar
+        self.assertEqual(calendar.next('sz000001', date(2017, 9, 29)), date(2017, 10, 9))
+        self.assertEqual(calendar.previous('sz000001', date(2017, 10, 10), 2), date(2017, 9, 29))
+        # 不是交易日时从它所在的位置开始数
+        self.assertEqual(calendar.previous('sh600000', date(2017, 10, 1)), date(2017, 9, 28))
+        self.assertEqual(calendar.on_or_after('sh600000', date(2017, 9, 29)), date(2017, 10, 10))
+        self.assertIsNone(calendar.next('sz000001', date(2017, 10, 11)))
+        self.assertIsNone(calendar.previous('sz000002', date(2017, 10, 11)))
+        self.assertEqual(calendar.window('sz000001', date(2017, 10, 1), date(2017, 10, 9), before=1, after=1),
+                         [date(2017, 9, 29), date(2017, 10, 9), date(2017, 10, 10)])
+
+    def test_gaps(self):
+        calendar = self.calendar
+        self.assertTrue(calendar.continuous(date(2017, 9, 29), date(2017, 10, 6)))
+        self.assertFalse(calendar.continuous(date(2017, 9, 29), date(2017, 10, 9)))
+        self.assertEqual(calendar.suspensions('sh600000'), [(date(2017, 9, 28), date(2017, 10, 10))])
+        self.assertEqual(calendar.dates(), EXCHANGE_DAYS)
+
+    def test_pickle(self):
+        calendar = pickle.loads(pickle.dumps(self.calendar))
+        self.assertEqual(calendar.dates('sh600000', date(2017, 9, 1), date(2017, 9, 30)),
+                         [date(2017, 9, 27), date(2017, 9, 28)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# 转换任务的完成清单
+# python -m unittest test_transform_manifest
+
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+from DataCache.TransformManifest import TransformManifest
+
+DATES = [date(2017, 9, 25) + timedelta(days=i) for i in range(10)]
+
+
+class TransformManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_pending(self):
+        manifest = TransformManifest(root=self.root)
+        manifest.record('sz000001', [(DATES[0], 3, None), (DATES[1], 1, 'sz000001 is has missing data'),
+                                     (DATES[2], 2, None)])
+        self.assertTrue(manifest.is_done('sz000001', DATES[0]))
+        self.assertTrue(manifest.is_done('sz000001', DATES[1], 'features'))
+        self.assertFalse(manifest.is_done('sz000001', DATES[1]))
+        self.assertEqual(manifest.failure('sz000001', DATES[1], 'scaled'), 'sz000001 is has missing data')
+        # 失败的日期不再安排, 只完成了一部分阶段的日期需要重做
+        self.assertEqual(manifest.pending('sz000001', DATES[:4]), [DATES[2], DATES[3]])
+        self.assertEqual(manifest.pending('sz000001', DATES[:4], retry_failed=True), DATES[1:4])
+        self.assertEqual(manifest.pending('sz000002', DATES[:2]), DATES[:2])
+
+        # 重试成功后清除失败记录
+        manifest.record('sz000001', [(DATES[1], 3, None)])
+        self.assertIsNone(manifest.failure('sz000001', DATES[1], 'scaled'))
+        manifest.clear('sz000001', [DATES[0]], ['results'])
+        self.assertEqual(manifest.pending('sz000001', DATES[:3]), [DATES[0], DATES[2]])
+
+    def test_save(self):
+        manifest = TransformManifest(root=self.root)
+        manifest.record('sz000001', [(d, 3, None) for d in DATES[::2]] + [(DATES[1], 0, 'No more trading date')])
+        manifest.save()
+        loaded = TransformManifest(root=self.root).load(['sz000001', 'sz000002'])
+        self.assertEqual(loaded.pending('sz000001', DATES), DATES[3::2])
+        self.assertEqual(loaded.failures('sz000001'), [(DATES[1], 'features', 'No more trading date')])
+        self.assertEqual(loaded.pending('sz000002', DATES), DATES)
+
+
+if __name__ == '__main__':
+    unittest.main()
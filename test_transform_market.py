@@ -0,0 +1,80 @@
+# 全市场横截面特征与逐只股票 Engine.calculate 的结果对比
+# python -m unittest test_transform_market
+
+import unittest
+import numpy as np
+import pandas as pd
+from FeatureExtractor import Engine, Registry
+from DataTransform import LookbackPlanner
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+from DataTransform.Transform5MMarket import RAW_FIELDS, stack_stocks, unstack_features
+from benchmark_indicators import synthetic_frame
+
+CODES = ['sh600000', 'sz000001', 'sz000002', 'sz000003']
+MISSING_BAR = 'sz000002'  # 缺少一根K线
+MISSING_DAILY = 'sz000003'  # 第一天没有日线
+
+
+def market(days):
+    # 返回 (每只股票的 (df, daily_df), 全市场5分钟K线长表, 全市场日线长表)
+    frames = {code: synthetic_frame(days, seed) for seed, code in enumerate(CODES)}
+    bars = []
+    daily = []
+    for code, (df, daily_df) in frames.items():
+        df = df.reset_index()
+        if code == MISSING_BAR:
+            df = df.drop(index=BARS_PER_DAY + 10)
+        bars.append(df[['time'] + RAW_FIELDS].assign(code=code))
+        daily_df = daily_df.reset_index()
+        if code == MISSING_DAILY:
+            daily_df = daily_df.iloc[1:]
+        daily.append(daily_df.assign(code=code))
+    bars = pd.concat(bars)[['code', 'time'] + RAW_FIELDS].sort_values(['code', 'time']).reset_index(drop=True)
+    daily = pd.concat(daily)[['code', 'date', 'total_vol']]
+    return frames, bars, daily
+
+
+class Transform5MMarketTest(unittest.TestCase):
+
+    def setUp(self):
+        days = LookbackPlanner.lookback_days(Engine.FEATURES) + 1
+        self.frames, self.bars, self.daily = market(days)
+        self.dates = sorted(self.daily['date'].unique())
+        self.date = self.dates[-1]
+
+    def test_stack_stocks(self):
+        # 缺K线和缺日线的股票不在矩阵里, 留给 Transform5M 逐只处理
+        codes, times, data, dropped = stack_stocks(self.bars, self.daily, self.dates)
+        self.assertEqual(codes, ['sh600000', 'sz000001'])
+        self.assertEqual(dropped, [MISSING_BAR, MISSING_DAILY])
+        self.assertEqual(times.shape, (2, len(self.dates) * BARS_PER_DAY))
+        self.assertFalse(np.isnan(data['total_vol']).any())
+        df, daily_df = self.frames['sz000001']
+        np.testing.assert_array_equal(data['close'][1], df['close'].values)
+        np.testing.assert_array_equal(data['total_vol'][1, ::BARS_PER_DAY], daily_df['total_vol'].values)
+
+    def test_matches_per_stock(self):
+        codes, times, data, _ = stack_stocks(self.bars, self.daily, self.dates)
+        result = unstack_features(codes, times, data, self.date)
+        self.assertEqual(len(result), len(codes) * BARS_PER_DAY)
+        self.assertTrue((result['date'] == self.date).all())
+        names = [name for indicator in Registry.resolve(Engine.FEATURES) for name in indicator.OUTPUTS]
+        self.assertFalse(result['turnover'].isna().any())
+        for code in codes:
+            df, daily_df = self.frames[code]
+            expected = Engine.calculate(df.copy(), daily_df)
+            expected = expected[expected['date'] == self.date]
+            actual = result[result['code'] == code]
+            np.testing.assert_array_equal(actual['time'].values, expected.index.values)
+            for name in RAW_FIELDS + names:
+                np.testing.assert_allclose(actual[name].values, expected[name].values.astype(np.float64),
+                                           rtol=1e-9, atol=1e-12, equal_nan=True, err_msg='{} {}'.format(code, name))
+
+    def test_no_complete_stock(self):
+        codes, times, data, dropped = stack_stocks(self.bars[self.bars['code'] == MISSING_BAR], self.daily, self.dates)
+        self.assertEqual(codes, [])
+        self.assertEqual(dropped, [MISSING_BAR])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# Transform5M_T1 的输出从 start_date 开始, 提前读取的历史只用于计算指标
+# python -m unittest test_transform_t1
+
+import unittest
+import numpy as np
+import DataTransform.Transform5M_T1 as t5m
+from DataTransform import FeatureScaling, LookbackPlanner
+from DataTransform.LookbackPlanner import BARS_PER_DAY
+from benchmark_indicators import synthetic_frame
+
+PARAMS = FeatureScaling.ScalingParams(vol_min=0, vol_avg=25000, vol_max=50000, price_min=5, price_avg=20,
+                                      price_max=50, count_min=1, count_max=500)
+
+
+def extract(df, daily_df, start_date):
+    # 与 _block 相同的顺序: 提取特征, 选择列
+    context = t5m.Context('sz000001', start_date, PARAMS)
+    context.daily_df = daily_df
+    return t5m.feature_select(context.feature_extraction(df.copy()))
+
+
+class Transform5MT1Test(unittest.TestCase):
+
+    def setUp(self):
+        self.lookback_days = LookbackPlanner.lookback_days(t5m.features())
+        self.df, self.daily_df = synthetic_frame(self.lookback_days + 4)
+        self.dates = sorted(set(self.df['date']))
+
+    def test_starts_at_start_date(self):
+        # 读取的数据包含 start_date 之前 lookback_days 天, 输出只有 start_date 及之后的完整交易日
+        start_date = self.dates[self.lookback_days]
+        df = extract(self.df, self.daily_df, start_date)
+        self.assertEqual(sorted(set(df['date'])), self.dates[self.lookback_days:])
+        self.assertEqual(len(df), 4 * BARS_PER_DAY)
+        index, X = t5m.feature_reshaping(df.drop(columns='close'))
+        self.assertEqual(index, self.dates[self.lookback_days:])
+        self.assertEqual(X.shape, (4, 36, len(t5m.features())))
+
+    def test_same_values_as_untrimmed(self):
+        # 截掉历史不改变 start_date 之后的特征
+        start_date = self.dates[self.lookback_days]
+        trimmed = extract(self.df, self.daily_df, start_date)
+        untrimmed = extract(self.df, self.daily_df, self.dates[0])
+        untrimmed = untrimmed[untrimmed['date'] >= start_date]
+        np.testing.assert_array_equal(trimmed.drop(columns='date').values, untrimmed.drop(columns='date').values)
+
+    def test_blocks_do_not_overlap(self):
+        # 相邻的两块各自提前读取历史, 输出的日期不重复也不遗漏
+        first, second = self.dates[self.lookback_days], self.dates[self.lookback_days + 2]
+        block_1 = self.df[self.df['date'] < second]
+        block_2 = self.df[self.df['date'] >= self.dates[2]]
+        dates_1 = sorted(set(extract(block_1, self.daily_df, first)['date']))
+        dates_2 = sorted(set(extract(block_2, self.daily_df, second)['date']))
+        self.assertEqual(dates_1 + dates_2, self.dates[self.lookback_days:])
+
+
+if __name__ == '__main__':
+    unittest.main()